@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+熊市偵測（日數據）
+
+從 S&P 500 日收盤價找出熊市：
+- 進入熊市：從高點下跌 ≥ decline（預設 20%）
+- 熊市結束：從低點反彈 ≥ rebound（預設 20%），之後從該日重新追蹤高點
+
+單一門檻用 O(n) 高點/低點狀態機逐日掃描；批次模式把多組 (decline, rebound)
+門檻放進同一組狀態陣列，只掃一次價格序列就得到所有門檻的結果。
+
+輸入:
+    - input_SP500_daily_yahoo.csv: Yahoo Finance 日數據（1970 起）
+    - input_SP500_daily_FRED.csv: FRED 日數據（2016 起）
+
+輸出:
+    - output_股市熊市統計_日數據.xlsx: 熊市統計（高點、低點、跌幅、持續天數）
+    - output_熊市門檻敏感度.xlsx: 批次模式，各門檻組合的熊市次數與平均跌幅
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# 取得腳本所在目錄
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(SCRIPT_DIR))
+
+from common import result_cache
+from common.exporters import export_frames
+from common.loaders import load_fred_daily, load_yahoo_daily
+
+SOURCES = {
+    'yahoo': 'input_SP500_daily_yahoo.csv',
+    'fred': 'input_SP500_daily_FRED.csv',
+}
+OUTPUT_BASE = os.path.join(SCRIPT_DIR, 'output_股市熊市統計_日數據')
+
+
+def load_daily_prices(source='yahoo'):
+    """讀取日收盤價，回傳以日期為索引的 Series（已排除缺值）"""
+    path = os.path.join(SCRIPT_DIR, SOURCES[source])
+    if source == 'yahoo':
+        prices = load_yahoo_daily(path)['Close']
+    else:
+        prices = load_fred_daily(path)['SP500']
+    return prices.dropna()
+
+
+def init_bear_state(price):
+    """狀態機初始狀態：從第一根 K 棒開始追蹤高點"""
+    return {'in_bear': False, 'peak': float(price), 'peak_idx': 0,
+            'trough': 0.0, 'trough_idx': 0, 'cross_idx': 0}
+
+
+def advance_bear_state(state, prices, start=0, decline=0.20, rebound=0.20):
+    """把 prices（第一根的索引為 start）接續餵給狀態機，就地更新 state
+
+    回傳這段期間內結束的熊市（格式同 detect_bear_markets）；增量更新時只需餵入新的 K 棒
+    """
+    in_bear = state['in_bear']
+    peak, peak_idx = state['peak'], state['peak_idx']
+    trough, trough_idx, cross_idx = state['trough'], state['trough_idx'], state['cross_idx']
+    episodes = []
+
+    for i, p in enumerate(prices, start):
+        if in_bear:
+            if p < trough:
+                trough, trough_idx = p, i
+            elif p >= trough * (1 + rebound):
+                episodes.append({'peak': peak_idx, 'trough': trough_idx, 'cross': cross_idx, 'end': i})
+                in_bear = False
+                peak, peak_idx = p, i
+        else:
+            if p >= peak:
+                peak, peak_idx = p, i
+            elif p <= peak * (1 - decline):
+                in_bear = True
+                trough, trough_idx, cross_idx = p, i, i
+
+    state.update(in_bear=in_bear, peak=float(peak), peak_idx=peak_idx,
+                 trough=float(trough), trough_idx=trough_idx, cross_idx=cross_idx)
+    return episodes
+
+
+def open_episode(state):
+    """進行中的熊市（end 為 None）；不在熊市中回傳 None"""
+    if not state['in_bear']:
+        return None
+    return {'peak': state['peak_idx'], 'trough': state['trough_idx'], 'cross': state['cross_idx'], 'end': None}
+
+
+def detect_bear_markets(prices, decline=0.20, rebound=0.20):
+    """單一門檻熊市偵測，回傳每次熊市的索引位置
+
+    每筆為 dict：peak / trough / cross（首次跌破門檻）/ end（反彈確認，進行中為 None）
+    """
+    prices = np.asarray(prices, dtype=float)
+    state = init_bear_state(prices[0])
+    episodes = advance_bear_state(state, prices, 0, decline, rebound)
+    if state['in_bear']:
+        episodes.append(open_episode(state))
+    return episodes
+
+
+def detect_bear_markets_batch(prices, declines, rebounds):
+    """多組門檻同時偵測：每組 (decline, rebound) 是狀態陣列的一格，只掃描價格一次
+
+    declines / rebounds 為等長陣列（一組門檻一格）。回傳 dict of arrays，
+    每列一次熊市：pair（門檻組合索引）、peak、trough、cross、end（進行中為 -1）
+    """
+    prices = np.asarray(prices, dtype=float)
+    enter_ratio = 1 - np.asarray(declines, dtype=float)
+    exit_ratio = 1 + np.asarray(rebounds, dtype=float)
+    k = len(enter_ratio)
+
+    in_bear = np.zeros(k, dtype=bool)
+    peak = np.full(k, prices[0])
+    peak_idx = np.zeros(k, dtype=np.int64)
+    trough = np.zeros(k)
+    trough_idx = np.zeros(k, dtype=np.int64)
+    cross_idx = np.zeros(k, dtype=np.int64)
+
+    records = []
+    for i, p in enumerate(prices):
+        normal = ~in_bear
+        new_peak = normal & (p >= peak)
+        peak[new_peak] = p
+        peak_idx[new_peak] = i
+
+        new_low = in_bear & (p < trough)
+        trough[new_low] = p
+        trough_idx[new_low] = i
+
+        enter = normal & (p <= peak * enter_ratio)
+        leave = in_bear & (p >= trough * exit_ratio)
+
+        if leave.any():
+            pairs = np.flatnonzero(leave)
+            records.append((pairs, peak_idx[pairs], trough_idx[pairs], cross_idx[pairs],
+                            np.full(len(pairs), i)))
+            in_bear[pairs] = False
+            peak[pairs] = p
+            peak_idx[pairs] = i
+        if enter.any():
+            in_bear[enter] = True
+            trough[enter] = p
+            trough_idx[enter] = i
+            cross_idx[enter] = i
+
+    if in_bear.any():
+        pairs = np.flatnonzero(in_bear)
+        records.append((pairs, peak_idx[pairs], trough_idx[pairs], cross_idx[pairs],
+                        np.full(len(pairs), -1)))
+
+    columns = ['pair', 'peak', 'trough', 'cross', 'end']
+    if not records:
+        return {c: np.array([], dtype=np.int64) for c in columns}
+    stacked = [np.concatenate(parts) for parts in zip(*records)]
+    order = np.lexsort((stacked[1], stacked[0]))
+    return {c: arr[order] for c, arr in zip(columns, stacked)}
+
+
+def episodes_to_frame(prices, episodes, decline=0.20):
+    """熊市索引 → 與 output_股市熊市統計_日數據.xlsx 相同欄位的表格（依跌幅排序）"""
+    dates = prices.index
+    values = prices.to_numpy()
+    records = [{
+        'peak_date': dates[ep['peak']], 'peak_price': values[ep['peak']],
+        'trough_date': dates[ep['trough']], 'trough_price': values[ep['trough']],
+        'cross_date': dates[ep['cross']],
+    } for ep in episodes]
+    return records_to_frame(records, decline)
+
+
+def records_to_frame(records, decline=0.20):
+    """熊市紀錄（日期與價格，見 episodes_to_frame）→ 統計表格；增量模式直接用檢查點內的紀錄"""
+    rows = []
+    for rec in records:
+        peak_date, trough_date = rec['peak_date'], rec['trough_date']
+        rows.append({
+            '高點日期': peak_date.strftime('%Y-%m-%d'),
+            '低點日期': trough_date.strftime('%Y-%m-%d'),
+            '最大跌幅(%)': round((rec['trough_price'] / rec['peak_price'] - 1) * 100, 2),
+            '持續天數': (trough_date - peak_date).days,
+            f'跌到{decline * 100:g}%天數': (rec['cross_date'] - peak_date).days,
+        })
+    df = pd.DataFrame(rows)
+    if len(df):
+        df = df.sort_values('最大跌幅(%)').reset_index(drop=True)
+    return df
+
+
+def threshold_sensitivity(prices, declines, rebounds):
+    """批次模式：所有 (decline, rebound) 組合的熊市次數、平均跌幅、平均到底天數"""
+    d_grid, r_grid = np.meshgrid(declines, rebounds, indexing='ij')
+    d_flat, r_flat = d_grid.ravel(), r_grid.ravel()
+    result = detect_bear_markets_batch(prices.to_numpy(), d_flat, r_flat)
+
+    values = prices.to_numpy()
+    days = prices.index.to_numpy().astype('datetime64[D]').astype(np.int64)
+    depth = (values[result['trough']] / values[result['peak']] - 1) * 100
+    duration = days[result['trough']] - days[result['peak']]
+
+    n_pairs = len(d_flat)
+    counts = np.bincount(result['pair'], minlength=n_pairs)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        avg_depth = np.bincount(result['pair'], weights=depth, minlength=n_pairs) / counts
+        avg_duration = np.bincount(result['pair'], weights=duration, minlength=n_pairs) / counts
+
+    return pd.DataFrame({
+        '下跌門檻(%)': np.round(d_flat * 100, 2),
+        '反彈門檻(%)': np.round(r_flat * 100, 2),
+        '熊市次數': counts,
+        '平均跌幅(%)': np.round(avg_depth, 2),
+        '平均到底天數': np.round(avg_duration, 1),
+    })
+
+
+def cached_episodes(prices, source='yahoo', decline=0.20, rebound=0.20):
+    """detect_bear_markets，結果快取於 .cache/results（鍵含來源檔內容）"""
+    return result_cache.memoize('bear_episodes', lambda: detect_bear_markets(prices.to_numpy(), decline, rebound),
+                                inputs=[os.path.join(SCRIPT_DIR, SOURCES[source])],
+                                params={'decline': decline, 'rebound': rebound})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="熊市偵測（日數據）")
+    parser.add_argument('--source', choices=sorted(SOURCES), default='yahoo', help="價格來源")
+    parser.add_argument('--decline', type=float, default=0.20, help="進入熊市的跌幅門檻")
+    parser.add_argument('--rebound', type=float, default=0.20, help="熊市結束的反彈門檻")
+    parser.add_argument('--batch', action='store_true', help="門檻敏感度批次模式（10%%~40%%，每 1%%）")
+    parser.add_argument('--no-cache', action='store_true', help="不使用 .cache/results 的分析結果快取")
+    parser.add_argument('--formats', nargs='+', choices=['xlsx', 'csv', 'parquet'], default=['xlsx'],
+                        help="輸出格式")
+    args = parser.parse_args()
+    if args.no_cache:
+        result_cache.disable()
+
+    prices = load_daily_prices(args.source)
+    inputs = [os.path.join(SCRIPT_DIR, SOURCES[args.source])]
+
+    if args.batch:
+        thresholds = np.round(np.arange(10, 41) / 100, 2)
+        table = result_cache.memoize('bear_threshold_sensitivity',
+                                     lambda: threshold_sensitivity(prices, thresholds, thresholds),
+                                     inputs=inputs, params={'thresholds': thresholds})
+        counts = table.pivot(index='下跌門檻(%)', columns='反彈門檻(%)', values='熊市次數').reset_index()
+        paths = export_frames(os.path.join(SCRIPT_DIR, 'output_熊市門檻敏感度'),
+                              {'門檻組合': table, '熊市次數': counts}, args.formats)
+        print(f"共 {len(table)} 組門檻")
+        for path in paths:
+            print(f"已儲存至: {path}")
+        return
+
+    episodes = cached_episodes(prices, args.source, args.decline, args.rebound)
+    df = episodes_to_frame(prices, episodes, args.decline)
+    print(df.to_string(index=False))
+    paths = export_frames(OUTPUT_BASE, {'Sheet1': df}, args.formats)
+    for path in paths:
+        print(f"已儲存至: {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+景氣轉折點 / 熊市起點事件研究
+
+以事件為中心，把前後各 N 根 K 棒的累積報酬疊成對齊矩陣，計算平均、中位數、
+分位數與勝率曲線（common.event_study）：
+- 月數據：Shiller 實質總報酬，對齊 NBER 高峰（衰退開始）與谷底（衰退結束），前後 60 個月
+- 日數據：Yahoo 收盤價，對齊各跌幅門檻（10%~40%，每 1%）首次跌破門檻的日子，
+  31 組事件一次批次計算
+
+輸出:
+    - output_熊市事件研究.xlsx: NBER 高峰 / 谷底的月報酬曲線、各跌幅門檻事件後的日報酬
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from bear_market_detector import SCRIPT_DIR, detect_bear_markets_batch, load_daily_prices
+# bear_market_detector 已將 repo 根目錄加入 sys.path
+from common.event_study import QUANTILES, batch_event_study, event_positions
+from common.exporters import export_frames
+from common.loaders import load_nber_cycles, load_shiller
+
+SHILLER_PATH = os.path.join(SCRIPT_DIR, 'input_SP指數(Shiller數據）.csv')
+NBER_PATH = os.path.join(SCRIPT_DIR, 'input_美國景氣循環完整年表_NBER.xlsx')
+OUTPUT_BASE = os.path.join(SCRIPT_DIR, 'output_熊市事件研究')
+
+# 日數據事件後的觀察點（交易日）：1 個月、3 個月、半年、1 年、2 年
+DAILY_OFFSETS = [21, 63, 126, 252, 504]
+
+
+def curve_frame(stats, k, before):
+    """第 k 組事件的統計曲線 → DataFrame（相對月 / 日、平均、中位數、分位數、勝率、事件數）"""
+    offsets = np.arange(stats['mean'].shape[1]) - before
+    df = pd.DataFrame({
+        '相對事件': offsets,
+        '平均(%)': np.round(stats['mean'][k] * 100, 2),
+        '中位數(%)': np.round(stats['median'][k] * 100, 2),
+    })
+    for i, q in enumerate(QUANTILES):
+        df[f'P{int(q * 100)}(%)'] = np.round(stats['quantiles'][k, i] * 100, 2)
+    df['勝率(%)'] = np.round(stats['hit_rate'][k] * 100, 1)
+    df['事件數'] = stats['count'][k]
+    return df
+
+
+def monthly_study(before=60, after=60):
+    """NBER 高峰 / 谷底前後的 Shiller 實質總報酬曲線"""
+    shiller = load_shiller(SHILLER_PATH)
+    cycles = load_nber_cycles(NBER_PATH)
+    months = shiller.index.asi8
+    sets = [event_positions(months, pd.PeriodIndex(cycles[col]).asi8) for col in ('peak', 'trough')]
+    # 超出 Shiller 資料範圍的事件（1871 以前、資料最後一月以後）不列入
+    sets = [pos[pos >= 0] for pos in sets]
+    stats = batch_event_study(shiller['real_total_return'].to_numpy(), sets, before, after)
+    return curve_frame(stats, 0, before), curve_frame(stats, 1, before)
+
+
+def daily_study(declines, rebound=0.20, offsets=DAILY_OFFSETS):
+    """各跌幅門檻「首次跌破門檻日」之後的日報酬，所有門檻一次批次計算"""
+    prices = load_daily_prices('yahoo')
+    episodes = detect_bear_markets_batch(prices.to_numpy(), declines, np.full(len(declines), rebound))
+    sets = [episodes['cross'][episodes['pair'] == k] for k in range(len(declines))]
+    after = max(offsets)
+    stats = batch_event_study(prices.to_numpy(), sets, 0, after)
+
+    table = {'下跌門檻(%)': np.round(np.asarray(declines) * 100).astype(int),
+             '事件數': [len(s) for s in sets]}
+    for d in offsets:
+        table[f'+{d}日平均(%)'] = np.round(stats['mean'][:, d] * 100, 2)
+        table[f'+{d}日中位數(%)'] = np.round(stats['median'][:, d] * 100, 2)
+        table[f'+{d}日勝率(%)'] = np.round(stats['hit_rate'][:, d] * 100, 1)
+    return pd.DataFrame(table)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="景氣轉折點 / 熊市起點事件研究")
+    parser.add_argument('--window', type=int, default=60, help="月數據事件前後月數")
+    parser.add_argument('--rebound', type=float, default=0.20, help="日數據熊市結束的反彈門檻")
+    parser.add_argument('--formats', nargs='+', choices=['xlsx', 'csv', 'parquet'], default=['xlsx'],
+                        help="輸出格式")
+    args = parser.parse_args()
+
+    peaks, troughs = monthly_study(args.window, args.window)
+    declines = np.round(np.arange(10, 41) / 100, 2)
+    daily = daily_study(declines, args.rebound)
+
+    marks = peaks['相對事件'].isin([-12, 0, 12, 24, 60])
+    print("NBER 高峰（衰退開始）前後實質總報酬")
+    print(peaks[marks].to_string(index=False))
+    print()
+    print("NBER 谷底（衰退結束）前後實質總報酬")
+    print(troughs[marks].to_string(index=False))
+    print()
+    print("跌破門檻後報酬（Yahoo 價格指數）")
+    print(daily.iloc[::5].to_string(index=False))
+
+    paths = export_frames(OUTPUT_BASE, {'NBER高峰': peaks, 'NBER谷底': troughs, '跌破門檻後': daily},
+                          args.formats)
+    print()
+    for path in paths:
+        print(f"已儲存至: {path}")
+
+
+if __name__ == '__main__':
+    main()
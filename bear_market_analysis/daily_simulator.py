@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+日頻持股模擬
+
+輸入一組（或多組）每日目標股票權重，計算含現金利息、股息與交易成本的淨值曲線：
+- 股票部位：S&P 500 日收盤價報酬 + 股息。Yahoo ^GSPC 收盤價不含息，股息以 Shiller
+  D / P（12 個月股息 ÷ 價格）月資料依月份 as-of 對應到每日、向前填補，按實際天數複利加入；
+  否則現金有 GS10 利息、股票卻沒有股息，比較會系統性地偏向減碼
+- 現金部位：Shiller `Long Rate GS10` 月資料，依月份 as-of 對應到每日並向前填補，
+  按實際天數複利（(1 + y)^(天數/365) - 1）
+- 交易成本：目標權重變動時收取 |Δw| × cost_bps / 10000
+
+權重在第 t 日收盤決定、持有到 t+1 日（權重維持不變的期間視為每日再平衡到目標，
+不另計漂移造成的成本）。所有策略以 2D 矩陣一次計算：weights (天數 × 策略) →
+equity (天數 × 策略)，全部用向量化累積乘積，沒有逐日迴圈。
+
+執行本檔會以 NBER 週期跑日頻版的策略 A/B/C（衰退開始前 12 個月到谷底減碼）。
+
+輸出:
+    - output_日頻持股策略回測.xlsx: 各策略期末淨值、年化報酬、最大回撤
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# 取得腳本所在目錄
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(SCRIPT_DIR))
+
+from common.aligned_panel import asof_ffill
+from common.cycles import RECESSION, label_months
+from common.exporters import export_frames
+from common.loaders import load_nber_cycles, load_shiller
+from bear_market_detector import load_daily_prices
+
+SHILLER_PATH = os.path.join(SCRIPT_DIR, 'input_SP指數(Shiller數據）.csv')
+NBER_PATH = os.path.join(SCRIPT_DIR, 'input_美國景氣循環完整年表_NBER.xlsx')
+OUTPUT_BASE = os.path.join(SCRIPT_DIR, 'output_日頻持股策略回測')
+STRATEGIES = {'A(100%)': 1.0, 'B(50%)': 0.5, 'C(0%)': 0.0}
+
+
+def daily_cash_rate(dates, shiller=None):
+    """每日對應的 GS10 年化殖利率（%），以月份 as-of 對應，缺值向前填補"""
+    if shiller is None:
+        shiller = load_shiller(SHILLER_PATH)
+    month_ord = pd.DatetimeIndex(dates).to_period('M').asi8
+    return asof_ffill(shiller.index.asi8, shiller['gs10'].to_numpy(), month_ord)[0]
+
+
+def daily_dividend_yield(dates, shiller=None):
+    """每日對應的 S&P 500 股息殖利率（%，Shiller D / P），以月份 as-of 對應，缺值向前填補"""
+    if shiller is None:
+        shiller = load_shiller(SHILLER_PATH)
+    month_ord = pd.DatetimeIndex(dates).to_period('M').asi8
+    dp = (shiller['dividend'] / shiller['price']).to_numpy() * 100
+    return asof_ffill(shiller.index.asi8, dp, month_ord)[0]
+
+
+def daily_accrual(dates, rate):
+    """(T,) 年化 % → (T-1,) 每個區間按實際天數複利的報酬，缺值視為 0"""
+    days = np.diff(pd.DatetimeIndex(dates).to_numpy().astype('datetime64[D]').astype(np.int64))
+    rate = np.nan_to_num(np.asarray(rate, dtype=np.float64)[:-1]) / 100
+    return (1 + rate) ** (days / 365) - 1
+
+
+def simulate(prices, weights, dates=None, cash_rate=None, cost_bps=0.0, dividend_yield=None):
+    """計算淨值曲線
+
+    prices: (T,) 收盤價；weights: (T,) 或 (T, S) 目標股票權重
+    dates: 計算現金利息的日期（省略時現金報酬 = 0）；cash_rate: (T,) 年化 %，
+    省略時由 daily_cash_rate(dates) 取得
+    dividend_yield: (T,) 年化 %，加到股票部位的股息（需要 dates，見 daily_dividend_yield）；
+    省略時股票部位只有價格報酬
+    回傳 (T, S) 淨值，第 0 日為 1.0
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+    if weights.ndim == 1:
+        weights = weights[:, None]
+
+    asset = prices[1:] / prices[:-1] - 1
+    if dividend_yield is not None:
+        asset = asset + daily_accrual(dates, dividend_yield)
+
+    if dates is None:
+        cash = np.zeros(len(asset))
+    else:
+        if cash_rate is None:
+            cash_rate = daily_cash_rate(dates)
+        cash = daily_accrual(dates, cash_rate)
+
+    held = weights[:-1]
+    growth = 1 + held * asset[:, None] + (1 - held) * cash[:, None]
+
+    # 第 0 日建倉也算一次成本（從全現金到初始權重）
+    turnover = np.abs(np.diff(weights, axis=0, prepend=0))
+    cost = 1 - turnover * cost_bps / 10000
+    growth *= cost[1:]
+
+    equity = np.empty_like(weights)
+    equity[0] = cost[0]
+    np.cumprod(growth, axis=0, out=equity[1:])
+    equity[1:] *= cost[0]
+    return equity
+
+
+def summarize(equity, dates, names):
+    """各策略期末淨值、年化報酬、最大回撤"""
+    dates = pd.DatetimeIndex(dates)
+    years = (dates[-1] - dates[0]).days / 365.25
+    peak = np.maximum.accumulate(equity, axis=0)
+    max_dd = (equity / peak).min(axis=0) - 1
+    final = equity[-1]
+    return pd.DataFrame({
+        '策略': names,
+        '期末淨值': final.round(4),
+        '年化報酬(%)': ((final ** (1 / years) - 1) * 100).round(2),
+        '最大回撤(%)': (max_dd * 100).round(2),
+    })
+
+
+def cycle_weights(dates, exposures, lead_months=12, cycles=None):
+    """NBER 週期策略權重：衰退開始前 lead_months 個月到谷底之間，持股降為各策略的 exposure
+
+    cycles 為已讀入的 NBER 年表，省略時讀 NBER_PATH
+    """
+    if cycles is None:
+        cycles = load_nber_cycles(NBER_PATH)
+    labels = label_months(dates, cycles)
+    window = (labels['phase'] == RECESSION) | ((labels['to_peak'] >= 1) & (labels['to_peak'] <= lead_months))
+    exposures = np.asarray(exposures, dtype=np.float64)
+    return np.where(window[:, None], exposures[None, :], 1.0)
+
+
+def strategy_table(prices, lead_months=12, cost_bps=5.0, cash_yield=True, shiller=None, cycles=None,
+                   dividends=True):
+    """日價格 → 策略 A/B/C 的比較表；shiller / cycles 為已讀入的資料，省略時各自讀檔"""
+    weights = cycle_weights(prices.index, list(STRATEGIES.values()), lead_months, cycles)
+    if shiller is None and (cash_yield or dividends):
+        shiller = load_shiller(SHILLER_PATH)
+    cash_rate = daily_cash_rate(prices.index, shiller) if cash_yield else np.zeros(len(prices))
+    dividend_yield = daily_dividend_yield(prices.index, shiller) if dividends else None
+    equity = simulate(prices.to_numpy(), weights, prices.index, cash_rate, cost_bps, dividend_yield)
+    return summarize(equity, prices.index, list(STRATEGIES))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="日頻持股模擬（策略 A/B/C）")
+    parser.add_argument('--cost-bps', type=float, default=5.0, help="每次調整權重的成本（bps × |Δ權重|）")
+    parser.add_argument('--lead', type=int, default=12, help="衰退開始前幾個月減碼")
+    parser.add_argument('--no-cash-yield', action='store_true', help="現金報酬設為 0（與月頻回測相同假設）")
+    parser.add_argument('--no-dividends', action='store_true', help="股票部位只算價格報酬（不加 Shiller 股息）")
+    parser.add_argument('--formats', nargs='+', choices=['xlsx', 'csv', 'parquet'], default=['xlsx'],
+                        help="輸出格式")
+    args = parser.parse_args()
+
+    prices = load_daily_prices('yahoo')
+    table = strategy_table(prices, args.lead, args.cost_bps, not args.no_cash_yield,
+                           dividends=not args.no_dividends)
+    print(f"期間：{prices.index[0]:%Y-%m-%d} ~ {prices.index[-1]:%Y-%m-%d}　成本 {args.cost_bps:g} bps"
+          f"　現金{'報酬 = 0' if args.no_cash_yield else '按 GS10 計息'}"
+          f"　股票{'只算價格' if args.no_dividends else '含 Shiller 股息'}")
+    print(table.to_string(index=False))
+
+    paths = export_frames(OUTPUT_BASE, {'策略比較': table}, args.formats)
+    for path in paths:
+        print(f"已儲存至: {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+跌幅階梯加碼 / 減碼策略
+
+報告建議的買法（非衰退型「跌 20% 起買，每跌 5% 加碼」、衰退型「跌 30% 起買，每跌 10% 加碼」）
+寫成一組參數化的規則，在日收盤價上回測：
+- start   從參考高點下跌 ≥ start 時觸發第一階
+- step    之後每再跌 step 觸發下一階
+- tranche 每階調整的持股比例（負值為減碼階梯）
+- base    沒有觸發任何一階時的持股比例
+- exit    0 = 回到前高才退出（恢復 base）；> 0 = 從階梯期間低點反彈 exit 後退出，
+          並以退出日為新的參考高點（同 bear_market_detector 的 decline=start、rebound=exit）
+
+目標持股 = clip(base + tranche × 已觸發階數, 0, 1)；已觸發的階在退出前不會取消，
+所以階數只取決於「參考高點以來的最大跌幅」。這個最大跌幅與 start / step / tranche / base 無關
+（exit=0 只有一條、exit>0 每組 (start, exit) 一條），先算好之後所有參數組合都是同一組陣列上的
+廣播運算。淨值算法與 daily_simulator.simulate 相同（股票加計 Shiller 股息、現金按 GS10 計息、
+|Δ權重| × 成本）。
+
+參數搜尋（網格或隨機）預設把所有組合算完，輸出完整的柏拉圖前緣。--prune 改為把歷史切成數段
+依序計算，每段結束時以「目前為止的累積報酬與最大回撤」剔除被其他組合明顯支配（兩項都差超過
+容許值）的組合，只有留下來的組合繼續算下一段。這是啟發式的：前段落後的組合後段仍可能追上，
+回撤也還可能變大，沒有辦法只憑前段證明某組合最後一定被支配，所以剔除會漏掉完整前緣的組合，
+存活組合的前緣也可能混入完整計算下被支配的組合，輸出的工作表標為「柏拉圖前緣(近似)」。
+容許值越大越保守、加速也越少；--check-front 以剔除搜尋後另外完整計算一次，列出實際遺漏幾組。
+
+輸出:
+    - output_跌幅階梯策略.xlsx: 報告建議的階梯、柏拉圖前緣（剔除時為近似）、各段剔除統計，
+      --check-front 時另有前緣比對
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from bear_market_detector import SCRIPT_DIR, SOURCES, detect_bear_markets_batch, load_daily_prices
+# bear_market_detector 已將 repo 根目錄加入 sys.path
+from common import result_cache
+from common.exporters import export_frames
+from common.loaders import load_shiller
+from daily_simulator import SHILLER_PATH, daily_accrual, daily_cash_rate, daily_dividend_yield
+
+OUTPUT_BASE = os.path.join(SCRIPT_DIR, 'output_跌幅階梯策略')
+FRONT_SHEET = '柏拉圖前緣'
+APPROX_FRONT_SHEET = '柏拉圖前緣(近似)'  # 剔除後存活組合的前緣
+PARAMS = ('start', 'step', 'tranche', 'base', 'exit')
+
+# 報告中的建議階梯（未投入的部分先放現金），外加兩個對照組
+REPORT_LADDERS = {
+    '非衰退型：跌20%起買，每跌5%加碼': {'start': 0.20, 'step': 0.05, 'tranche': 0.10, 'base': 0.5, 'exit': 0.0},
+    '衰退型：跌30%起買，每跌10%加碼': {'start': 0.30, 'step': 0.10, 'tranche': 0.10, 'base': 0.5, 'exit': 0.0},
+    '對照：買入持有': {'start': 1.0, 'step': 1.0, 'tranche': 0.0, 'base': 1.0, 'exit': 0.0},
+    '對照：固定50%': {'start': 1.0, 'step': 1.0, 'tranche': 0.0, 'base': 0.5, 'exit': 0.0},
+}
+
+# 網格預設值（約 12 萬組）
+GRID = {
+    'start': np.round(np.arange(5, 41) / 100, 2),
+    'step': np.round(np.arange(2, 16) / 100, 2),
+    'tranche': np.round(np.arange(1, 11) * 0.05, 2),
+    'base': np.array([0.0, 0.25, 0.5, 0.75]),
+    'exit': np.array([0.0, 0.10, 0.15, 0.20, 0.25, 0.30]),
+}
+
+
+def segment_cummax(values, segment):
+    """依 segment（非遞減的整數編號）分段的累積最大值；以排名做整數運算，結果與原值完全相同"""
+    n = len(values)
+    order = np.argsort(values, kind='stable')
+    rank = np.empty(n, dtype=np.int64)
+    rank[order] = np.arange(n)
+    offset = segment.astype(np.int64) * n
+    return values[order[np.maximum.accumulate(offset + rank) - offset]]
+
+
+def peak_depth(prices):
+    """exit=0 的階梯深度：前高以來的最大跌幅（創新高時歸零）"""
+    running_peak = np.maximum.accumulate(prices)
+    drawdown = 1 - prices / running_peak
+    return segment_cummax(drawdown, np.cumsum(prices >= running_peak))
+
+
+def rebound_depths(prices, starts, exits):
+    """exit>0 的階梯深度，每組 (start, exit) 一列：跌破 start 到反彈 exit 之間，參考高點以來的最大跌幅"""
+    result = detect_bear_markets_batch(prices, starts, exits)
+    depths = np.zeros((len(starts), len(prices)))
+    for k, peak, cross, end in zip(result['pair'], result['peak'], result['cross'], result['end']):
+        stop = len(prices) if end < 0 else end
+        depths[k, cross:stop] = 1 - np.minimum.accumulate(prices[cross:stop]) / prices[peak]
+    return depths
+
+
+def prepare_market(prices, dates=None, cash_rate=None, dividend_yield=None):
+    """價格、股票與現金報酬（同 daily_simulator.simulate：dates 省略時現金報酬 = 0，
+    dividend_yield 省略時股票只有價格報酬）"""
+    prices = np.asarray(prices, dtype=np.float64)
+    asset = prices[1:] / prices[:-1] - 1
+    if dividend_yield is not None:
+        asset = asset + daily_accrual(dates, dividend_yield)
+    if dates is None:
+        cash = np.zeros(len(prices) - 1)
+    else:
+        if cash_rate is None:
+            cash_rate = daily_cash_rate(dates)
+        cash = daily_accrual(dates, cash_rate)
+    return {'prices': prices, 'asset': asset, 'cash': cash}
+
+
+def depth_table(market, configs):
+    """各組合使用的深度序列：回傳 (深度表 (列 × 天數), 每個組合對應的列)"""
+    exits = configs['exit']
+    rebound = exits > 0
+    pairs, inverse = np.unique(np.stack([configs['start'][rebound], exits[rebound]]), axis=1, return_inverse=True)
+    table = np.vstack([peak_depth(market['prices'])[None, :],
+                       rebound_depths(market['prices'], pairs[0], pairs[1])])
+    rows = np.zeros(len(exits), dtype=np.int64)
+    rows[rebound] = inverse.ravel() + 1
+    return table, rows
+
+
+def ladder_rungs(depth, start, step):
+    """深度 → 已觸發階數（int8）；浮點誤差 1e-9 以內視為剛好觸及門檻"""
+    over = depth - start
+    return np.where(over >= -1e-12, np.floor(over / step + 1e-9) + 1, 0).astype(np.int8)
+
+
+def _new_state(n):
+    return {
+        'log_wealth': np.zeros(n),
+        'log_peak': np.zeros(n),
+        'max_dd': np.zeros(n),
+        'weight_sum': np.zeros(n),
+        'last_weight': np.zeros(n),
+    }
+
+
+def _advance(days, rungs, configs, idx, state, cost_bps):
+    """組合 idx 推進一段（組合 × 天數）：權重在第 t 天收盤決定、持有到 t+1 天
+
+    days：本段每天的 (股票報酬, 現金報酬)，第 0 天兩者為 0；rungs：本段各組合的階數。
+    大陣列都用 out= 就地運算，避免每段配置多份 (組合 × 天數) 的暫存
+    """
+    asset, cash = days
+    prev = state['last_weight'][idx]
+    weights = rungs * configs['tranche'][idx][:, None]
+    weights += configs['base'][idx][:, None]
+    np.clip(weights, 0.0, 1.0, out=weights)
+
+    # 成本：log(1 - |Δw| × bps)，本段第一天與上一段最後的權重比較
+    log_cost = np.empty_like(weights)
+    log_cost[:, 0] = weights[:, 0] - prev
+    np.subtract(weights[:, 1:], weights[:, :-1], out=log_cost[:, 1:])
+    np.abs(log_cost, out=log_cost)
+    log_cost *= -cost_bps / 10000
+    np.log1p(log_cost, out=log_cost)
+
+    # 報酬：log(1 + w × (股票 - 現金) + 現金)，w 為前一天的權重
+    path = np.empty_like(weights)
+    path[:, 0] = prev
+    path[:, 1:] = weights[:, :-1]
+    path *= asset - cash
+    path += cash
+    np.log1p(path, out=path)
+    path += log_cost
+    np.cumsum(path, axis=1, out=path)
+    path += state['log_wealth'][idx][:, None]
+
+    state['log_wealth'][idx] = path[:, -1]
+    peak = np.maximum.accumulate(path, axis=1, out=log_cost)
+    np.maximum(peak, state['log_peak'][idx][:, None], out=peak)
+    state['log_peak'][idx] = peak[:, -1]
+    path -= peak
+    state['max_dd'][idx] = np.minimum(state['max_dd'][idx], np.expm1(path.min(axis=1)))
+    state['weight_sum'][idx] += weights.sum(axis=1)
+    state['last_weight'][idx] = weights[:, -1]
+
+
+def dominated(log_wealth, max_dd, wealth_margin=0.0, dd_margin=0.0):
+    """是否有其他組合的累積報酬（對數淨值）至少高 wealth_margin、最大回撤至少少 dd_margin，且其中一項嚴格勝出
+
+    依報酬由高到低排序後取回撤的前綴最大值，每個組合只需和「報酬夠高的前綴」中最好的回撤比較；
+    兩個容許值皆為 0 時就是一般的柏拉圖支配
+    """
+    order = np.argsort(-log_wealth, kind='stable')
+    neg_sorted = -log_wealth[order]
+    best_dd = np.maximum.accumulate(max_dd[order])
+    target = -(log_wealth + wealth_margin)
+
+    def prefix_best(count):
+        return np.where(count > 0, best_dd[np.maximum(count - 1, 0)], -np.inf)
+
+    n_higher = np.searchsorted(neg_sorted, target, side='left')    # 報酬 > 自身 + margin
+    n_not_lower = np.searchsorted(neg_sorted, target, side='right')  # 報酬 ≥ 自身 + margin
+    return ((prefix_best(n_higher) >= max_dd + dd_margin)
+            | (prefix_best(n_not_lower) > max_dd + dd_margin))
+
+
+def search(market, configs, stages=8, wealth_margin=0.10, dd_margin=0.05, prune=False,
+           chunk=256, cost_bps=5.0):
+    """分段計算所有組合；prune 時每段結束剔除被支配的組合
+
+    回傳 (結果 dict, 各段統計)；結果為存活組合的索引與指標
+    """
+    n = len(configs['start'])
+    n_days = len(market['prices'])
+    table, rows = depth_table(market, configs)
+    # 階數只取決於 (深度列, start, step)，每段每組只算一次
+    groups, group = np.unique(np.stack([rows, configs['start'], configs['step']], axis=1),
+                              axis=0, return_inverse=True)
+    group = group.ravel()
+    group_rows = groups[:, 0].astype(np.int64)
+    # 第 t 天的報酬（第 0 天為 0），與權重對齊
+    asset = np.concatenate([[0.0], market['asset']])
+    cash = np.concatenate([[0.0], market['cash']])
+
+    state = _new_state(n)
+    alive = np.arange(n)
+    bounds = np.linspace(0, n_days, stages + 1).astype(int)
+    log = []
+
+    for s, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:])):
+        t0 = time.perf_counter()
+        used = np.unique(group[alive])
+        rungs = np.zeros((len(groups), hi - lo), dtype=np.int8)
+        rungs[used] = ladder_rungs(table[group_rows[used], lo:hi], groups[used, 1:2], groups[used, 2:3])
+        days = (asset[lo:hi], cash[lo:hi])
+        for i in range(0, len(alive), chunk):
+            idx = alive[i:i + chunk]
+            _advance(days, rungs[group[idx]], configs, idx, state, cost_bps)
+        before = len(alive)
+        if prune and s < stages - 1:
+            alive = alive[~dominated(state['log_wealth'][alive], state['max_dd'][alive],
+                                     wealth_margin, dd_margin)]
+        log.append({'段': s + 1, '天數': int(hi - lo), '計算組合數': before, '剔除': before - len(alive),
+                    '耗時(ms)': round((time.perf_counter() - t0) * 1000, 1)})
+
+    return {
+        'index': alive,
+        'final': np.exp(state['log_wealth'][alive]),
+        'max_dd': state['max_dd'][alive],
+        'avg_weight': state['weight_sum'][alive] / n_days,
+    }, pd.DataFrame(log)
+
+
+def evaluate(market, configs, cost_bps=5.0):
+    """不剔除、一次算完全部組合（報告建議的階梯等少量組合用）"""
+    result, _ = search(market, configs, stages=1, prune=False, cost_bps=cost_bps)
+    return result
+
+
+def grid_configs(grid=GRID):
+    mesh = np.meshgrid(*(np.asarray(grid[p], dtype=np.float64) for p in PARAMS), indexing='ij')
+    return {p: m.ravel() for p, m in zip(PARAMS, mesh)}
+
+
+def random_configs(n, seed=0, grid=GRID):
+    """在網格各參數的範圍內均勻抽樣（取到 0.01）"""
+    rng = np.random.default_rng(seed)
+    configs = {}
+    for p in PARAMS:
+        lo, hi = float(np.min(grid[p])), float(np.max(grid[p]))
+        configs[p] = np.round(rng.uniform(lo, hi, n), 2)
+    return configs
+
+
+def result_frame(configs, result, years):
+    idx = result['index']
+    df = pd.DataFrame({
+        '起買跌幅(%)': np.round(configs['start'][idx] * 100, 1),
+        '每階跌幅(%)': np.round(configs['step'][idx] * 100, 1),
+        '每階持股(%)': np.round(configs['tranche'][idx] * 100, 1),
+        '基本持股(%)': np.round(configs['base'][idx] * 100, 1),
+        '退出': np.where(configs['exit'][idx] > 0,
+                       [f'反彈{e * 100:g}%' for e in configs['exit'][idx]], '回到前高'),
+        '期末淨值': result['final'].round(4),
+        '年化報酬(%)': np.round((result['final'] ** (1 / years) - 1) * 100, 2),
+        '最大回撤(%)': np.round(result['max_dd'] * 100, 2),
+        '平均持股(%)': np.round(result['avg_weight'] * 100, 1),
+    })
+    return df
+
+
+def pareto_front(result):
+    """最終結果中不被任何組合支配的組合（報酬與回撤都不比別人差）"""
+    keep = ~dominated(np.log(result['final']), result['max_dd'])
+    return {k: v[keep] for k, v in result.items()}
+
+
+def report_frame(market, years, cost_bps=5.0):
+    """報告建議的幾組階梯（REPORT_LADDERS）的結果表"""
+    report = {p: np.array([cfg[p] for cfg in REPORT_LADDERS.values()]) for p in PARAMS}
+    table = result_frame(report, evaluate(market, report, cost_bps), years)
+    table.insert(0, '策略', list(REPORT_LADDERS))
+    return table
+
+
+def front_check(pruned, exact):
+    """剔除後的近似前緣與完整前緣（prune=False 的結果）比對，回傳一列的表"""
+    approx = set(pareto_front(pruned)['index'].tolist())
+    full = set(pareto_front(exact)['index'].tolist())
+    return pd.DataFrame([{
+        '完整前緣組數': len(full),
+        '近似前緣組數': len(approx),
+        '保留': len(approx & full),
+        '遺漏': len(full - approx),
+        '完整計算下被支配': len(approx - full),
+    }])
+
+
+def cached_search(market, configs, years, source='yahoo', stages=8, wealth_margin=0.10, dd_margin=0.05,
+                  prune=False, cost_bps=5.0, cash_yield=True, dividends=True):
+    """search 結果快取於 .cache/results，回傳 (result, 搜尋紀錄, 柏拉圖前緣表, 是否讀自快取)"""
+    inputs = [os.path.join(SCRIPT_DIR, SOURCES[source])] + ([SHILLER_PATH] if cash_yield or dividends else [])
+    # 熊市偵測與現金利率的程式在其他腳本，一併放進快取鍵
+    inputs += [os.path.join(SCRIPT_DIR, name) for name in ('bear_market_detector.py', 'daily_simulator.py')]
+    computed = []
+
+    def compute():
+        computed.append(True)
+        return search(market, configs, stages, wealth_margin, dd_margin, prune, cost_bps=cost_bps)
+
+    result, stage_log = result_cache.memoize(
+        'ladder_search', compute,
+        inputs=inputs,
+        params={'configs': configs, 'stages': stages, 'wealth_margin': wealth_margin,
+                'dd_margin': dd_margin, 'prune': prune, 'cost_bps': cost_bps, 'cash_yield': cash_yield,
+                'dividends': dividends})
+    front = result_frame(configs, pareto_front(result), years).sort_values(
+        '年化報酬(%)', ascending=False).reset_index(drop=True)
+    return result, stage_log, front, not computed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="跌幅階梯加碼 / 減碼策略回測與參數搜尋")
+    parser.add_argument('--source', choices=['yahoo', 'fred'], default='yahoo', help="價格來源")
+    parser.add_argument('--random', type=int, default=0, help="隨機搜尋組合數（0 = 使用預設網格）")
+    parser.add_argument('--seed', type=int, default=0, help="隨機搜尋的亂數種子")
+    parser.add_argument('--stages', type=int, default=8, help="歷史切成幾段依序計算與剔除")
+    parser.add_argument('--wealth-margin', type=float, default=0.10,
+                        help="--prune 的剔除容許值：累積報酬（對數淨值）落後超過此值")
+    parser.add_argument('--dd-margin', type=float, default=0.05, help="--prune 的剔除容許值：最大回撤差超過此值")
+    parser.add_argument('--prune', action='store_true',
+                        help="分段剔除明顯被支配的組合（啟發式，較快但前緣只是近似）")
+    parser.add_argument('--check-front', action='store_true',
+                        help="以剔除搜尋（同 --prune）後另外完整計算一次，列出近似前緣遺漏的完整前緣組數")
+    parser.add_argument('--cost-bps', type=float, default=5.0, help="每次調整權重的成本（bps × |Δ權重|）")
+    parser.add_argument('--no-cash-yield', action='store_true', help="現金報酬設為 0")
+    parser.add_argument('--no-dividends', action='store_true', help="股票部位只算價格報酬（不加 Shiller 股息）")
+    parser.add_argument('--top', type=int, default=20, help="列印前緣中年化報酬最高的幾組")
+    parser.add_argument('--no-cache', action='store_true', help="不使用 .cache/results 的搜尋結果快取")
+    parser.add_argument('--formats', nargs='+', choices=['xlsx', 'csv', 'parquet'], default=['xlsx'],
+                        help="輸出格式")
+    args = parser.parse_args()
+    if args.no_cache:
+        result_cache.disable()
+
+    prices = load_daily_prices(args.source)
+    dates = prices.index
+    shiller = load_shiller(SHILLER_PATH)
+    cash_rate = np.zeros(len(prices)) if args.no_cash_yield else daily_cash_rate(dates, shiller)
+    dividend_yield = None if args.no_dividends else daily_dividend_yield(dates, shiller)
+    market = prepare_market(prices.to_numpy(), dates, cash_rate, dividend_yield)
+    years = (prices.index[-1] - prices.index[0]).days / 365.25
+
+    report_table = report_frame(market, years, args.cost_bps)
+
+    configs = random_configs(args.random, args.seed) if args.random else grid_configs()
+    t0 = time.perf_counter()
+    result, stage_log, front, cached = cached_search(
+        market, configs, years, args.source, args.stages, args.wealth_margin, args.dd_margin,
+        args.prune or args.check_front, args.cost_bps, not args.no_cash_yield, not args.no_dividends)
+    elapsed = time.perf_counter() - t0
+
+    print(f"期間：{prices.index[0]:%Y-%m-%d} ~ {prices.index[-1]:%Y-%m-%d}　成本 {args.cost_bps:g} bps")
+    print()
+    print(report_table.to_string(index=False))
+    print()
+    prune = args.prune or args.check_front
+    # 快取命中時 elapsed 只是讀檔時間，改列當初計算的耗時（各段耗時加總）
+    timing = f"讀自快取（原計算 {stage_log['耗時(ms)'].sum() / 1000:.2f} 秒）" if cached else f"{elapsed:.2f} 秒"
+    print(f"搜尋 {len(configs['start']):,} 組，存活 {len(result['index']):,} 組，"
+          f"{'近似' if prune else ''}柏拉圖前緣 {len(front)} 組，{timing}")
+    print(stage_log.to_string(index=False))
+    print()
+    frames = {'報告建議': report_table, APPROX_FRONT_SHEET if prune else FRONT_SHEET: front, '搜尋紀錄': stage_log}
+    if prune and args.check_front:
+        exact, _, _, _ = cached_search(market, configs, years, args.source, args.stages, prune=False,
+                                    cost_bps=args.cost_bps, cash_yield=not args.no_cash_yield,
+                                    dividends=not args.no_dividends)
+        check = front_check(result, exact)
+        row = check.iloc[0]
+        print(f"前緣比對：完整前緣 {row['完整前緣組數']} 組，近似前緣保留 {row['保留']} 組、遺漏 {row['遺漏']} 組，"
+              f"另有 {row['完整計算下被支配']} 組在完整計算下被支配")
+        print()
+        frames['前緣比對'] = check
+    elif prune:
+        print("剔除是啟發式的，以下為近似前緣（可能遺漏完整前緣的組合）；"
+              "--check-front 比對遺漏組數，不加 --prune 取得完整前緣")
+        print()
+    print(front.head(args.top).to_string(index=False))
+
+    paths = export_frames(OUTPUT_BASE, frames, args.formats)
+    print()
+    for path in paths:
+        print(f"已儲存至: {path}")
+
+
+if __name__ == '__main__':
+    main()
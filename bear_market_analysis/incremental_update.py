@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+熊市偵測增量更新（日數據）
+
+日數據檔每天只在尾端追加幾列。這裡把分析狀態存成檢查點，下次更新只讀取、只處理
+新增的列，成本與新增列數成正比，不必重跑 1970 年以來的全部歷史：
+- 檔案位置：已處理到的位元組位置與最後一列內容（只比對這一列，確認檔案是在尾端追加）
+- 熊市狀態機：目前高點、是否在熊市中、低點、跌破門檻日（bear_market_detector 的狀態）
+- 已結束的熊市紀錄，以及進行中熊市的高點 / 低點日期與價格
+- 滾動視窗：最近 window + 1 根收盤價（近一年報酬與波動）
+
+原始檔被截短、最後處理的那一列內容不同（整檔重新下載改寫過），或指定 --rebuild 時，
+從頭重建檢查點；更早的歷史列被修正時請用 --rebuild。
+
+輸入:
+    - input_SP500_daily_yahoo.csv / input_SP500_daily_FRED.csv
+
+輸出:
+    - output_股市熊市統計_日數據.xlsx: 與 bear_market_detector.py 相同的熊市統計
+    - output_熊市監控狀態.xlsx: 最新收盤、距高點跌幅、是否在熊市中、近一年報酬與波動
+"""
+
+import argparse
+import io
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from bear_market_detector import (
+    SCRIPT_DIR, SOURCES, advance_bear_state, init_bear_state, records_to_frame,
+)
+# bear_market_detector 已將 repo 根目錄加入 sys.path
+from common.exporters import export_frames
+from common.input_cache import REPO_ROOT
+
+STATE_DIR = os.path.join(REPO_ROOT, '.cache', 'state')
+CHECKPOINT_VERSION = 1
+ROLLING_WINDOW = 252
+
+# 各來源的表頭列數與欄位（價格欄位與 load_daily_prices 相同）
+FORMATS = {
+    'yahoo': {'header_lines': 3, 'names': ['Date', 'Close', 'High', 'Low', 'Open', 'Volume'], 'price': 'Close'},
+    'fred': {'header_lines': 1, 'names': ['observation_date', 'SP500'], 'price': 'SP500'},
+}
+
+
+def checkpoint_path(source, decline, rebound, window):
+    return os.path.join(STATE_DIR, f"bear_{source}_d{decline:g}_r{rebound:g}_w{window}.json")
+
+
+def empty_checkpoint(source, decline, rebound, window):
+    return {
+        'version': CHECKPOINT_VERSION,
+        'source': source, 'decline': decline, 'rebound': rebound, 'window': window,
+        'offset': 0, 'last_line': '',
+        'n_bars': 0,
+        'detector': None,
+        'marks': {},
+        'episodes': [],
+        'recent_dates': [],
+        'recent_closes': [],
+    }
+
+
+def read_tail(path, fmt, offset=0, last_line=''):
+    """讀取 offset 之後的完整列，回傳 (日期, 收盤價, 新 offset, 最後一列)
+
+    offset 為 0 時從表頭之後開始；last_line 與檔案中 offset 前一列不符（檔案被改寫）
+    時回傳 None，由呼叫端重建。
+    """
+    with open(path, 'rb') as f:
+        if offset == 0:
+            for _ in range(fmt['header_lines']):
+                f.readline()
+            offset = f.tell()
+        else:
+            expected = last_line.encode('utf-8')
+            if os.fstat(f.fileno()).st_size < offset or offset < len(expected):
+                return None
+            f.seek(offset - len(expected))
+            if f.read(len(expected)) != expected:
+                return None
+        data = f.read()
+
+    end = data.rfind(b'\n') + 1  # 尾端未寫完的列留待下次
+    chunk = data[:end]
+    if not chunk.strip():
+        return np.array([], dtype='datetime64[ns]'), np.array([]), offset, last_line
+
+    df = pd.read_csv(io.BytesIO(chunk), header=None, names=fmt['names'], index_col=0, parse_dates=True)
+    prices = pd.to_numeric(df[fmt['price']], errors='coerce').dropna()
+    lines = chunk.rstrip(b'\n').rsplit(b'\n', 1)
+    new_last = lines[-1].decode('utf-8') + '\n'
+    return prices.index.to_numpy(dtype='datetime64[ns]'), prices.to_numpy(dtype=np.float64), offset + end, new_last
+
+
+def apply_tail(ckpt, dates, prices):
+    """把新的 K 棒接續餵給檢查點內的狀態（就地更新），只處理新增的部分"""
+    if not len(prices):
+        return
+    start = ckpt['n_bars']
+    if ckpt['detector'] is None:
+        ckpt['detector'] = init_bear_state(prices[0])
+    state = ckpt['detector']
+    closed = advance_bear_state(state, prices, start, ckpt['decline'], ckpt['rebound'])
+
+    def resolve(idx):
+        # 新資料內的索引直接取值，舊索引一定是上次檢查點記下的高點 / 低點 / 跌破日
+        if idx >= start:
+            return [str(np.datetime_as_string(dates[idx - start], unit='D')), float(prices[idx - start])]
+        return ckpt['marks'][str(idx)]
+
+    for ep in closed:
+        ckpt['episodes'].append(_record(ep, resolve))
+    ckpt['marks'] = {str(i): resolve(i) for i in (state['peak_idx'], state['trough_idx'], state['cross_idx'])}
+    ckpt['n_bars'] = start + len(prices)
+
+    keep = ckpt['window'] + 1
+    new_dates = [str(d) for d in np.datetime_as_string(dates[-keep:], unit='D')]
+    ckpt['recent_dates'] = (ckpt['recent_dates'] + new_dates)[-keep:]
+    ckpt['recent_closes'] = (ckpt['recent_closes'] + prices[-keep:].tolist())[-keep:]
+
+
+def _record(ep, resolve):
+    (peak_date, peak_price), (trough_date, trough_price) = resolve(ep['peak']), resolve(ep['trough'])
+    return {'peak_date': peak_date, 'peak_price': peak_price,
+            'trough_date': trough_date, 'trough_price': trough_price,
+            'cross_date': resolve(ep['cross'])[0]}
+
+
+def bear_records(ckpt):
+    """已結束 + 進行中的熊市紀錄（日期轉為 Timestamp，供 records_to_frame 使用）"""
+    records = list(ckpt['episodes'])
+    state = ckpt['detector']
+    if state is not None and state['in_bear']:
+        records.append(_record({'peak': state['peak_idx'], 'trough': state['trough_idx'],
+                                'cross': state['cross_idx']}, lambda i: ckpt['marks'][str(i)]))
+    return [{k: pd.Timestamp(v) if k.endswith('_date') else v for k, v in rec.items()} for rec in records]
+
+
+def status_frame(ckpt):
+    """最新狀態：收盤、距高點、熊市與否、近 window 日報酬與年化波動"""
+    state = ckpt['detector']
+    closes = np.asarray(ckpt['recent_closes'])
+    window = ckpt['window']
+    peak_date, peak_price = ckpt['marks'][str(state['peak_idx'])]
+    last = closes[-1]
+    if len(closes) > window:
+        ret = (last / closes[0] - 1) * 100
+        vol = np.std(np.diff(np.log(closes)), ddof=1) * np.sqrt(252) * 100
+    else:
+        ret = vol = np.nan
+    return pd.DataFrame([{
+        '最新日期': ckpt['recent_dates'][-1],
+        '收盤價': round(float(last), 2),
+        '狀態': '熊市' if state['in_bear'] else '非熊市',
+        '高點日期': peak_date,
+        '距高點(%)': round((last / peak_price - 1) * 100, 2),
+        f'近{window}日報酬(%)': round(float(ret), 2),
+        f'近{window}日年化波動(%)': round(float(vol), 2),
+        'K棒數': ckpt['n_bars'],
+    }])
+
+
+def refresh(source='yahoo', decline=0.20, rebound=0.20, window=ROLLING_WINDOW, rebuild=False):
+    """讀檢查點 → 只處理新增的列 → 存回檢查點；回傳 (檢查點, 新增 K 棒數, 是否重建)"""
+    path = os.path.join(SCRIPT_DIR, SOURCES[source])
+    fmt = FORMATS[source]
+    ckpt_path = checkpoint_path(source, decline, rebound, window)
+
+    ckpt = None if rebuild else _read_checkpoint(ckpt_path)
+    rebuilt = ckpt is None
+    if ckpt is None:
+        ckpt = empty_checkpoint(source, decline, rebound, window)
+
+    tail = read_tail(path, fmt, ckpt['offset'], ckpt['last_line'])
+    if tail is None:
+        rebuilt = True
+        ckpt = empty_checkpoint(source, decline, rebound, window)
+        tail = read_tail(path, fmt)
+    dates, prices, ckpt['offset'], ckpt['last_line'] = tail
+
+    apply_tail(ckpt, dates, prices)
+    _write_checkpoint(ckpt_path, ckpt)
+    return ckpt, len(prices), rebuilt
+
+
+def _read_checkpoint(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            ckpt = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return ckpt if ckpt.get('version') == CHECKPOINT_VERSION else None
+
+
+def _write_checkpoint(path, ckpt):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(ckpt, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="熊市偵測增量更新（日數據）")
+    parser.add_argument('--source', choices=sorted(SOURCES), default='yahoo', help="價格來源")
+    parser.add_argument('--decline', type=float, default=0.20, help="進入熊市的跌幅門檻")
+    parser.add_argument('--rebound', type=float, default=0.20, help="熊市結束的反彈門檻")
+    parser.add_argument('--window', type=int, default=ROLLING_WINDOW, help="滾動報酬 / 波動的 K 棒數")
+    parser.add_argument('--rebuild', action='store_true', help="忽略檢查點，從頭重建")
+    parser.add_argument('--formats', nargs='+', choices=['xlsx', 'csv', 'parquet'], default=['xlsx'],
+                        help="輸出格式")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    ckpt, n_new, rebuilt = refresh(args.source, args.decline, args.rebound, args.window, args.rebuild)
+    elapsed = time.perf_counter() - t0
+    print(f"{'重建' if rebuilt else '增量更新'}：處理 {n_new} 根 K 棒（共 {ckpt['n_bars']} 根），{elapsed * 1000:.1f} ms")
+    if ckpt['detector'] is None:
+        print("沒有資料")
+        return
+
+    table = records_to_frame(bear_records(ckpt), args.decline)
+    status = status_frame(ckpt)
+    print(status.to_string(index=False))
+
+    paths = export_frames(os.path.join(SCRIPT_DIR, 'output_股市熊市統計_日數據'), {'Sheet1': table}, args.formats)
+    paths += export_frames(os.path.join(SCRIPT_DIR, 'output_熊市監控狀態'), {'狀態': status}, args.formats)
+    for path in paths:
+        print(f"已儲存至: {path}")
+
+
+if __name__ == '__main__':
+    main()
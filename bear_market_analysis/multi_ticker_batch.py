@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+多檔日數據批次分析
+
+對一個資料夾內的所有 Yahoo 格式日數據（類股、各國指數、個股，格式同
+input_SP500_daily_yahoo.csv）逐檔跑熊市偵測與 NBER 週期持股策略 A/B/C，再彙總橫斷面統計：
+- 熊市：每檔的熊市次數、衰退型 / 非衰退型（高點到低點期間是否與 NBER 衰退重疊）
+  的次數、平均跌幅與平均到底天數
+- 策略：衰退開始前 lead 個月到谷底減碼（同 daily_simulator.py），各策略年化報酬與最大回撤；
+  股票部位只算價格報酬（daily_simulator 預設加計的 Shiller 股息是 S&P 500 的，不適用其他代號）
+- 橫斷面：各指標在所有代號間的平均、中位數與四分位數；所有熊市依類型合併的統計
+
+所有序列先對齊成一個 (日期 × 代號) float64 面板放進共用記憶體（common.shared_panel），
+process pool 的 worker 啟動時 attach 一次，之後每個任務只傳欄位索引，不 pickle 價格陣列。
+每檔只用自己有資料的日期，結果與單獨對該檔執行 bear_market_detector、
+daily_simulator --no-dividends 相同。
+
+用法:
+    python multi_ticker_batch.py data/tickers/ --workers 8
+    python multi_ticker_batch.py data/tickers/ --pattern "XL*.csv" --decline 0.25
+
+輸出:
+    - output_多檔熊市批次分析.xlsx: 各代號、橫斷面統計、熊市類型合併統計、熊市明細
+"""
+
+import argparse
+import glob
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from bear_market_detector import SCRIPT_DIR, detect_bear_markets
+# bear_market_detector 已將 repo 根目錄加入 sys.path
+from common import profiling
+from common.cycles import RECESSION, label_months
+from common.exporters import export_frames
+from common.loaders import load_nber_cycles, load_yahoo_daily
+from common.shared_panel import align_panel, attach_arrays, shared_arrays
+from daily_simulator import NBER_PATH, daily_cash_rate, simulate
+
+OUTPUT_BASE = os.path.join(SCRIPT_DIR, 'output_多檔熊市批次分析')
+STRATEGIES = {'A': 1.0, 'B': 0.5, 'C': 0.0}
+
+# worker 內 attach 的共用陣列（handles 必須保留，否則陣列失效）
+_shared = {}
+
+
+def is_yahoo_csv(path):
+    """Yahoo 三列表頭（Price / Ticker / Date）的日數據檔"""
+    with open(path, encoding='utf-8', errors='replace') as f:
+        first, second = f.readline(), f.readline()
+    return first.startswith('Price,') and second.startswith('Ticker,')
+
+
+def ticker_name(path):
+    """表頭第二列的代號（例如 ^GSPC）；讀不到時用檔名"""
+    with open(path, encoding='utf-8', errors='replace') as f:
+        f.readline()
+        fields = f.readline().rstrip('\n').split(',')
+    name = fields[1].strip() if len(fields) > 1 else ''
+    return name or os.path.splitext(os.path.basename(path))[0]
+
+
+def load_tickers(directory, pattern='*.csv'):
+    """讀取資料夾內所有 Yahoo 格式檔的收盤價，回傳 {代號: Series}（同名代號加上檔名區分）"""
+    series = {}
+    for path in sorted(glob.glob(os.path.join(directory, pattern))):
+        if not is_yahoo_csv(path):
+            continue
+        name = ticker_name(path)
+        if name in series:
+            name = f"{name} ({os.path.basename(path)})"
+        close = load_yahoo_daily(path)['Close'].dropna()
+        if len(close) >= 2:
+            series[name] = close
+    return series
+
+
+def panel_arrays(dates, values, lead=12):
+    """面板與各日期共用的輔助陣列：衰退累積次數、減碼期間、GS10 現金利率、日序數"""
+    labels = label_months(dates, load_nber_cycles(NBER_PATH))
+    recession = labels['phase'] == RECESSION
+    window = recession | ((labels['to_peak'] >= 1) & (labels['to_peak'] <= lead))
+    return {
+        'prices': values,
+        'dates': dates,
+        'days': dates.astype('datetime64[D]').astype(np.int64),
+        # 前綴和：日期 [i, j] 之間有衰退 ⇔ rec_cum[j + 1] - rec_cum[i] > 0
+        'rec_cum': np.concatenate([[0], np.cumsum(recession)]),
+        'window': window,
+        'cash_rate': daily_cash_rate(dates),
+    }
+
+
+def _attach_worker(specs):
+    _shared['handles'], _shared['arrays'] = attach_arrays(specs)
+
+
+def _use_local(arrays):
+    _shared['handles'], _shared['arrays'] = [], arrays
+
+
+def analyze_ticker(task):
+    """第 j 欄的熊市與策略結果；陣列從共用記憶體取得，task 只有索引與參數"""
+    j, decline, rebound, cost_bps = task
+    with profiling.stage('ticker'):
+        arr = _shared['arrays']
+        col = arr['prices'][:, j]
+        valid = np.flatnonzero(~np.isnan(col))
+        prices = col[valid]
+        days = arr['days'][valid]
+
+        episodes = []
+        for ep in detect_bear_markets(prices, decline, rebound):
+            peak, trough = valid[ep['peak']], valid[ep['trough']]
+            episodes.append({
+                'peak': int(peak), 'trough': int(trough),
+                'depth': (prices[ep['trough']] / prices[ep['peak']] - 1) * 100,
+                'days': int(days[ep['trough']] - days[ep['peak']]),
+                'recession': bool(arr['rec_cum'][trough + 1] - arr['rec_cum'][peak] > 0),
+                'ongoing': ep['end'] is None,
+            })
+
+        exposures = np.array(list(STRATEGIES.values()))
+        weights = np.where(arr['window'][valid][:, None], exposures[None, :], 1.0)
+        equity = simulate(prices, weights, arr['dates'][valid], arr['cash_rate'][valid], cost_bps)
+        years = (days[-1] - days[0]) / 365.25
+        final = equity[-1]
+        return {
+            'column': j,
+            'first': int(valid[0]), 'last': int(valid[-1]), 'bars': len(valid),
+            'episodes': episodes,
+            'annual': (final ** (1 / years) - 1) * 100 if years > 0 else np.full(len(final), np.nan),
+            'max_dd': ((equity / np.maximum.accumulate(equity, axis=0)).min(axis=0) - 1) * 100,
+        }
+
+
+def run_batch(series, decline=0.20, rebound=0.20, lead=12, cost_bps=5.0, workers=None):
+    """對齊面板、放進共用記憶體，逐檔平行分析；回傳 (日期, 代號, 各檔結果)"""
+    tickers = list(series)
+    with profiling.stage('align_panel', rows=len(tickers)):
+        dates, values = align_panel(series)
+        arrays = panel_arrays(dates, values, lead)
+
+    tasks = [(j, decline, rebound, cost_bps) for j in range(len(tickers))]
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    with profiling.stage('analyze', rows=len(tasks)):
+        if workers <= 1:
+            _use_local(arrays)
+            results = [analyze_ticker(t) for t in tasks]
+        else:
+            with shared_arrays(arrays) as specs:
+                with ProcessPoolExecutor(max_workers=workers, initializer=_attach_worker,
+                                         initargs=(specs,)) as pool:
+                    chunksize = max(1, len(tasks) // (workers * 4))
+                    results = list(pool.map(analyze_ticker, tasks, chunksize=chunksize))
+    return dates, tickers, results
+
+
+def _mean(values):
+    return float(np.mean(values)) if len(values) else np.nan
+
+
+def ticker_frame(dates, tickers, results):
+    """每檔一列：期間、熊市次數、衰退型 / 非衰退型的次數與平均跌幅 / 到底天數、各策略表現"""
+    day = np.datetime_as_string(dates, unit='D')
+    rows = []
+    for name, r in zip(tickers, results):
+        rec = [ep for ep in r['episodes'] if ep['recession']]
+        non = [ep for ep in r['episodes'] if not ep['recession']]
+        row = {
+            '代號': name,
+            '起日': day[r['first']],
+            '迄日': day[r['last']],
+            'K棒數': r['bars'],
+            '熊市次數': len(r['episodes']),
+            '衰退型次數': len(rec),
+            '非衰退型次數': len(non),
+            '衰退型比例(%)': round(len(rec) / len(r['episodes']) * 100, 1) if r['episodes'] else np.nan,
+            '衰退型平均跌幅(%)': round(_mean([ep['depth'] for ep in rec]), 2),
+            '非衰退型平均跌幅(%)': round(_mean([ep['depth'] for ep in non]), 2),
+            '衰退型平均到底天數': round(_mean([ep['days'] for ep in rec]), 1),
+            '非衰退型平均到底天數': round(_mean([ep['days'] for ep in non]), 1),
+        }
+        for k, s in enumerate(STRATEGIES):
+            row[f'{s}年化報酬(%)'] = round(float(r['annual'][k]), 2)
+        for k, s in enumerate(STRATEGIES):
+            row[f'{s}最大回撤(%)'] = round(float(r['max_dd'][k]), 2)
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def cross_section(table):
+    """各數值指標在所有代號間的分布（忽略沒有值的代號）"""
+    metrics = [c for c in table.columns if c not in ('代號', '起日', '迄日')]
+    values = table[metrics].to_numpy(dtype=np.float64)
+    with warnings.catch_warnings():
+        # 全部代號都沒有值的指標（例如沒有非衰退型熊市）結果為 NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        q = np.nanquantile(values, [0.25, 0.5, 0.75], axis=0)
+        mean = np.nanmean(values, axis=0)
+    return pd.DataFrame({
+        '指標': metrics,
+        '代號數': (~np.isnan(values)).sum(axis=0),
+        '平均': mean.round(2),
+        'P25': q[0].round(2),
+        '中位數': q[1].round(2),
+        'P75': q[2].round(2),
+    })
+
+
+def episode_frame(dates, tickers, results):
+    """所有代號的熊市明細"""
+    day = np.datetime_as_string(dates, unit='D')
+    rows = [{
+        '代號': name,
+        '類型': '衰退型' if ep['recession'] else '非衰退型',
+        '高點日期': day[ep['peak']],
+        '低點日期': day[ep['trough']],
+        '最大跌幅(%)': round(ep['depth'], 2),
+        '到底天數': ep['days'],
+        '進行中': ep['ongoing'],
+    } for name, r in zip(tickers, results) for ep in r['episodes']]
+    return pd.DataFrame(rows, columns=['代號', '類型', '高點日期', '低點日期', '最大跌幅(%)', '到底天數', '進行中'])
+
+
+def type_split(episodes):
+    """所有熊市依衰退型 / 非衰退型合併：次數、涉及代號數、跌幅與到底天數"""
+    rows = []
+    for kind in ('衰退型', '非衰退型'):
+        sub = episodes[episodes['類型'] == kind]
+        depth = sub['最大跌幅(%)'].to_numpy(dtype=np.float64)
+        days = sub['到底天數'].to_numpy(dtype=np.float64)
+        rows.append({
+            '類型': kind,
+            '熊市次數': len(sub),
+            '代號數': sub['代號'].nunique(),
+            '平均跌幅(%)': round(_mean(depth), 2),
+            '中位數跌幅(%)': round(float(np.median(depth)), 2) if len(depth) else np.nan,
+            '平均到底天數': round(_mean(days), 1),
+            '中位數到底天數': float(np.median(days)) if len(days) else np.nan,
+        })
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多檔日數據批次分析（熊市偵測、NBER 週期策略）")
+    parser.add_argument('directory', nargs='?', default=SCRIPT_DIR, help="Yahoo 格式日數據所在資料夾")
+    parser.add_argument('--pattern', default='*.csv', help="檔名樣式（非 Yahoo 格式的檔案會略過）")
+    parser.add_argument('--decline', type=float, default=0.20, help="進入熊市的跌幅門檻")
+    parser.add_argument('--rebound', type=float, default=0.20, help="熊市結束的反彈門檻")
+    parser.add_argument('--lead', type=int, default=12, help="衰退開始前幾個月減碼")
+    parser.add_argument('--cost-bps', type=float, default=5.0, help="每次調整權重的成本（bps × |Δ權重|）")
+    parser.add_argument('--workers', type=int, default=None, help="平行處理程序數（預設為 CPU 核心數）")
+    parser.add_argument('--formats', nargs='+', choices=['xlsx', 'csv', 'parquet'], default=['xlsx'],
+                        help="輸出格式")
+    parser.add_argument('--profile', action='store_true',
+                        help="記錄各階段耗時與記憶體（含 worker），輸出 Chrome trace 到 .cache/profile/")
+    args = parser.parse_args()
+    if args.profile:
+        profiling.enable()
+
+    with profiling.stage('load_tickers') as st:
+        series = load_tickers(args.directory, args.pattern)
+        st.rows = len(series)
+    if not series:
+        print(f"{args.directory} 沒有 Yahoo 格式的日數據")
+        return
+
+    dates, tickers, results = run_batch(series, args.decline, args.rebound, args.lead,
+                                        args.cost_bps, args.workers)
+    table = ticker_frame(dates, tickers, results)
+    episodes = episode_frame(dates, tickers, results)
+    split = type_split(episodes)
+    summary = cross_section(table)
+
+    print(f"{len(tickers)} 檔，{len(dates)} 個交易日（{pd.Timestamp(dates[0]):%Y-%m-%d} ~ {pd.Timestamp(dates[-1]):%Y-%m-%d}），"
+          f"共 {len(episodes)} 次熊市")
+    print()
+    print(split.to_string(index=False))
+    print()
+    print(summary.to_string(index=False))
+
+    paths = export_frames(OUTPUT_BASE, {'各代號': table, '橫斷面統計': summary,
+                                        '熊市類型': split, '熊市明細': episodes}, args.formats)
+    print()
+    for path in paths:
+        print(f"已儲存至: {path}")
+
+    if args.profile:
+        profiling.report(profiling.trace_path('multi_ticker_batch'))
+
+
+if __name__ == '__main__':
+    main()
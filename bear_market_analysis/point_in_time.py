@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+NBER 公告延遲下的時點回測（walk-forward）
+
+其他回測用的是事後確定的衰退日期；這裡改用 common.vintages，每天只依「當時已公告」的
+高峰 / 谷底判斷是否在衰退中，掃描各種假設的公告延遲（高峰、谷底分開），看延遲多久
+策略就失效：
+- 策略 A/B/C：認定在衰退中（已公告高峰、尚未公告谷底）時持股 100% / 50% / 0%，其餘 100%
+- 類型切換階梯：平時用非衰退型階梯（跌 20% 起買、每跌 5% 加碼），認定在衰退中時改用
+  衰退型階梯（跌 30% 起買、每跌 10% 加碼），即報告「分辨類型，調整買點」的可執行版本
+
+延遲 (0, 0) 等於事後標記；另外以 NBER 正式公告日（1980 年起，更早的轉折點用正式公告的
+平均延遲推算）跑一次，並列出 daily_simulator 的「衰退前 12 個月減碼」事後版本對照。
+淨值算法同 daily_simulator.simulate（股票加計 Shiller 股息、現金按 GS10 計息、|Δ權重| × 成本），
+所有情境與策略組成一個 (天數 × 情境) 權重矩陣一次計算。
+
+輸出:
+    - output_時點回測.xlsx: 情境比較、延遲掃描、年化報酬矩陣、各轉折點公告日
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from bear_market_detector import SCRIPT_DIR, load_daily_prices
+# bear_market_detector 已將 repo 根目錄加入 sys.path
+from common.cycles import RECESSION
+from common.exporters import export_frames
+from common.loaders import load_nber_cycles, load_shiller
+from common.vintages import NBER_ANNOUNCEMENTS, PEAK, build_vintages, known_phase, official_lags
+from daily_simulator import (
+    NBER_PATH, SHILLER_PATH, cycle_weights, daily_cash_rate, daily_dividend_yield, simulate, summarize,
+)
+from drawdown_ladder import REPORT_LADDERS, ladder_rungs, peak_depth
+
+OUTPUT_BASE = os.path.join(SCRIPT_DIR, 'output_時點回測')
+
+EXPOSURES = {'B(50%)': 0.5, 'C(0%)': 0.0}
+NORMAL_LADDER, RECESSION_LADDER = (REPORT_LADDERS[name] for name in list(REPORT_LADDERS)[:2])
+LADDER_NAME = '類型切換階梯'
+
+
+def ladder_rung_pair(prices):
+    """非衰退型 / 衰退型階梯在每天的階數（兩者都是回到前高才退出，共用同一條深度）"""
+    depth = peak_depth(np.asarray(prices, dtype=np.float64))
+    return (ladder_rungs(depth, NORMAL_LADDER['start'], NORMAL_LADDER['step']),
+            ladder_rungs(depth, RECESSION_LADDER['start'], RECESSION_LADDER['step']))
+
+
+def scenario_weights(recession, rungs):
+    """認定衰退與否（天數 × 情境，bool）→ {策略: (天數 × 情境) 權重}"""
+    weights = {name: np.where(recession, exposure, 1.0) for name, exposure in EXPOSURES.items()}
+    normal, rec = rungs
+    active = np.where(recession, rec[:, None], normal[:, None])
+    weights[LADDER_NAME] = np.clip(NORMAL_LADDER['base'] + NORMAL_LADDER['tranche'] * active, 0.0, 1.0)
+    return weights
+
+
+def run_scenarios(prices, scenarios, cycles, cash_rate, cost_bps=5.0, dividend_yield=None):
+    """scenarios：[(名稱, 高峰延遲, 谷底延遲, 是否用正式公告日)] → 每個情境 × 策略一列的結果"""
+    dates = prices.index
+    recession = np.column_stack([
+        known_phase(build_vintages(cycles, peak, trough, official), dates)[0] == RECESSION
+        for _, peak, trough, official in scenarios
+    ])
+    weights = scenario_weights(recession, ladder_rung_pair(prices.to_numpy()))
+
+    names = list(weights)
+    matrix = np.concatenate([weights[name] for name in names], axis=1)
+    equity = simulate(prices.to_numpy(), matrix, dates, cash_rate, cost_bps, dividend_yield)
+    table = summarize(equity, dates, [name for name in names for _ in scenarios])
+
+    n = len(scenarios)
+    table.insert(0, '情境', [s[0] for s in scenarios] * len(names))
+    table.insert(1, '高峰延遲(月)', [s[1] for s in scenarios] * len(names))
+    table.insert(2, '谷底延遲(月)', [s[2] for s in scenarios] * len(names))
+    table['平均持股(%)'] = (matrix.mean(axis=0) * 100).round(1)
+    table['認定衰退天數比例(%)'] = np.tile((recession.mean(axis=0) * 100).round(1), len(names))
+    return table.iloc[np.argsort(np.arange(len(table)) % n, kind='stable')].reset_index(drop=True)
+
+
+def reference_rows(prices, cash_rate, cost_bps=5.0, dividend_yield=None):
+    """對照組：買入持有，以及事後知道高峰、提前 12 個月減碼的 B / C（daily_simulator）"""
+    dates = prices.index
+    weights = np.column_stack([np.ones(len(dates)), cycle_weights(dates, list(EXPOSURES.values()))])
+    equity = simulate(prices.to_numpy(), weights, dates, cash_rate, cost_bps, dividend_yield)
+    table = summarize(equity, dates, ['A(100%)', *EXPOSURES])
+    table.insert(0, '情境', ['買入持有', '事後：衰退前12個月減碼', '事後：衰退前12個月減碼'])
+    table['平均持股(%)'] = (weights.mean(axis=0) * 100).round(1)
+    return table
+
+
+def announcement_table(cycles, peak_lag, trough_lag, since):
+    """回測期間內（公告日 ≥ since）各轉折點的公告日：正式公告或以平均延遲推算"""
+    vintage = build_vintages(cycles, peak_lag, trough_lag, official=True)
+    known_dates = pd.DatetimeIndex(vintage['known'].astype('datetime64[D]'))
+    months = pd.PeriodIndex.from_ordinals(vintage['turn'], freq='M').astype(str)
+    kind = vintage['kind']
+    df = pd.DataFrame({
+        '轉折點': np.where(kind == PEAK, '高峰', '谷底'),
+        '轉折月份': months,
+        '公告日': known_dates.strftime('%Y-%m-%d'),
+        '延遲(月)': known_dates.to_period('M').asi8 - vintage['turn'],
+        '來源': ['正式公告' if (int(k), m) in NBER_ANNOUNCEMENTS else '平均延遲推算'
+               for k, m in zip(kind, months)],
+    })
+    return df[known_dates >= since].reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NBER 公告延遲下的時點回測")
+    parser.add_argument('--max-lag', type=int, default=24, help="掃描的最大公告延遲（月）")
+    parser.add_argument('--lag-step', type=int, default=3, help="掃描的延遲間隔（月）")
+    parser.add_argument('--cost-bps', type=float, default=5.0, help="每次調整權重的成本（bps × |Δ權重|）")
+    parser.add_argument('--no-cash-yield', action='store_true', help="現金報酬設為 0")
+    parser.add_argument('--no-dividends', action='store_true', help="股票部位只算價格報酬（不加 Shiller 股息）")
+    parser.add_argument('--formats', nargs='+', choices=['xlsx', 'csv', 'parquet'], default=['xlsx'],
+                        help="輸出格式")
+    args = parser.parse_args()
+
+    prices = load_daily_prices('yahoo')
+    cycles = load_nber_cycles(NBER_PATH)
+    shiller = load_shiller(SHILLER_PATH)
+    cash_rate = np.zeros(len(prices)) if args.no_cash_yield else daily_cash_rate(prices.index, shiller)
+    dividend_yield = None if args.no_dividends else daily_dividend_yield(prices.index, shiller)
+    mean_peak, mean_trough = (int(round(lag)) for lag in official_lags())
+
+    scenarios = [
+        ('事後（延遲 0）', 0, 0, False),
+        ('正式公告日', mean_peak, mean_trough, True),
+        ('平均延遲', mean_peak, mean_trough, False),
+    ]
+    scenario_table = run_scenarios(prices, scenarios, cycles, cash_rate, args.cost_bps, dividend_yield)
+    compare = pd.concat([reference_rows(prices, cash_rate, args.cost_bps, dividend_yield), scenario_table],
+                        ignore_index=True)[scenario_table.columns]
+
+    lags = range(0, args.max_lag + 1, args.lag_step)
+    grid = [(f'{p}/{t}', p, t, False) for p in lags for t in lags]
+    sweep = run_scenarios(prices, grid, cycles, cash_rate, args.cost_bps, dividend_yield).drop(columns='情境')
+    matrix = sweep.pivot_table(index=['策略', '高峰延遲(月)'], columns='谷底延遲(月)',
+                               values='年化報酬(%)').reset_index()
+    matrix.columns = [c if isinstance(c, str) else f'谷底延遲{c}月' for c in matrix.columns]
+
+    print(f"期間：{prices.index[0]:%Y-%m-%d} ~ {prices.index[-1]:%Y-%m-%d}　成本 {args.cost_bps:g} bps"
+          f"　正式公告平均延遲：高峰 {mean_peak} 個月、谷底 {mean_trough} 個月")
+    print(compare.to_string(index=False))
+    print()
+    print(f"延遲掃描（高峰 × 谷底，每 {args.lag_step} 個月）：年化報酬(%)")
+    print(matrix.to_string(index=False))
+
+    frames = {
+        '情境比較': compare,
+        '延遲掃描': sweep,
+        '年化報酬矩陣': matrix,
+        '公告日': announcement_table(cycles, mean_peak, mean_trough, prices.index[0]),
+    }
+    paths = export_frames(OUTPUT_BASE, frames, args.formats)
+    print()
+    for path in paths:
+        print(f"已儲存至: {path}")
+
+
+if __name__ == '__main__':
+    main()
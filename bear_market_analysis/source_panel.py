@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+多來源對齊面板與資料差異檢查
+
+把 Shiller 月數據、Yahoo 日數據、FRED 日數據合成一張日頻面板（common.aligned_panel）：
+收盤價以日期合併，CAPE / 股息 / 盈餘 / CPI / GS10 依月份 as-of 帶到每一根日 K 棒並向前填補，
+Yahoo 與 FRED 重疊期間內收盤價不一致或只有一方有值的日子會被標記。
+
+輸出:
+    - output_多來源對齊面板.xlsx: 差異摘要、差異明細（--full 另加完整面板）
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from bear_market_detector import SCRIPT_DIR, load_daily_prices
+# bear_market_detector 已將 repo 根目錄加入 sys.path
+from common.aligned_panel import (
+    FRED_MISSING, MISMATCH, YAHOO_MISSING, build_panel, column, panel_frame,
+)
+from common.exporters import export_frames
+from common.loaders import load_shiller
+
+SHILLER_PATH = os.path.join(SCRIPT_DIR, 'input_SP指數(Shiller數據）.csv')
+OUTPUT_BASE = os.path.join(SCRIPT_DIR, 'output_多來源對齊面板')
+
+FLAG_NAMES = {MISMATCH: '收盤價不一致', YAHOO_MISSING: 'Yahoo 缺值', FRED_MISSING: 'FRED 缺值'}
+
+
+def load_panel(tolerance=1e-4):
+    return build_panel(load_daily_prices('yahoo'), load_daily_prices('fred'),
+                       load_shiller(SHILLER_PATH), tolerance=tolerance)
+
+
+def discrepancy_summary(panel):
+    """重疊期間、兩者皆有的天數、各旗標天數、收盤價相對差"""
+    dates = pd.DatetimeIndex(panel['dates'])
+    yahoo, fred = column(panel, 'yahoo_close'), column(panel, 'fred_close')
+    both = ~np.isnan(yahoo) & ~np.isnan(fred)
+    diff = np.abs(yahoo[both] / fred[both] - 1) * 100
+    flags = panel['flags']
+
+    rows = [
+        ('面板期間', f"{dates[0]:%Y-%m-%d} ~ {dates[-1]:%Y-%m-%d}"),
+        ('面板交易日', len(dates)),
+        ('兩者皆有值', int(both.sum())),
+    ]
+    if both.any():
+        rows.append(('重疊期間', f"{dates[both][0]:%Y-%m-%d} ~ {dates[both][-1]:%Y-%m-%d}"))
+    rows += [(name, int((flags & bit).astype(bool).sum())) for bit, name in FLAG_NAMES.items()]
+    rows += [
+        ('最大相對差(%)', round(float(diff.max()), 6) if len(diff) else np.nan),
+        ('平均相對差(%)', round(float(diff.mean()), 6) if len(diff) else np.nan),
+        ('Shiller 最後月份距面板結束(月)', int(column(panel, 'shiller_age')[-1])),
+    ]
+    return pd.DataFrame(rows, columns=['項目', '數值'])
+
+
+def discrepancy_rows(panel):
+    """有旗標的日子：日期、兩個來源的收盤價、相對差、原因"""
+    flagged = np.flatnonzero(panel['flags'])
+    yahoo = column(panel, 'yahoo_close')[flagged]
+    fred = column(panel, 'fred_close')[flagged]
+    flags = panel['flags'][flagged]
+    reasons = ['、'.join(name for bit, name in FLAG_NAMES.items() if f & bit) for f in flags]
+    return pd.DataFrame({
+        '日期': np.datetime_as_string(panel['dates'][flagged], unit='D'),
+        'Yahoo': np.round(yahoo, 4),
+        'FRED': np.round(fred, 4),
+        '相對差(%)': np.round(np.abs(yahoo / fred - 1) * 100, 6),
+        '原因': reasons,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多來源對齊面板與資料差異檢查")
+    parser.add_argument('--tolerance', type=float, default=1e-4, help="Yahoo / FRED 收盤價容許相對差")
+    parser.add_argument('--full', action='store_true', help="另外輸出完整面板")
+    parser.add_argument('--formats', nargs='+', choices=['xlsx', 'csv', 'parquet'], default=['xlsx'],
+                        help="輸出格式")
+    args = parser.parse_args()
+
+    panel = load_panel(args.tolerance)
+    summary = discrepancy_summary(panel)
+    rows = discrepancy_rows(panel)
+    print(summary.to_string(index=False))
+    print()
+    print(rows.to_string(index=False))
+
+    frames = {'差異摘要': summary, '差異明細': rows}
+    if args.full:
+        frames['面板'] = panel_frame(panel).reset_index()
+    paths = export_frames(OUTPUT_BASE, frames, args.formats)
+    print()
+    for path in paths:
+        print(f"已儲存至: {path}")
+
+
+if __name__ == '__main__':
+    main()
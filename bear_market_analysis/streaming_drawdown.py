@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+分鐘 K 棒串流回撤分析（檔案大於記憶體時使用）
+
+數 GB 的分鐘 K 棒無法像其他腳本一樣整檔讀進 pandas。這裡用 read_csv(chunksize=...)
+一次只讀固定列數，區塊之間只帶著少量狀態，記憶體用量與檔案大小無關：
+- 回撤狀態機：每個門檻（熊市、修正）一份 bear_market_detector 的狀態
+  （高點、是否在熊市中、低點、跌破門檻日），另外記下這些位置的時間與價格，
+  結束的區段不必回頭讀舊資料
+- 降頻 OHLC：尚未收完的最後一根 K 棒（開高低收量、距高點、區間最大回撤）
+
+區塊內不逐根迴圈：以 maximum / minimum.accumulate 找出下一次狀態轉換的位置，
+轉換之間整段向量化，搜尋範圍從 256 根倍增（轉換很少時幾乎一次掃完一個區塊）。
+新高用 >=、新低用 <、門檻比較的浮點運算都與 advance_bear_state 相同，
+結果與整檔讀入後 detect_bear_markets 的結果完全一致（--verify 可直接比對）。
+
+熊市區段與降頻 K 棒都以 generator 逐步產出（iter_episodes / iter_ohlc；
+stream_file 單次讀檔同時產出兩者），呼叫端可以邊讀邊寫，不必保留全部結果。
+
+輸入（需依時間遞增排序）:
+    - --format minute: 一列表頭，Datetime, Open, High, Low, Close, Volume
+    - --format yahoo / fred: 與 incremental_update.py 相同的日數據格式
+
+輸出:
+    - output_串流回撤分析.xlsx: 各門檻的熊市 / 修正統計（格式同 output_股市熊市統計_日數據.xlsx）、
+      降頻 K 棒（含距高點、區間最大回撤）
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from bear_market_detector import SCRIPT_DIR, SOURCES, detect_bear_markets, init_bear_state, records_to_frame
+# bear_market_detector 已將 repo 根目錄加入 sys.path
+from common import profiling
+from common.exporters import export_frames
+from incremental_update import FORMATS as DAILY_FORMATS
+
+OUTPUT_BASE = os.path.join(SCRIPT_DIR, 'output_串流回撤分析')
+CHUNK_ROWS = 1_000_000
+MIN_SPAN = 256
+
+# 表頭列數、欄位名稱、價格欄位；ohlc 為 (開, 高, 低, 量) 欄位，沒有的來源只用價格
+FORMATS = {
+    'minute': {'header_lines': 1, 'names': ['Datetime', 'Open', 'High', 'Low', 'Close', 'Volume'],
+               'price': 'Close', 'ohlc': ('Open', 'High', 'Low', 'Volume')},
+    'yahoo': {**DAILY_FORMATS['yahoo'], 'ohlc': ('Open', 'High', 'Low', 'Volume')},
+    'fred': {**DAILY_FORMATS['fred'], 'ohlc': None},
+}
+
+# 門檻名稱 → (decline, rebound)
+LEVELS = {'熊市': (0.20, 0.20), '修正': (0.10, 0.10)}
+
+
+def iter_chunks(path, fmt, chunksize=CHUNK_ROWS):
+    """逐區塊讀檔，yield (時間 int64 ns, 價格, OHLC 欄位 dict 或 None)；價格缺值的列已排除
+
+    時間不是遞增排序時丟出 ValueError（降頻與狀態機都假設依時間順序）
+    """
+    date_col = fmt['names'][0]
+    last = None
+    reader = pd.read_csv(path, skiprows=fmt['header_lines'], header=None, names=fmt['names'],
+                         dtype=str, chunksize=chunksize)
+    with reader:
+        for df in reader:
+            prices = pd.to_numeric(df[fmt['price']], errors='coerce').to_numpy(dtype=np.float64)
+            keep = ~np.isnan(prices)
+            times = pd.to_datetime(df[date_col], format='ISO8601')
+            if times.dt.tz is not None:
+                times = times.dt.tz_localize(None)  # 保留交易所當地時間，日 K 以當地日期切分
+            times = times.to_numpy(dtype='datetime64[ns]').view(np.int64)[keep]
+            if not len(times):
+                continue
+            if (last is not None and times[0] < last) or np.any(times[1:] < times[:-1]):
+                raise ValueError(f"{path} 未依時間遞增排序")
+            last = times[-1]
+
+            ohlc = None
+            if fmt.get('ohlc'):
+                ohlc = {name: pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=np.float64)[keep]
+                        for name, col in zip(('open', 'high', 'low', 'volume'), fmt['ohlc'])}
+            yield times, prices[keep], ohlc
+
+
+# ---------------------------------------------------------------------------
+# 回撤狀態機（跨區塊）
+# ---------------------------------------------------------------------------
+
+def init_stream_state(time, price):
+    """bear_market_detector 的初始狀態，另記高點 / 低點 / 跌破日的時間與跌破日價格"""
+    state = init_bear_state(price)
+    state.update(peak_time=int(time), trough_time=int(time), cross_time=int(time))
+    return state
+
+
+def _episode(state, end=None, end_time=None):
+    return {
+        'peak': state['peak_idx'], 'trough': state['trough_idx'], 'cross': state['cross_idx'], 'end': end,
+        'peak_date': pd.Timestamp(state['peak_time']), 'peak_price': state['peak'],
+        'trough_date': pd.Timestamp(state['trough_time']), 'trough_price': state['trough'],
+        'cross_date': pd.Timestamp(state['cross_time']),
+        'end_date': None if end_time is None else pd.Timestamp(end_time),
+    }
+
+
+def _last_event(events, upto):
+    """events[:upto] 中最後一個 True 的位置，沒有則為 -1"""
+    hits = np.flatnonzero(events[:upto])
+    return hits[-1] if len(hits) else -1
+
+
+def scan_prices(state, times, prices, start, decline=0.20, rebound=0.20):
+    """把一個區塊（第一根的全域索引為 start）接續餵給狀態機，就地更新 state
+
+    與 advance_bear_state 逐根的結果相同，回傳這個區塊內結束的區段（見 _episode）
+    """
+    enter_ratio, exit_ratio = 1 - decline, 1 + rebound
+    episodes = []
+    n = len(prices)
+    pos, span = 0, MIN_SPAN
+    while pos < n:
+        seg = prices[pos:pos + span]
+        if state['in_bear']:
+            run = np.minimum(np.minimum.accumulate(seg), state['trough'])
+            prev = np.concatenate(([state['trough']], run[:-1]))
+            extreme = seg < prev
+            hit = ~extreme & (seg >= run * exit_ratio)
+        else:
+            run = np.maximum(np.maximum.accumulate(seg), state['peak'])
+            prev = np.concatenate(([state['peak']], run[:-1]))
+            extreme = seg >= prev
+            hit = ~extreme & (seg <= run * enter_ratio)
+
+        hits = np.flatnonzero(hit)
+        k = hits[0] if len(hits) else len(seg)
+        j = _last_event(extreme, k)
+        if j >= 0:
+            key = 'trough' if state['in_bear'] else 'peak'
+            state[key], state[f'{key}_idx'], state[f'{key}_time'] = float(seg[j]), start + pos + j, int(times[pos + j])
+
+        if k < len(seg):
+            idx, price, time = start + pos + k, float(seg[k]), int(times[pos + k])
+            if state['in_bear']:
+                episodes.append(_episode(state, idx, time))
+                state.update(in_bear=False, peak=price, peak_idx=idx, peak_time=time)
+            else:
+                state.update(in_bear=True, trough=price, trough_idx=idx, trough_time=time,
+                             cross_idx=idx, cross_time=time)
+            pos += k + 1
+            span = MIN_SPAN
+        else:
+            pos += len(seg)
+            span *= 2
+    return episodes
+
+
+# ---------------------------------------------------------------------------
+# 降頻 OHLC（跨區塊）
+# ---------------------------------------------------------------------------
+
+def _bar_frame(bars):
+    index = pd.DatetimeIndex(bars.pop('time').astype('datetime64[ns]'), name='Date')
+    return pd.DataFrame(bars, index=index)
+
+
+def resample_chunk(carry, times, prices, ohlc, freq):
+    """把一個區塊降頻成 freq（固定長度頻率，例如 '5min'、'1h'、'1D'）的 K 棒
+
+    carry 保存跨區塊的狀態（就地更新）：close 的歷史高點與尚未收完的最後一根 K 棒。
+    回傳這個區塊內已收完的 K 棒 DataFrame；最後一根留在 carry['pending']。
+    """
+    peak = np.maximum(np.maximum.accumulate(prices), carry['peak'])
+    carry['peak'] = float(peak[-1])
+    drawdown = prices / peak - 1
+
+    keys = pd.DatetimeIndex(times.view('datetime64[ns]')).floor(freq).asi8
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    ends = np.append(starts[1:], len(keys)) - 1
+    if ohlc is None:
+        open_, high, low, volume = prices, prices, prices, np.zeros(len(prices))
+    else:
+        open_, high, low, volume = ohlc['open'], ohlc['high'], ohlc['low'], np.nan_to_num(ohlc['volume'])
+    bars = {
+        'time': keys[starts],
+        'open': open_[starts],
+        'high': np.fmax.reduceat(high, starts),
+        'low': np.fmin.reduceat(low, starts),
+        'close': prices[ends],
+        'volume': np.add.reduceat(volume, starts),
+        'drawdown': drawdown[ends],
+        'max_drawdown': np.minimum.reduceat(drawdown, starts),
+    }
+
+    pending = carry['pending']
+    if pending is not None and pending['time'] == bars['time'][0]:
+        bars['open'][0] = pending['open']
+        bars['high'][0] = np.fmax(pending['high'], bars['high'][0])
+        bars['low'][0] = np.fmin(pending['low'], bars['low'][0])
+        bars['volume'][0] += pending['volume']
+        bars['max_drawdown'][0] = min(pending['max_drawdown'], bars['max_drawdown'][0])
+        pending = None
+
+    carry['pending'] = {name: col[-1].item() for name, col in bars.items()}
+    done = {name: col[:-1] for name, col in bars.items()}
+    if pending is not None:
+        done = {name: np.insert(col, 0, pending[name]) for name, col in done.items()}
+    return _bar_frame(done)
+
+
+def flush_bars(carry):
+    """資料結束時最後一根 K 棒"""
+    pending = carry['pending']
+    if pending is None:
+        return _bar_frame({name: np.array([]) for name in
+                           ('time', 'open', 'high', 'low', 'close', 'volume', 'drawdown', 'max_drawdown')})
+    carry['pending'] = None
+    return _bar_frame({name: np.array([value]) for name, value in pending.items()})
+
+
+# ---------------------------------------------------------------------------
+# 串流
+# ---------------------------------------------------------------------------
+
+def stream_file(path, fmt, levels=LEVELS, freq='1D', chunksize=CHUNK_ROWS):
+    """單次讀檔，每個區塊 yield (區段, 降頻 K 棒)
+
+    區段為 [(門檻名稱, _episode dict)]，資料結束時另外 yield 進行中的區段（end 為 None）
+    與最後一根 K 棒；freq 為 None 時不降頻（K 棒為 None）
+    """
+    states = {}
+    carry = {'peak': -np.inf, 'pending': None}
+    n = 0
+    for times, prices, ohlc in iter_chunks(path, fmt, chunksize):
+        episodes = []
+        for name, (decline, rebound) in levels.items():
+            if name not in states:
+                states[name] = init_stream_state(times[0], prices[0])
+            episodes += [(name, ep) for ep in scan_prices(states[name], times, prices, n, decline, rebound)]
+        bars = resample_chunk(carry, times, prices, ohlc, freq) if freq else None
+        n += len(prices)
+        yield episodes, bars
+
+    still_open = [(name, _episode(state)) for name, state in states.items() if state['in_bear']]
+    yield still_open, flush_bars(carry) if freq else None
+
+
+def iter_episodes(path, fmt, levels=LEVELS, chunksize=CHUNK_ROWS):
+    """逐一產出 (門檻名稱, 區段)；各門檻內的順序與 detect_bear_markets 相同"""
+    for episodes, _ in stream_file(path, fmt, levels, None, chunksize):
+        yield from episodes
+
+
+def iter_ohlc(path, fmt, freq='1D', chunksize=CHUNK_ROWS):
+    """逐區塊產出已收完的降頻 K 棒 DataFrame"""
+    for _, bars in stream_file(path, fmt, {}, freq, chunksize):
+        if len(bars):
+            yield bars
+
+
+def verify(path, fmt, levels, episodes):
+    """整檔讀入後用 detect_bear_markets 重算，回傳各門檻是否與串流結果完全一致"""
+    times, prices = [], []
+    for t, p, _ in iter_chunks(path, fmt):
+        times.append(t)
+        prices.append(p)
+    prices = np.concatenate(prices)
+    keys = ('peak', 'trough', 'cross', 'end')
+    result = {}
+    for name, (decline, rebound) in levels.items():
+        expected = detect_bear_markets(prices, decline, rebound)
+        got = [{k: ep[k] for k in keys} for level, ep in episodes if level == name]
+        result[name] = got == expected
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分鐘 K 棒串流回撤分析")
+    parser.add_argument('path', nargs='?', help="K 棒 CSV（未指定時用 --source 的日數據）")
+    parser.add_argument('--source', choices=sorted(SOURCES), default='yahoo', help="未指定檔案時的日數據來源")
+    parser.add_argument('--format', choices=sorted(FORMATS), help="檔案格式（預設：指定檔案為 minute，否則同 --source）")
+    parser.add_argument('--bear', nargs=2, type=float, default=LEVELS['熊市'], metavar=('DECLINE', 'REBOUND'),
+                        help="熊市的下跌 / 反彈門檻")
+    parser.add_argument('--correction', nargs=2, type=float, default=LEVELS['修正'], metavar=('DECLINE', 'REBOUND'),
+                        help="修正的下跌 / 反彈門檻")
+    parser.add_argument('--freq', default='1D', help="降頻 K 棒的頻率（固定長度，例如 5min、1h、1D）")
+    parser.add_argument('--chunksize', type=int, default=CHUNK_ROWS, help="每個區塊的列數")
+    parser.add_argument('--verify', action='store_true', help="另外整檔讀入，與 detect_bear_markets 比對")
+    parser.add_argument('--profile', action='store_true',
+                        help="記錄各階段耗時與記憶體，輸出 Chrome trace 到 .cache/profile/")
+    parser.add_argument('--formats', nargs='+', choices=['xlsx', 'csv', 'parquet'], default=['xlsx'],
+                        help="輸出格式")
+    args = parser.parse_args()
+    if args.profile:
+        profiling.enable()
+
+    path = args.path or os.path.join(SCRIPT_DIR, SOURCES[args.source])
+    fmt = FORMATS[args.format or ('minute' if args.path else args.source)]
+    levels = {'熊市': tuple(args.bear), '修正': tuple(args.correction)}
+
+    # 降頻後的 K 棒遠少於原始列數，這裡收集起來一次輸出；區段只有幾十筆
+    episodes, bar_blocks = [], []
+    with profiling.stage('stream') as st:
+        for eps, bars in stream_file(path, fmt, levels, args.freq, args.chunksize):
+            episodes += eps
+            if len(bars):
+                bar_blocks.append(bars)
+        st.rows = sum(len(b) for b in bar_blocks)
+
+    frames = {}
+    for name, (decline, _) in levels.items():
+        records = [ep for level, ep in episodes if level == name]
+        frames[name] = records_to_frame(records, decline)
+        print(f"{name}（下跌 {decline * 100:g}%）：{len(records)} 次")
+        print(frames[name].to_string(index=False))
+        print()
+
+    bars = pd.concat(bar_blocks)
+    frames['K棒'] = pd.DataFrame({
+        '時間': bars.index.strftime('%Y-%m-%d %H:%M'),
+        '開': bars['open'].round(4), '高': bars['high'].round(4),
+        '低': bars['low'].round(4), '收': bars['close'].round(4),
+        '量': bars['volume'],
+        '距高點(%)': (bars['drawdown'] * 100).round(2),
+        '區間最大回撤(%)': (bars['max_drawdown'] * 100).round(2),
+    })
+    print(f"降頻 K 棒（{args.freq}）：{len(bars)} 根")
+
+    if args.verify:
+        for name, same in verify(path, fmt, levels, episodes).items():
+            print(f"{name} 與 detect_bear_markets {'一致' if same else '不一致'}")
+
+    paths = export_frames(OUTPUT_BASE, frames, args.formats)
+    for p in paths:
+        print(f"已儲存至: {p}")
+    if args.profile:
+        profiling.report(profiling.trace_path('streaming_drawdown'))
+
+
+if __name__ == '__main__':
+    main()
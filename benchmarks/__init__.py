@@ -0,0 +1 @@
+"""效能測試：合成資料產生器與各分析階段計時（見 run_benchmarks.py）"""
@@ -0,0 +1,112 @@
+"""
+合成資料產生器（效能測試用）
+
+產生與真實輸入同樣形狀的資料，列數可從 1k 到 10M：
+- shiller_frame / write_shiller_csv：Shiller 月數據（相同欄位、「年.月」日期、千分位字串、
+  百分比字串、尾端缺值），可直接交給 common.loaders.parse_shiller
+- yahoo_frame / write_yahoo_csv：Yahoo 日數據（Close / High / Low / Open / Volume，
+  三列表頭），日期為工作日
+
+價格為去趨勢的隨機漫步（對數價格減掉長期移動平均），列數再多也不會溢位，
+同時保有足夠的波動讓熊市偵測有事可做。日期以秒為單位，10M 根日 K 棒
+（約西元 40000 年）也不會超出 datetime64 範圍。
+"""
+
+import numpy as np
+import pandas as pd
+
+from common.loaders import SHILLER_COLUMNS, SHILLER_DATE_COL, SHILLER_PCT_COLUMNS
+
+
+def _log_walk(n, sigma, window, rng):
+    """去趨勢隨機漫步：累積雜訊減掉前 window 筆的移動平均"""
+    walk = np.cumsum(rng.normal(0.0, sigma, n))
+    csum = np.concatenate([[0.0], np.cumsum(walk)])
+    idx = np.arange(1, n + 1)
+    start = np.maximum(idx - window, 0)
+    mean = (csum[idx] - csum[start]) / (idx - start)
+    return walk - mean
+
+
+def shiller_frame(n_months, seed=0):
+    """Shiller 形狀的月數據（欄位名稱與原始 CSV 相同，數值欄為 float）"""
+    rng = np.random.default_rng(seed)
+    offsets = np.arange(n_months)
+    year = 1871 + offsets // 12
+    month = offsets % 12 + 1
+
+    log_tr = _log_walk(n_months, 0.04, 120, rng)
+    real_tr = 100 * np.exp(log_tr + 9)
+    cpi = 10 * np.exp(_log_walk(n_months, 0.005, 120, rng) + 1)
+    price = real_tr / 1000 * cpi / 10
+    dividend = price * rng.uniform(0.01, 0.06, n_months)
+    earnings = price * rng.uniform(0.03, 0.10, n_months)
+
+    values = {
+        'price': price,
+        'dividend': dividend,
+        'earnings': earnings,
+        'cpi': cpi,
+        'date_fraction': year + (month - 0.5) / 12,
+        'gs10': rng.uniform(1.0, 8.0, n_months),
+        'real_price': price * 10 / cpi,
+        'real_dividend': dividend * 10 / cpi,
+        'real_total_return': real_tr,
+        'real_earnings': earnings * 10 / cpi,
+        'real_tr_earnings': earnings * 12 / cpi,
+        'cape': rng.uniform(5.0, 40.0, n_months),
+        'tr_cape': rng.uniform(5.0, 45.0, n_months),
+        'bond_return': rng.uniform(0.95, 1.05, n_months),
+        'real_bond_return': rng.uniform(0.9, 1.1, n_months),
+    }
+    # 與原始檔一樣：CAPE 前 10 年沒有值，未來 10 年報酬最後 10 年沒有值
+    values['cape'][:120] = np.nan
+    values['tr_cape'][:120] = np.nan
+
+    df = pd.DataFrame({SHILLER_DATE_COL: year + month / 100})
+    for src, name in SHILLER_COLUMNS.items():
+        df[src] = np.round(values[name], 2)
+    for src in SHILLER_PCT_COLUMNS:
+        pct = rng.uniform(-5.0, 15.0, n_months)
+        pct[-120:] = np.nan
+        df[src] = pct
+    return df
+
+
+def write_shiller_csv(path, n_months, seed=0):
+    """寫出與原始 Shiller CSV 同格式的檔案（總報酬指數為千分位字串、報酬為百分比字串）"""
+    df = shiller_frame(n_months, seed)
+    df[SHILLER_DATE_COL] = [f"{v:.2f}" for v in df[SHILLER_DATE_COL]]
+    tr_col = next(src for src, name in SHILLER_COLUMNS.items() if name == 'real_total_return')
+    df[tr_col] = [f"{v:,.2f}" for v in df[tr_col]]
+    for src in SHILLER_PCT_COLUMNS:
+        df[src] = [f"{v:.2f}%" if v == v else '' for v in df[src]]
+    df.to_csv(path, index=False, na_rep='NA')
+    return path
+
+
+def yahoo_frame(n_days, seed=0):
+    """Yahoo 形狀的日數據，以日期為索引（Close / High / Low / Open / Volume）"""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('1970-01-02', periods=n_days, freq='B', unit='s', name='Date')
+    close = 100 * np.exp(_log_walk(n_days, 0.011, 2520, rng))
+    open_ = close * np.exp(rng.normal(0.0, 0.004, n_days))
+    spread = np.abs(rng.normal(0.0, 0.006, n_days))
+    return pd.DataFrame({
+        'Close': close,
+        'High': np.maximum(close, open_) * (1 + spread),
+        'Low': np.minimum(close, open_) * (1 - spread),
+        'Open': open_,
+        'Volume': rng.integers(1_000_000, 5_000_000_000, n_days),
+    }, index=dates)
+
+
+def write_yahoo_csv(path, n_days, seed=0, ticker='^GSPC'):
+    """寫出 Yahoo 三列表頭格式（Price / Ticker / Date）的日數據 CSV"""
+    df = yahoo_frame(n_days, seed)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write('Price,' + ','.join(df.columns) + '\n')
+        f.write('Ticker,' + ','.join([ticker] * len(df.columns)) + '\n')
+        f.write('Date' + ',' * len(df.columns) + '\n')
+        df.to_csv(f, header=False, date_format='%Y-%m-%d')
+    return path
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+效能測試
+
+以合成資料（benchmarks/generators.py）對各分析階段計時，列數可從 1k 到 10M：
+- shiller_parse     解析 Shiller 形狀的月數據 CSV（parse_shiller，不經快取）
+- return_lookup     批次區間報酬查詢（calc_return_periods），列數 = 查詢筆數，查表為合成的
+                    Shiller 形狀月數據（長度同真實資料，約 153 年）
+- strategy_simulate 日頻三策略淨值（daily_simulator.simulate，含現金利息與成本）
+- bear_detect       單一門檻熊市偵測（detect_bear_markets）
+- bear_detect_batch 31 組門檻批次偵測（detect_bear_markets_batch）
+- excel_export      write-only 模式寫出 6 欄的 xlsx（上限為 Excel 的 1,048,575 列）
+
+每個階段記錄最佳耗時（至少 --repeat 次取最小；單次不到 50 ms 的階段會多跑幾次，
+湊滿約 0.5 秒）、耗時離散度（中位數 − 最佳）、每秒列數，以及另外一次在 tracemalloc
+下執行的記憶體峰值。--save 把結果存成 JSON 基準，--compare 與先前的基準比較，
+耗時或記憶體超出容許比例、且差距大於雜訊門檻（固定下限與該階段離散度的 3 倍取大者）時
+列出退步項目並以結束碼 1 結束。同一台機器的快慢也會隨負載飄動（虛擬機尤其明顯），
+每組量測前後各跑一次固定的參考工作量，比較時依兩次參考耗時的比例調整基準耗時；
+疑似退步的項目再重新量測兩次，每次都退步才算數。
+
+用法:
+    python benchmarks/run_benchmarks.py --save .cache/benchmarks/base.json
+    python benchmarks/run_benchmarks.py --compare .cache/benchmarks/base.json
+    python benchmarks/run_benchmarks.py --stages bear_detect --sizes 1000 10000000
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# 取得腳本所在目錄；分析腳本以同層 import 互相引用，兩個資料夾都加入 sys.path
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(SCRIPT_DIR)
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.join(REPO_ROOT, 'period_return_backtest'))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'bear_market_analysis'))
+
+from benchmarks.generators import shiller_frame, write_shiller_csv, yahoo_frame
+from common.exporters import frame_sheet, write_xlsx
+from common.loaders import SHILLER_COLUMNS, parse_shiller
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+SHILLER_MONTHS = 1_836  # 1871-01 ~ 2023-12
+# 快的階段受排程與快取干擾比例大：單次不到 FAST_SECONDS 時重複到總計 FAST_BUDGET 秒（最多 MAX_REPEAT 次）
+FAST_SECONDS = 0.05
+FAST_BUDGET = 0.5
+MAX_REPEAT = 100
+NOISE_SPREADS = 3  # 雜訊門檻 = 離散度 × 此倍數
+RECHECK_RUNS = 2  # 疑似退步時重新量測的次數，每次都退步才算數
+_REFERENCE_DATA = np.random.default_rng(0).random(200_000)
+EXCEL_MAX_ROWS = 1_048_575
+
+
+def _shiller_parse(rows, tmpdir):
+    path = write_shiller_csv(os.path.join(tmpdir, f'shiller_{rows}.csv'), rows)
+    return lambda: parse_shiller(path)
+
+
+def _return_lookup(rows, tmpdir):
+    from position_strategy_backtest import calc_return_periods
+    # 合成月數據從 1871-01 起逐月連續，總報酬欄即為月份索引查表
+    tr_col = next(src for src, name in SHILLER_COLUMNS.items() if name == 'real_total_return')
+    tr_by_month = shiller_frame(SHILLER_MONTHS)[tr_col].to_numpy(dtype=np.float64)
+    rng = np.random.default_rng(0)
+    starts = rng.integers(0, len(tr_by_month) - 36, rows)
+    ends = starts + rng.integers(1, 36, rows)
+    return lambda: calc_return_periods(starts, ends, tr_by_month)
+
+
+def _strategy_simulate(rows, tmpdir):
+    from daily_simulator import simulate
+    df = yahoo_frame(rows)
+    prices = df['Close'].to_numpy()
+    rng = np.random.default_rng(0)
+    # 每 250 根左右換一次權重，三個策略各自的曝險
+    regime = np.repeat(rng.random(rows // 250 + 1) < 0.3, 250)[:rows]
+    weights = np.where(regime[:, None], np.array([1.0, 0.5, 0.0]), 1.0)
+    cash_rate = rng.uniform(1.0, 6.0, rows)
+    return lambda: simulate(prices, weights, df.index, cash_rate, cost_bps=5)
+
+
+def _bear_detect(rows, tmpdir):
+    from bear_market_detector import detect_bear_markets
+    prices = yahoo_frame(rows)['Close'].to_numpy()
+    return lambda: detect_bear_markets(prices)
+
+
+def _bear_detect_batch(rows, tmpdir):
+    from bear_market_detector import detect_bear_markets_batch
+    prices = yahoo_frame(rows)['Close'].to_numpy()
+    declines = np.round(np.arange(10, 41) / 100, 2)
+    return lambda: detect_bear_markets_batch(prices, declines, np.full(len(declines), 0.20))
+
+
+def _excel_export(rows, tmpdir):
+    df = yahoo_frame(rows).reset_index()
+    path = os.path.join(tmpdir, f'export_{rows}.xlsx')
+    return lambda: write_xlsx(path, [frame_sheet(df, 'Sheet1')])
+
+
+# 階段名稱 → (準備函式, 最大列數)；準備函式回傳只包含被計時部分的 callable
+STAGES = {
+    'shiller_parse': (_shiller_parse, None),
+    'return_lookup': (_return_lookup, None),
+    'strategy_simulate': (_strategy_simulate, None),
+    'bear_detect': (_bear_detect, None),
+    'bear_detect_batch': (_bear_detect_batch, None),
+    'excel_export': (_excel_export, EXCEL_MAX_ROWS),
+}
+
+
+def measure(run, repeat=3, memory=True):
+    """回傳 (最佳耗時秒數, 離散度秒數, 記憶體峰值 MB)；記憶體另外執行一次，不影響計時
+
+    離散度 = 各次耗時的中位數 − 最佳值，比較時用來估計這個階段本身的雜訊
+    """
+    times = []
+    while len(times) < repeat or (min(times) < FAST_SECONDS and sum(times) < FAST_BUDGET
+                                  and len(times) < MAX_REPEAT):
+        gc.collect()
+        t0 = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - t0)
+    best = min(times)
+    spread = float(np.median(times)) - best
+
+    peak_mb = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            run()
+            peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        finally:
+            tracemalloc.stop()
+    return best, spread, peak_mb
+
+
+def _reference_run():
+    np.sort(_REFERENCE_DATA)
+    sum(range(200_000))
+
+
+def reference_seconds():
+    """固定參考工作量（numpy 排序 + 純 Python 迴圈）的最佳耗時，反映機器當下的快慢"""
+    return measure(_reference_run, memory=False)[0]
+
+
+def measure_stage(stage, rows, tmpdir, repeat=3, memory=True):
+    setup, _ = STAGES[stage]
+    run = setup(rows, tmpdir)
+    before = reference_seconds()
+    seconds, spread, peak_mb = measure(run, repeat, memory)
+    return {
+        'stage': stage,
+        'rows': rows,
+        'seconds': seconds,
+        'spread': spread,
+        # 參考耗時前後各量一次取小者：只會讓比較更嚴格，不會因參考剛好被打斷而放寬
+        'reference': min(before, reference_seconds()),
+        'rows_per_sec': rows / seconds if seconds > 0 else None,
+        'peak_mb': peak_mb,
+    }
+
+
+def run_benchmarks(stages, sizes, repeat=3, memory=True):
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for stage in stages:
+            max_rows = STAGES[stage][1]
+            for rows in sizes:
+                if max_rows is not None and rows > max_rows:
+                    continue
+                result = measure_stage(stage, rows, tmpdir, repeat, memory)
+                results.append(result)
+                print(_format_row(result), flush=True)
+    return results
+
+
+def _format_row(r):
+    peak = f"{r['peak_mb']:10.1f}" if r['peak_mb'] is not None else f"{'-':>10}"
+    return (f"{r['stage']:<18} {r['rows']:>11,} {r['seconds'] * 1000:12.2f} {r['spread'] * 1000:10.2f} "
+            f"{r['rows_per_sec']:>14,.0f} {peak}")
+
+
+def compare(results, baseline, tolerance=0.25, min_seconds=0.001, min_mb=1.0):
+    """與基準比較，回傳退步項目（耗時或記憶體超過基準 × (1 + tolerance)）
+
+    基準耗時先乘上「本次 / 基準」的參考工作量耗時比例（舊基準沒有參考耗時時不調整）。
+    變化量小於雜訊門檻的項目不算退步：耗時為 min_seconds 與兩次離散度較大者 × NOISE_SPREADS
+    取大者（舊基準沒有離散度時只用 min_seconds），記憶體為 min_mb。
+    回傳 [(結果, 指標, 調整後基準值, 本次值)]
+    """
+    base = {(r['stage'], r['rows']): r for r in baseline['results']}
+    regressions = []
+    for r in results:
+        b = base.get((r['stage'], r['rows']))
+        if b is None:
+            continue
+        scale = r['reference'] / b['reference'] if b.get('reference') else 1.0
+        expected = b['seconds'] * scale
+        noise = max(min_seconds, NOISE_SPREADS * max(r['spread'], b.get('spread', 0.0) * scale))
+        if r['seconds'] > expected * (1 + tolerance) and r['seconds'] - expected > noise:
+            regressions.append((r, 'seconds', expected, r['seconds']))
+        if (r['peak_mb'] is not None and b.get('peak_mb') is not None
+                and r['peak_mb'] > b['peak_mb'] * (1 + tolerance) and r['peak_mb'] - b['peak_mb'] > min_mb):
+            regressions.append((r, 'peak_mb', b['peak_mb'], r['peak_mb']))
+    return regressions
+
+
+def recheck(regressions, baseline, tolerance, repeat=3, memory=True, runs=RECHECK_RUNS):
+    """把退步的階段重新量測 runs 次，每次都仍退步的才保留（排除量測當下短暫的機器負載）"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for _ in range(runs):
+            if not regressions:
+                break
+            keys = {(r['stage'], r['rows']) for r, *_ in regressions}
+            print(f"重新量測 {len(keys)} 組疑似退步的項目", flush=True)
+            again = [measure_stage(stage, rows, tmpdir, repeat, memory) for stage, rows in sorted(keys)]
+            still = {(r['stage'], r['rows'], metric) for r, metric, *_ in compare(again, baseline, tolerance)}
+            regressions = [reg for reg in regressions if (reg[0]['stage'], reg[0]['rows'], reg[1]) in still]
+    return regressions
+
+
+def environment():
+    return {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="各分析階段效能測試（合成資料）")
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES), help="要測試的階段")
+    parser.add_argument('--sizes', nargs='+', type=int, default=DEFAULT_SIZES, help="列數（1k ~ 10M）")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="每組最少重複次數，取最佳耗時（單次不到 50 ms 的階段會自動多跑）")
+    parser.add_argument('--no-memory', action='store_true', help="不量測記憶體峰值（省下一次 tracemalloc 執行）")
+    parser.add_argument('--save', help="把結果存成 JSON 基準")
+    parser.add_argument('--compare', help="與 JSON 基準比較，退步時結束碼為 1")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="容許退步比例")
+    args = parser.parse_args()
+
+    print(f"{'階段':<16} {'列數':>9} {'耗時(ms)':>10} {'離散(ms)':>8} {'每秒列數':>10} {'峰值(MB)':>8}")
+    results = run_benchmarks(args.stages, args.sizes, args.repeat, not args.no_memory)
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({'environment': environment(), 'results': results}, f, ensure_ascii=False, indent=2)
+        print(f"基準已儲存至: {args.save}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = recheck(compare(results, baseline, args.tolerance), baseline, args.tolerance,
+                              args.repeat, not args.no_memory)
+        print()
+        print(f"與基準比較（{args.compare}，{baseline['environment']['date']}，容許 {args.tolerance:.0%}）")
+        if not regressions:
+            print("沒有退步")
+            return
+        for r, metric, before, after in regressions:
+            print(f"退步 {r['stage']} {r['rows']:,} 列 {metric}: {before:.4g} → {after:.4g}（{after / before:.2f}x）")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,6 @@
+"""
+各回測共用的工具模組（資料讀取、快取）
+
+腳本執行時需先把 repo 根目錄加入 sys.path：
+    sys.path.insert(0, os.path.dirname(SCRIPT_DIR))
+"""
@@ -0,0 +1,126 @@
+"""
+多來源對齊面板（Shiller 月數據 + Yahoo 日數據 + FRED 日數據）
+
+三個來源的頻率與期間不同：Shiller 1871 起（月）、Yahoo 1970 起（日）、FRED 2016 起（日）。
+這裡把它們合成一張日頻面板，全部用排序後的 searchsorted 完成，沒有逐列迴圈：
+- 日期：Yahoo 與 FRED 有值日期的聯集（排序合併），兩者都沒有值的日子（假日）不列入
+- 收盤價：yahoo_close、fred_close 依日期散佈到面板上；close 以 Yahoo 為主、缺值時用 FRED
+- 月基本面：CAPE、股息、盈餘、CPI、GS10 以「所在月份」as-of 對應 Shiller，
+  各欄缺值向前填補到最後一個已知值；shiller_age 為使用的 Shiller 月份距今幾個月
+  （Shiller 資料結束後仍沿用最後一筆，可據此判斷是否過舊）
+- 差異旗標（flags，位元組合）：Yahoo 與 FRED 重疊期間內，收盤價相對差超過容許值
+  （MISMATCH），或只有其中一方有值（YAHOO_MISSING / FRED_MISSING）
+
+面板的數值存成一個 (欄位 × 日期) 的 float64 區塊，column() 取出的每一欄、
+panel_frame() 組成的 DataFrame 都是這個區塊的 view，不複製資料。
+"""
+
+import numpy as np
+import pandas as pd
+
+FUNDAMENTALS = ('cape', 'dividend', 'earnings', 'cpi', 'gs10')
+
+# 差異旗標位元
+MISMATCH = 1
+YAHOO_MISSING = 2
+FRED_MISSING = 4
+
+
+def asof_positions(keys, targets):
+    """每個 target 在遞增 keys 中「≤ target 的最後一個」位置，沒有則為 -1"""
+    return np.searchsorted(keys, targets, side='right') - 1
+
+
+def last_valid_positions(values):
+    """每個位置往前（含自己）最後一個非 NaN 值的位置，沒有則為 -1；向前填補用"""
+    idx = np.where(np.isnan(values), -1, np.arange(len(values)))
+    return np.maximum.accumulate(idx) if len(idx) else idx
+
+
+def asof_ffill(keys, values, targets):
+    """把 (keys, values) as-of 對應到 targets 並向前填補缺值，回傳 (值, 來源位置)；來源位置 -1 為 NaN"""
+    values = np.asarray(values, dtype=np.float64)
+    pos = asof_positions(keys, targets)
+    src = np.where(pos >= 0, last_valid_positions(values)[np.clip(pos, 0, None)], -1)
+    out = np.where(src >= 0, values[np.clip(src, 0, None)], np.nan)
+    return out, src
+
+
+def scatter(dates, index, values):
+    """把 (index, values) 放到面板日期上（index 必須是 dates 的子集），其餘為 NaN"""
+    out = np.full(len(dates), np.nan)
+    out[np.searchsorted(dates, index)] = values
+    return out
+
+
+def _valid(series):
+    series = series.dropna()
+    return series.index.to_numpy(dtype='datetime64[ns]'), series.to_numpy(dtype=np.float64)
+
+
+def discrepancy_flags(yahoo_close, fred_close, tolerance=1e-4):
+    """Yahoo / FRED 重疊期間（兩者各自第一筆到最後一筆的交集）內的差異旗標"""
+    has_y = ~np.isnan(yahoo_close)
+    has_f = ~np.isnan(fred_close)
+    flags = np.zeros(len(yahoo_close), dtype=np.int8)
+    if not has_y.any() or not has_f.any():
+        return flags
+
+    idx = np.arange(len(flags))
+    lo = max(idx[has_y][0], idx[has_f][0])
+    hi = min(idx[has_y][-1], idx[has_f][-1])
+    overlap = (idx >= lo) & (idx <= hi)
+
+    with np.errstate(invalid='ignore'):
+        diff = np.abs(yahoo_close / fred_close - 1)
+    flags[overlap & has_y & has_f & (diff > tolerance)] |= MISMATCH
+    flags[overlap & ~has_y & has_f] |= YAHOO_MISSING
+    flags[overlap & has_y & ~has_f] |= FRED_MISSING
+    return flags
+
+
+def build_panel(yahoo, fred, shiller, fields=FUNDAMENTALS, tolerance=1e-4):
+    """yahoo / fred：以日期為索引的收盤價 Series；shiller：load_shiller 的 DataFrame
+
+    回傳 dict：dates（datetime64[ns]）、columns（欄名）、values（欄位 × 日期 float64 區塊）、
+    flags（int8 差異旗標）
+    """
+    y_dates, y_close = _valid(yahoo)
+    f_dates, f_close = _valid(fred)
+    dates = np.union1d(y_dates, f_dates)
+
+    yahoo_close = scatter(dates, y_dates, y_close)
+    fred_close = scatter(dates, f_dates, f_close)
+    close = np.where(np.isnan(yahoo_close), fred_close, yahoo_close)
+
+    months = shiller.index.asi8
+    bar_months = pd.DatetimeIndex(dates).to_period('M').asi8
+    row = asof_positions(months, bar_months)
+    age = np.where(row >= 0, bar_months - months[np.clip(row, 0, None)], np.nan)
+
+    columns = ['close', 'yahoo_close', 'fred_close', *fields, 'shiller_age']
+    values = np.empty((len(columns), len(dates)))
+    values[0], values[1], values[2] = close, yahoo_close, fred_close
+    for i, field in enumerate(fields, 3):
+        values[i] = asof_ffill(months, shiller[field].to_numpy(), bar_months)[0]
+    values[-1] = age
+
+    return {
+        'dates': dates,
+        'columns': columns,
+        'values': values,
+        'flags': discrepancy_flags(yahoo_close, fred_close, tolerance),
+    }
+
+
+def column(panel, name):
+    """單一欄位的 view（唯讀使用；寫入會改到面板本身）"""
+    return panel['values'][panel['columns'].index(name)]
+
+
+def panel_frame(panel):
+    """面板 → 以日期為索引的 DataFrame；各欄與面板共用記憶體，另附 flags 欄"""
+    index = pd.DatetimeIndex(panel['dates'], name='Date')
+    df = pd.DataFrame(panel['values'].T, index=index, columns=panel['columns'], copy=False)
+    df['flags'] = panel['flags']
+    return df
@@ -0,0 +1,68 @@
+"""
+NBER 景氣循環表與批次標記
+
+循環表由 load_nber_cycles 讀入的 NBER 年表轉成兩個遞增的邊界陣列（高峰、谷底的月序數）。
+第 k 個循環 = 擴張期 [谷底 k-1, 高峰 k) + 衰退期 [高峰 k, 谷底 k)，皆為左閉右開。
+
+任何 K 棒（月、日、合成序列）只要換成月序數，一次 searchsorted 就能得到：
+    cycle   所屬循環編號（= 之前已出現的谷底數；最後一個谷底之後為 len(表)，即進行中的擴張）
+    phase   EXPANSION / RECESSION
+    to_peak 距離下一個高峰的月數（高峰當月為 0；之後沒有已知高峰為 -1；label_years 以年為單位）
+"""
+
+import numpy as np
+import pandas as pd
+
+EXPANSION = 0
+RECESSION = 1
+
+
+def cycle_boundaries(cycles):
+    """load_nber_cycles 的表 → (高峰, 谷底) 月序數陣列，依時間排序"""
+    peaks = pd.PeriodIndex(cycles['peak']).asi8
+    troughs = pd.PeriodIndex(cycles['trough']).asi8
+    order = np.argsort(peaks, kind='stable')
+    return peaks[order], troughs[order]
+
+
+def label_bars(keys, peaks, troughs):
+    """以遞增的整數邊界批次標記 keys（月序數、年份等同一刻度的整數）
+
+    回傳 dict：cycle、phase、to_peak（見模組說明），形狀皆與 keys 相同
+    """
+    keys = np.asarray(keys, dtype=np.int64)
+    peaks = np.asarray(peaks, dtype=np.int64)
+    troughs = np.asarray(troughs, dtype=np.int64)
+
+    cycle = np.searchsorted(troughs, keys, side='right')
+    current_peak = peaks[np.minimum(cycle, len(peaks) - 1)]
+    in_recession = (cycle < len(peaks)) & (keys >= current_peak)
+    phase = np.where(in_recession, RECESSION, EXPANSION).astype(np.int8)
+
+    nxt = np.searchsorted(peaks, keys, side='left')
+    to_peak = np.where(nxt < len(peaks), peaks[np.minimum(nxt, len(peaks) - 1)] - keys, -1)
+    return {'cycle': cycle, 'phase': phase, 'to_peak': to_peak}
+
+
+def month_ordinals(dates):
+    """PeriodIndex / DatetimeIndex / 日期陣列 / 月序數 → 月序數陣列"""
+    if isinstance(dates, pd.PeriodIndex):
+        return dates.asfreq('M').asi8
+    dates = np.asarray(dates)
+    if np.issubdtype(dates.dtype, np.integer):
+        return dates.astype(np.int64)
+    return pd.DatetimeIndex(dates).to_period('M').asi8
+
+
+def label_months(dates, cycles):
+    """月或日 K 棒的循環標記（日資料以所在月份判斷，to_peak 單位為月）"""
+    peaks, troughs = cycle_boundaries(cycles)
+    return label_bars(month_ordinals(dates), peaks, troughs)
+
+
+def label_years(years, cycles):
+    """日曆年的循環標記：高峰到谷底所跨的年份都算衰退年，谷底的次年起才算擴張"""
+    peaks, troughs = cycle_boundaries(cycles)
+    peak_years = pd.PeriodIndex.from_ordinals(peaks, freq='M').year.to_numpy()
+    trough_years = pd.PeriodIndex.from_ordinals(troughs, freq='M').year.to_numpy()
+    return label_bars(years, peak_years, trough_years + 1)
@@ -0,0 +1,129 @@
+"""
+事件研究：以事件日為中心對齊報酬路徑
+
+把每個事件前後 before / after 根 K 棒的價格，換算成「相對事件當根的累積報酬」，
+疊成 (事件數, before + after + 1) 的對齊矩陣，再向量化計算平均、中位數、分位數
+與勝率（累積報酬 > 0 的比例）曲線。月資料（Shiller）與日資料（Yahoo）皆可，
+事件以 K 棒位置表示，可用 event_positions 從日期轉換。
+
+batch_event_study 一次處理多組事件（例如各跌幅門檻偵測到的熊市起點）：
+所有事件一起取值，再依組別分段統計，不逐組迴圈。
+"""
+
+import numpy as np
+
+QUANTILES = (0.1, 0.25, 0.75, 0.9)
+
+
+def event_positions(bar_keys, event_keys):
+    """事件時間 → K 棒位置（第一根 ≥ 事件時間的 K 棒），早於第一根或晚於最後一根為 -1
+
+    bar_keys 為遞增的 K 棒時間（datetime64 或月序數），event_keys 同型別
+    """
+    bar_keys = np.asarray(bar_keys)
+    event_keys = np.asarray(event_keys)
+    pos = np.searchsorted(bar_keys, event_keys, side='left')
+    pos[(pos >= len(bar_keys)) | (event_keys < bar_keys[0])] = -1
+    return pos
+
+
+def align_paths(prices, positions, before=60, after=60):
+    """(事件數, before + after + 1) 累積報酬矩陣，欄 before 為事件當根（= 0）
+
+    超出資料範圍或價格缺值處為 NaN；位置為 -1 的事件整列 NaN
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    positions = np.asarray(positions, dtype=np.int64)
+    idx = positions[:, None] + np.arange(-before, after + 1)
+    valid = (idx >= 0) & (idx < len(prices)) & (positions[:, None] >= 0)
+    window = np.full(idx.shape, np.nan)
+    window[valid] = prices[idx[valid]]
+    base = window[:, before:before + 1]
+    return window / base - 1
+
+
+def path_stats(paths, quantiles=QUANTILES):
+    """單組事件的統計曲線：mean、median、quantiles (q, L)、hit_rate、count"""
+    stats = grouped_stats(paths, np.zeros(len(paths), dtype=np.int64), 1, quantiles)
+    return {name: values[0] for name, values in stats.items()}
+
+
+def batch_event_study(prices, event_sets, before=60, after=60, quantiles=QUANTILES):
+    """多組事件一次計算，回傳各統計量的 (組數, L) 陣列（quantiles 為 (組數, q, L)）
+
+    event_sets: list，每個元素為一組事件的 K 棒位置陣列；另回傳對齊矩陣 paths
+    與每列所屬組別 group
+    """
+    sizes = [len(s) for s in event_sets]
+    positions = np.concatenate([np.asarray(s, dtype=np.int64) for s in event_sets] + [np.zeros(0, np.int64)])
+    group = np.repeat(np.arange(len(event_sets)), sizes)
+    paths = align_paths(prices, positions, before, after)
+
+    stats = grouped_stats(paths, group, len(event_sets), quantiles)
+    stats['paths'] = paths
+    stats['group'] = group
+    return stats
+
+
+def grouped_stats(paths, group, n_sets, quantiles=QUANTILES):
+    """依組別（group 需遞增排序）計算各欄統計量，形狀 (組數, L)"""
+    valid = ~np.isnan(paths)
+    filled = np.where(valid, paths, 0.0)
+    sizes = np.bincount(group, minlength=n_sets)
+    count = _group_sum(valid.astype(np.int64), sizes)
+    total = _group_sum(filled, sizes)
+    hits = _group_sum((filled > 0).astype(np.int64), sizes)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        hit_rate = hits / count
+    qs = _grouped_quantiles(paths, group, sizes, count, (0.5, *quantiles))
+    return {
+        'mean': mean,
+        'median': qs[:, 0],
+        'quantiles': qs[:, 1:],
+        'hit_rate': hit_rate,
+        'count': count,
+    }
+
+
+def _group_sum(values, sizes):
+    """依組別加總每一欄（列已依組別排序；空組為 0）"""
+    out = np.zeros((len(sizes), values.shape[1]), dtype=values.dtype)
+    nonempty = sizes > 0
+    if nonempty.any():
+        starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+        out[nonempty] = np.add.reduceat(values, starts[nonempty], axis=0)
+    return out
+
+
+def _grouped_quantiles(paths, group, sizes, count, quantiles):
+    """各組各欄的分位數（線性內插，同 np.nanquantile），只排序一次
+
+    每欄以「組別 × 間距 + 值」為排序鍵，排序後同組相鄰、組內由小到大、NaN 排在組尾，
+    再用每組起點 + 分位位置直接取值。
+    """
+    n_sets = len(sizes)
+    out = np.full((n_sets, len(quantiles), paths.shape[1]), np.nan)
+    valid = ~np.isnan(paths)
+    if not valid.any():
+        return out
+
+    lo, hi = np.nanmin(paths), np.nanmax(paths)
+    span = hi - lo + 1.0
+    stride = span + 1.0
+    keyed = np.where(valid, paths - lo, span) + group[:, None] * stride
+    keyed.sort(axis=0)
+
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])[:, None]
+    cols = np.arange(paths.shape[1])[None, :]
+    offset = np.arange(n_sets)[:, None] * stride - lo
+    last = len(keyed) - 1
+    for k, q in enumerate(quantiles):
+        pos = q * np.maximum(count - 1, 0)
+        lower = np.floor(pos).astype(np.int64)
+        frac = pos - lower
+        v_lo = keyed[np.minimum(starts + lower, last), cols]
+        v_hi = keyed[np.minimum(starts + np.ceil(pos).astype(np.int64), last), cols]
+        out[:, k] = np.where(count > 0, v_lo + (v_hi - v_lo) * frac - offset, np.nan)
+    return out
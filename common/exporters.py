@@ -0,0 +1,158 @@
+"""
+輸出工具：Excel（openpyxl write-only 串流模式）與 CSV / Parquet
+
+Excel 一律用 write-only 模式逐列寫入，樣式預先註冊為具名樣式，儲存格只引用名稱，
+不會每格各自建立 Alignment / Fill 物件。大型資料表（日數據、參數掃描結果）
+只有表頭套樣式、資料列直接整列 append，寫入成本與列數成正比。
+
+sheet 規格（dict）：
+    title    工作表名稱
+    headers  欄位名稱 list
+    rows     可迭代的資料列（每列一個 list），可為 generator
+    widths   （選用）各欄寬度 list
+    align    （選用）各欄對齊 list，'left'（靠左自動換行）或 'center'；
+             有設定時資料列才會套用框線與樣式
+    shade    （選用）row_index, row → bool，True 的列使用灰底（例如依週期灰白相間）
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, NamedStyle, PatternFill, Side
+from openpyxl.utils import get_column_letter
+
+from common.profiling import stage
+
+_THIN = Side(style='thin')
+_BORDER = Border(left=_THIN, right=_THIN, top=_THIN, bottom=_THIN)
+_FILLS = {
+    'white': PatternFill(start_color="FFFFFF", end_color="FFFFFF", fill_type="solid"),
+    'gray': PatternFill(start_color="F2F2F2", end_color="F2F2F2", fill_type="solid"),
+}
+_ALIGNMENTS = {
+    'left': Alignment(vertical='center', wrap_text=True),
+    'center': Alignment(horizontal='center', vertical='center'),
+}
+
+
+def _build_styles():
+    styles = [NamedStyle(
+        name='header',
+        fill=PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid"),
+        font=Font(bold=True, color="FFFFFF"),
+        alignment=Alignment(horizontal='center', vertical='center'),
+        border=_BORDER,
+    )]
+    for fill_name, fill in _FILLS.items():
+        for align_name, alignment in _ALIGNMENTS.items():
+            styles.append(NamedStyle(name=f'{align_name}_{fill_name}', fill=fill,
+                                     alignment=alignment, border=_BORDER))
+    return styles
+
+
+def write_xlsx(path, sheets):
+    """以 write-only 模式串流寫出多個工作表（規格見模組說明）"""
+    wb = Workbook(write_only=True)
+    for style in _build_styles():
+        wb.add_named_style(style)
+
+    for sheet in sheets:
+        ws = wb.create_sheet(sheet['title'])
+        for col, width in enumerate(sheet.get('widths') or [], 1):
+            ws.column_dimensions[get_column_letter(col)].width = width
+
+        ws.append([_styled(ws, h, 'header') for h in sheet['headers']])
+
+        align = sheet.get('align')
+        shade = sheet.get('shade')
+        if align is None:
+            for row in sheet['rows']:
+                ws.append(row)
+            continue
+        for i, row in enumerate(sheet['rows']):
+            fill = 'gray' if shade and shade(i, row) else 'white'
+            ws.append([_styled(ws, v, f'{a}_{fill}') for v, a in zip(row, align)])
+
+    wb.save(path)
+
+
+def _styled(ws, value, style):
+    cell = WriteOnlyCell(ws, value=value)
+    cell.style = style
+    return cell
+
+
+def frame_rows(df, index=False):
+    """DataFrame → 可直接寫入 Excel 的列（NaN → 空白，Period / Timestamp → 字串 / datetime）"""
+    if index:
+        df = df.reset_index()
+    columns = []
+    for _, col in df.items():
+        if isinstance(col.dtype, pd.PeriodDtype):
+            col = col.astype(str)
+        values = col.to_numpy(dtype=object)
+        columns.append(values)
+    for row in zip(*columns):
+        yield [_clean(v) for v in row]
+
+
+def _clean(value):
+    if value is None:
+        return None
+    if isinstance(value, (float, np.floating)):
+        return None if math.isnan(value) else float(value)
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.bool_):
+        return bool(value)
+    if value is pd.NaT:
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    return value
+
+
+def frame_sheet(df, title, index=False, widths=None):
+    """DataFrame → sheet 規格（表頭套樣式，資料列不套樣式）"""
+    headers = ([str(n) for n in df.index.names] if index else []) + [str(c) for c in df.columns]
+    return {'title': title, 'headers': headers, 'rows': frame_rows(df, index), 'widths': widths}
+
+
+def write_csv(path, df, index=False):
+    """CSV 輸出（utf-8-sig，Excel 直接開啟中文不會亂碼）"""
+    df.to_csv(path, index=index, encoding='utf-8-sig')
+
+
+def write_parquet(path, df, index=False):
+    """Parquet 輸出，需要 pyarrow 或 fastparquet"""
+    df.to_parquet(path, index=index)
+
+
+def export_frames(base_path, frames, formats=('xlsx',), index=False):
+    """把多個 DataFrame 輸出為指定格式
+
+    base_path 不含副檔名；xlsx 會把 frames 寫進同一本活頁簿的多個工作表，
+    csv / parquet 則每個工作表一檔（<base_path>_<工作表>.csv）。回傳所有輸出路徑。
+    """
+    paths = []
+    for fmt in formats:
+        with stage(f'export_{fmt}', rows=sum(len(df) for df in frames.values())):
+            paths.extend(_export(base_path, frames, fmt, index))
+    return paths
+
+
+def _export(base_path, frames, fmt, index):
+    if fmt == 'xlsx':
+        path = f'{base_path}.xlsx'
+        write_xlsx(path, [frame_sheet(df, title, index) for title, df in frames.items()])
+        return [path]
+    writer = {'csv': write_csv, 'parquet': write_parquet}[fmt]
+    paths = []
+    for title, df in frames.items():
+        path = f'{base_path}.{fmt}' if len(frames) == 1 else f'{base_path}_{title}.{fmt}'
+        writer(path, df, index)
+        paths.append(path)
+    return paths
@@ -0,0 +1,122 @@
+"""
+輸入檔欄位快取
+
+每個輸入 CSV 只解析一次，結果以 .npy（每欄一檔）存到 repo 根目錄的 .cache/inputs/，
+之後直接用 np.load(mmap_mode='r') 開啟，啟動成本只剩開檔。
+
+快取鍵 = 解析函式名稱 + 版本 + 原始檔內容 SHA-1；原始檔內容改變就會產生新的快取，
+舊的快取在寫入新版本時一併刪除。為了避免每次都重新計算雜湊，另外記錄檔案的
+(大小, 修改時間)，兩者都沒變時直接沿用上次的雜湊。
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.path.join(REPO_ROOT, '.cache', 'inputs')
+
+_MANIFEST = 'manifest.json'
+_DIGESTS = 'digests.json'
+_TMP = '.tmp-'
+
+
+def file_digest(path, cache_dir=CACHE_DIR):
+    """原始檔內容的 SHA-1；大小與修改時間沒變時沿用上次算好的結果"""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    digests_path = os.path.join(cache_dir, _DIGESTS)
+    digests = _read_json(digests_path) or {}
+
+    known = digests.get(path)
+    if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+        return known['sha1']
+
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(block)
+    digest = sha1.hexdigest()
+
+    digests[path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha1': digest}
+    os.makedirs(cache_dir, exist_ok=True)
+    _write_json(digests_path, digests)
+    return digest
+
+
+def load_columns(path, parser, version=1, cache_dir=CACHE_DIR, params=None):
+    """回傳 {欄位名稱: np.memmap}；沒有快取（或原始檔已變更）時呼叫 parser(path, **params) 重建
+
+    parser 必須回傳 {欄位名稱: 數值或 datetime64 的 np.ndarray}（不支援 object 陣列，
+    可為多維）。params 為 JSON 可序列化的參數，不同參數各自快取。
+    """
+    params = params or {}
+    digest = file_digest(path, cache_dir)
+    key = f"{parser.__name__}-v{version}-{digest[:20]}"
+    if params:
+        param_digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+        key += f"-{param_digest[:8]}"
+    entry = os.path.join(cache_dir, key)
+
+    if not os.path.exists(os.path.join(entry, _MANIFEST)):
+        columns = parser(path, **params)
+        meta = {'source': os.path.abspath(path), 'parser': parser.__name__, 'params': params}
+        _write_entry(entry, columns, meta)
+        _evict_stale(cache_dir, keep=key, meta=meta)
+
+    return _read_entry(entry)
+
+
+def _write_entry(entry, columns, meta):
+    # 先寫到暫存目錄再整個改名，避免其他程序讀到寫一半的快取；
+    # 暫存目錄名稱每次不同，同一行程的多個 thread 同時建立同一份快取也不會互相覆蓋
+    tmp = tempfile.mkdtemp(prefix=f"{os.path.basename(entry)}{_TMP}", dir=os.path.dirname(entry))
+    names = []
+    for i, (name, values) in enumerate(columns.items()):
+        np.save(os.path.join(tmp, f"{i:03d}.npy"), np.ascontiguousarray(values), allow_pickle=False)
+        names.append(name)
+    _write_json(os.path.join(tmp, _MANIFEST), {**meta, 'columns': names})
+    try:
+        os.rename(tmp, entry)
+    except OSError:
+        # 其他程序 / thread 已先寫好同一份快取，直接沿用
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _read_entry(entry):
+    manifest = _read_json(os.path.join(entry, _MANIFEST))
+    return {
+        name: np.load(os.path.join(entry, f"{i:03d}.npy"), mmap_mode='r')
+        for i, name in enumerate(manifest['columns'])
+    }
+
+
+def _evict_stale(cache_dir, keep, meta):
+    """刪除同一原始檔、同一解析函式與參數的舊快取"""
+    for name in os.listdir(cache_dir):
+        entry = os.path.join(cache_dir, name)
+        # 暫存目錄可能是其他 thread 正在寫的快取
+        if name == keep or _TMP in name or not os.path.isdir(entry):
+            continue
+        manifest = _read_json(os.path.join(entry, _MANIFEST))
+        if manifest and all(manifest.get(k, {}) == v for k, v in meta.items()):
+            shutil.rmtree(entry, ignore_errors=True)
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, data):
+    fd, tmp = tempfile.mkstemp(prefix=f"{os.path.basename(path)}{_TMP}", dir=os.path.dirname(path))
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
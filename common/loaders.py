@@ -0,0 +1,129 @@
+"""
+輸入資料讀取
+
+每種輸入檔一個 parse_* 函式（只在快取失效時執行）與一個 load_* 函式
+（從 input_cache 的 mmap 陣列組出 DataFrame）。
+"""
+
+import numpy as np
+import pandas as pd
+
+from common.input_cache import load_columns
+from common.profiling import stage
+
+# Shiller 欄位 → 英文欄名（數值欄一律轉為 float64）
+SHILLER_COLUMNS = {
+    'S&P Comp.P 名目股價': 'price',
+    'Dividend 年化股息': 'dividend',
+    'Earnings 年化盈餘': 'earnings',
+    'CPI 消費者物價指數': 'cpi',
+    'Date Fraction 日期小數格式': 'date_fraction',
+    'Long Rate GS10 10年期美國公債殖利率': 'gs10',
+    'Real Price 通膨調整後股價': 'real_price',
+    'Real Dividend 通膨調整後股息': 'real_dividend',
+    'Real Total Return Price 通膨調整+股息再投入指數': 'real_total_return',
+    'Real Earnings 通膨調整後盈餘': 'real_earnings',
+    'Real TR Scaled Earnings TR調整後盈餘': 'real_tr_earnings',
+    'CAPE 席勒本益比(10年平均)': 'cape',
+    'TR CAPE Total Return版CAPE': 'tr_cape',
+    'Monthly Total Bond Returns 債券月報酬': 'bond_return',
+    'Real Total Bond Returns 通膨調整後債券報酬': 'real_bond_return',
+}
+# 百分比字串欄位（例如 "13.06%"），轉為百分比數值 13.06
+SHILLER_PCT_COLUMNS = {
+    '10Y Stock Real Return 未來10年股票年化實質報酬': 'fwd10y_stock_real_pct',
+    '10Y Bond Real Return 未來10年債券年化實質報酬': 'fwd10y_bond_real_pct',
+    '10Y Excess Return 股票vs債券超額報酬': 'fwd10y_excess_pct',
+}
+SHILLER_DATE_COL = 'Date 日期(年.月)'
+
+
+def parse_shiller(path):
+    """Shiller 月數據，全部欄位向量化解析
+
+    日期欄「年.月」以數值讀入時 1871.10 會變成 1871.1，因此用算術拆解：
+    年 = floor(x)、月 = round((x - 年) × 100)，不經過字串。
+    """
+    raw = pd.read_csv(path, thousands=',', usecols=[SHILLER_DATE_COL, *SHILLER_COLUMNS, *SHILLER_PCT_COLUMNS])
+    raw = raw[raw[SHILLER_DATE_COL].notna()]
+
+    ym = raw[SHILLER_DATE_COL].to_numpy(dtype=np.float64)
+    year = np.floor(ym).astype(np.int64)
+    month = np.rint((ym - year) * 100).astype(np.int64)
+    # 月份序數（1970-01 為 0），與 pandas 月頻 Period 的 ordinal 相同
+    columns = {'period': (year - 1970) * 12 + (month - 1)}
+
+    for src, name in SHILLER_COLUMNS.items():
+        columns[name] = pd.to_numeric(raw[src], errors='coerce').to_numpy(dtype=np.float64)
+    for src, name in SHILLER_PCT_COLUMNS.items():
+        pct = raw[src].astype(str).str.rstrip('%')
+        columns[name] = pd.to_numeric(pct, errors='coerce').to_numpy(dtype=np.float64)
+    return columns
+
+
+def load_shiller_columns(path):
+    """Shiller 月數據的欄位陣列（唯讀 mmap），'period' 為月份序數"""
+    return load_columns(path, parse_shiller, version=2)
+
+
+def load_shiller(path):
+    """Shiller 月數據 DataFrame，索引為月頻 PeriodIndex，各欄為 float64
+
+    主要欄位：real_price、real_total_return、cpi、gs10、cape、tr_cape、
+    bond_return、real_bond_return；完整對照見 SHILLER_COLUMNS / SHILLER_PCT_COLUMNS
+    """
+    with stage('load_shiller') as st:
+        columns = dict(load_shiller_columns(path))
+        index = pd.PeriodIndex.from_ordinals(columns.pop('period'), freq='M')
+        index.name = 'Month'
+        st.rows = len(index)
+        return pd.DataFrame(columns, index=index)
+
+
+def load_nber_cycles(path):
+    """NBER 經濟週期（官方 1854 起）：peak / trough 為月頻 Period，另附衰退月數與說明"""
+    with stage('load_nber') as st:
+        raw = pd.read_excel(path, sheet_name=0)
+        st.rows = len(raw)
+    return pd.DataFrame({
+        'peak': pd.PeriodIndex(raw['景氣高峰(Peak)'], freq='M'),
+        'trough': pd.PeriodIndex(raw['景氣谷底(Trough)'], freq='M'),
+        'recession_months': raw['衰退月數'].to_numpy(dtype=np.int64),
+        'description': raw['簡要說明'].to_numpy(),
+    })
+
+
+def parse_yahoo_daily(path):
+    """Yahoo Finance 日數據：三列表頭（Price / Ticker / Date）"""
+    df = pd.read_csv(path, skiprows=[1, 2], index_col=0, parse_dates=True)
+    columns = {'Date': df.index.to_numpy(dtype='datetime64[ns]')}
+    for col in ['Close', 'High', 'Low', 'Open', 'Volume']:
+        columns[col] = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=np.float64)
+    return columns
+
+
+def load_yahoo_daily(path):
+    """Yahoo 日數據 DataFrame，以日期為索引"""
+    with stage('load_yahoo') as st:
+        columns = load_columns(path, parse_yahoo_daily)
+        index = pd.DatetimeIndex(columns.pop('Date'), name='Date')
+        st.rows = len(index)
+        return pd.DataFrame(columns, index=index)
+
+
+def parse_fred_daily(path):
+    """FRED 日數據：observation_date, SP500（假日為空值 → NaN）"""
+    df = pd.read_csv(path, parse_dates=['observation_date'])
+    return {
+        'Date': df['observation_date'].to_numpy(dtype='datetime64[ns]'),
+        'SP500': pd.to_numeric(df['SP500'], errors='coerce').to_numpy(dtype=np.float64),
+    }
+
+
+def load_fred_daily(path):
+    """FRED 日數據 DataFrame，以日期為索引"""
+    with stage('load_fred') as st:
+        columns = load_columns(path, parse_fred_daily)
+        index = pd.DatetimeIndex(columns.pop('Date'), name='Date')
+        st.rows = len(index)
+        return pd.DataFrame(columns, index=index)
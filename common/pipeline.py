@@ -0,0 +1,211 @@
+"""
+分析管線（DAG）執行器
+
+每個分析原本是獨立腳本，要產出全部結果只能逐一執行，每支都重新讀一次相同的輸入。
+這裡把讀檔、週期標記、熊市偵測、策略回測、輸出等步驟宣告成有向無環圖的階段，
+一次執行、在記憶體中共用結果：
+
+    stages = {
+        'load_prices': pipeline_stage(lambda: load_daily_prices('yahoo'), inputs=[csv_path]),
+        'bear_detection': pipeline_stage(detect, deps=['load_prices'], params={'decline': 0.2}),
+        'export_bear': pipeline_stage(export, deps=['bear_detection'], outputs=True),
+    }
+    records = run(stages, targets=['export_bear'], workers=4)
+
+- 階段的 run 依 deps 的順序收到上游結果；輸出階段（outputs=True）回傳寫出的檔案路徑
+- 上游完成就送進 thread pool，互不相依的階段同時執行（numpy / pandas / 寫檔大多會釋放 GIL，
+  結果不需序列化即可共用）；上游結果在所有下游用完後即釋放
+- 指紋 = 版本 + 輸入檔內容雜湊（input_cache.file_digest）+ 參數 + 上游指紋，沿用
+  result_cache.cache_key。輸出階段的指紋與上次成功時相同、輸出檔也都還在且內容雜湊與當時
+  寫出的相同就略過（各腳本單獨執行時可能用別的參數覆寫同一個輸出檔，這時會重新輸出）；
+  沒有任何下游需要執行的上游階段也不執行。紀錄存在 .cache/state/pipeline.json
+- 階段內的中間結果若要跨次執行保留，由階段自己用 result_cache.memoize
+"""
+
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from common import profiling
+from common.input_cache import REPO_ROOT, file_digest
+from common.result_cache import cache_key
+
+STATE_PATH = os.path.join(REPO_ROOT, '.cache', 'state', 'pipeline.json')
+
+RAN = '執行'
+UP_TO_DATE = '略過（輸出未變）'
+NOT_NEEDED = '略過（下游不需要）'
+
+
+def pipeline_stage(run, deps=(), inputs=(), params=None, outputs=False, version=1):
+    """宣告一個階段：run(*上游結果)；inputs 為依賴的檔案（資料或程式碼），params 須可 JSON 序列化"""
+    return {
+        'run': run,
+        'deps': tuple(deps),
+        'inputs': tuple(inputs),
+        'params': params or {},
+        'outputs': outputs,
+        'version': version,
+    }
+
+
+def topological_order(stages):
+    """依相依關係排序（同層維持宣告順序）；有未知上游或循環時丟出 ValueError"""
+    for name, spec in stages.items():
+        unknown = [d for d in spec['deps'] if d not in stages]
+        if unknown:
+            raise ValueError(f"階段 {name} 的上游不存在：{', '.join(unknown)}")
+    order, done = [], set()
+    while len(order) < len(stages):
+        ready = [n for n, spec in stages.items() if n not in done and all(d in done for d in spec['deps'])]
+        if not ready:
+            raise ValueError(f"階段相依關係有循環：{', '.join(n for n in stages if n not in done)}")
+        order.extend(ready)
+        done.update(ready)
+    return order
+
+
+def ancestors(stages, names):
+    """names 及其所有上游"""
+    found, todo = set(), list(names)
+    while todo:
+        name = todo.pop()
+        if name not in found:
+            found.add(name)
+            todo.extend(stages[name]['deps'])
+    return found
+
+
+def fingerprints(stages, order=None):
+    """各階段的指紋（不執行任何階段即可算出）"""
+    prints = {}
+    for name in order or topological_order(stages):
+        spec = stages[name]
+        params = {'params': spec['params'], 'deps': [prints[d] for d in spec['deps']]}
+        prints[name] = cache_key(name, spec['inputs'], params, spec['version'])
+    return prints
+
+
+def load_state(path=STATE_PATH):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state, path=STATE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=f"{os.path.basename(path)}.tmp-", dir=os.path.dirname(path))
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+
+def output_digests(paths):
+    """輸出檔的內容雜湊，記在狀態裡供下次比對"""
+    return [file_digest(p) for p in paths]
+
+
+def up_to_date(state, name, fingerprint):
+    """輸出階段上次成功時的指紋相同，輸出檔都還在，且內容與當時寫出的相同"""
+    entry = state.get(name)
+    if entry is None or entry['fingerprint'] != fingerprint or not entry['outputs']:
+        return False
+    if not all(os.path.exists(p) for p in entry['outputs']):
+        return False
+    return entry.get('digests') == output_digests(entry['outputs'])
+
+
+def plan(stages, targets=None, state=None, force=False):
+    """決定要執行的階段 → (執行順序, {略過的階段: 原因}, 指紋)
+
+    targets 預設為所有輸出階段；目標中的輸出階段若已是最新就略過，
+    其餘目標與它們的上游要執行，選到的範圍內沒人需要的上游則略過。
+    """
+    order = topological_order(stages)
+    prints = fingerprints(stages, order)
+    state = {} if state is None else state
+    if targets is None:
+        targets = [n for n in order if stages[n]['outputs']]
+    unknown = [n for n in targets if n not in stages]
+    if unknown:
+        raise ValueError(f"沒有這個階段：{', '.join(unknown)}")
+
+    selected = ancestors(stages, targets)
+    skipped = {}
+    for name in targets:
+        if stages[name]['outputs'] and not force and up_to_date(state, name, prints[name]):
+            skipped[name] = UP_TO_DATE
+    needed = ancestors(stages, [n for n in targets if n not in skipped])
+    for name in selected - needed - set(skipped):
+        skipped[name] = NOT_NEEDED
+    return [n for n in order if n in needed], {n: skipped[n] for n in order if n in skipped}, prints
+
+
+def _run_stage(name, spec, args):
+    with profiling.stage(name):
+        start = time.perf_counter()
+        result = spec['run'](*args)
+        return result, time.perf_counter() - start
+
+
+def run(stages, targets=None, workers=None, force=False, state_path=STATE_PATH, on_done=None):
+    """執行管線，回傳每個階段一筆的紀錄（階段、狀態、耗時、輸出）
+
+    workers 為 thread pool 大小（預設 CPU 核心數）；on_done(紀錄) 在每個階段完成時呼叫。
+    任一階段失敗時不再送出新階段，等執行中的結束後丟出該例外；已完成的輸出階段仍會記錄。
+    """
+    state = load_state(state_path)
+    order, skipped, prints = plan(stages, targets, state, force)
+    records = {name: {'階段': name, '狀態': reason, '耗時(秒)': None, '輸出': []}
+               for name, reason in skipped.items()}
+
+    # 每個結果還有幾個下游要用，用完即釋放
+    consumers = {name: 0 for name in order}
+    for name in order:
+        for dep in stages[name]['deps']:
+            consumers[dep] += 1
+
+    results, running, waiting = {}, {}, list(order)
+    error = None
+    workers = workers or os.cpu_count() or 1
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pipeline') as pool:
+            while waiting or running:
+                if error is None:
+                    for name in [n for n in waiting if all(d in results for d in stages[n]['deps'])]:
+                        waiting.remove(name)
+                        args = [results[d] for d in stages[name]['deps']]
+                        running[pool.submit(_run_stage, name, stages[name], args)] = name
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        result, elapsed = future.result()
+                    except Exception as exc:
+                        error = error or exc
+                        continue
+                    spec = stages[name]
+                    outputs = [str(p) for p in result] if spec['outputs'] else []
+                    if spec['outputs']:
+                        state[name] = {'fingerprint': prints[name], 'outputs': outputs,
+                                       'digests': output_digests(outputs)}
+                    elif consumers[name]:
+                        results[name] = result
+                    for dep in spec['deps']:
+                        consumers[dep] -= 1
+                        if not consumers[dep]:
+                            results.pop(dep, None)
+                    records[name] = {'階段': name, '狀態': RAN, '耗時(秒)': round(elapsed, 2), '輸出': outputs}
+                    if on_done:
+                        on_done(records[name])
+    finally:
+        save_state(state, state_path)
+    if error is not None:
+        raise error
+    return [records[n] for n in topological_order(stages) if n in records]
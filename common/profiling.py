@@ -0,0 +1,233 @@
+"""
+分階段效能紀錄與 Chrome trace 輸出
+
+用 stage() 包住讀檔、計算、彙總、輸出等階段（context manager 或 decorator 皆可）：
+
+    with stage('load') as st:
+        df = load_shiller(path)
+        st.rows = len(df)
+
+    @stage('export')
+    def export(...): ...
+
+enable()（--profile）之後，每個階段結束時記錄牆鐘時間、CPU 時間、列數、行程峰值 RSS，
+並以 tracemalloc 記錄該階段的記憶體峰值（巢狀階段各自計算，峰值堆疊每個 thread 一份）。
+未 enable 時 stage 只是空殼，不累積任何紀錄。
+
+tracemalloc 的峰值是整個行程共用的：多個 thread 同時執行階段（例如分析管線）時，
+重疊期間的峰值無法分給個別階段，這類紀錄標為「行程整體」（peak_scope = 'process'），
+表示該數字是階段期間整個行程的峰值、含其他同時執行的階段。
+
+平行處理：enable() 會把紀錄目錄寫進環境變數，之後建立的子行程（ProcessPoolExecutor
+的 worker）在每個階段結束時把紀錄附加到 <目錄>/<pid>.jsonl。report() 合併所有行程的
+紀錄，寫出 Chrome trace-event JSON（chrome://tracing 或 Perfetto 開啟，每個行程一條泳道，
+落後的 worker 一眼可見）並回傳摘要表。
+"""
+
+import contextlib
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from common.input_cache import REPO_ROOT
+
+_ENV_DIR = 'STOCK_BACKTEST_PROFILE_DIR'
+TRACE_DIR = os.path.join(REPO_ROOT, '.cache', 'profile')
+
+_events = []
+_local = threading.local()  # 每個 thread 的 tracemalloc 峰值堆疊：每層記錄子階段的最大峰值
+_open = {}  # 執行中的階段 → 所在 thread，用來判斷是否與其他 thread 的階段重疊
+_open_lock = threading.Lock()
+
+
+def _peaks():
+    if not hasattr(_local, 'peaks'):
+        _local.peaks = []
+    return _local.peaks
+
+
+def _reset_after_fork():
+    # fork 出的 worker 只有一個 thread，不沿用父行程執行中的階段與鎖
+    global _local, _open_lock
+    _local = threading.local()
+    _open_lock = threading.Lock()
+    _open.clear()
+    _events.clear()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _recording():
+    """主行程 enable() 之後，或繼承紀錄目錄的子行程"""
+    return bool(os.environ.get(_ENV_DIR))
+
+
+class stage(contextlib.ContextDecorator):
+    """一個效能紀錄階段；rows 可在階段內設定（處理的列數）"""
+
+    def __init__(self, name, rows=None):
+        self.name = name
+        self.rows = rows
+
+    def _recreate_cm(self):
+        # 當 decorator 使用時每次呼叫都建立新的紀錄，遞迴或平行呼叫不會共用狀態
+        return stage(self.name, self.rows)
+
+    def __enter__(self):
+        self._recording = _recording()
+        if not self._recording:
+            return self
+        _ensure_worker_tracing()
+        tid = threading.get_ident()
+        with _open_lock:
+            others = [st for st, owner in _open.items() if owner != tid]
+            self._shared = bool(others)
+            for st in others:
+                st._shared = True
+            _open[self] = tid
+        peaks = _peaks()
+        if peaks:
+            peaks[-1] = max(peaks[-1], tracemalloc.get_traced_memory()[1])
+        # 其他 thread 還在量峰值時不重設，以免蓋掉它們的紀錄
+        if not self._shared:
+            tracemalloc.reset_peak()
+        peaks.append(0)
+        self._ts = time.time_ns() // 1000
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        if not self._recording:
+            return False
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        with _open_lock:
+            _open.pop(self, None)
+        peaks = _peaks()
+        peak = max(peaks.pop(), tracemalloc.get_traced_memory()[1])
+        if peaks:
+            peaks[-1] = max(peaks[-1], peak)
+        event = {
+            'name': self.name,
+            'pid': os.getpid(),
+            'tid': threading.get_native_id(),
+            'ts': self._ts,
+            'dur': round(wall * 1e6),
+            'cpu_ms': cpu * 1000,
+            'peak_mb': peak / 2 ** 20,
+            'peak_scope': 'process' if self._shared else 'stage',
+            'rss_mb': _peak_rss_mb(),
+            'rows': self.rows,
+        }
+        _events.append(event)
+        with open(os.path.join(os.environ[_ENV_DIR], f'{os.getpid()}.jsonl'), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(event) + '\n')
+        return False
+
+
+def _peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 單位為 KB，macOS 為 bytes
+    return rss / 2 ** 20 if sys.platform == 'darwin' else rss / 2 ** 10
+
+
+def _ensure_worker_tracing():
+    """子行程繼承環境變數後，第一次進入階段時開啟 tracemalloc"""
+    if os.environ.get(_ENV_DIR) and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def enable(trace_dir=None):
+    """開始詳細紀錄：開啟 tracemalloc，並讓之後建立的子行程把紀錄寫到 trace_dir"""
+    trace_dir = trace_dir or tempfile.mkdtemp(prefix='profile-')
+    os.makedirs(trace_dir, exist_ok=True)
+    os.environ[_ENV_DIR] = trace_dir
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    return trace_dir
+
+
+def events():
+    """所有行程的紀錄（已 enable 時從紀錄目錄合併，否則只有本行程）"""
+    trace_dir = os.environ.get(_ENV_DIR)
+    if not trace_dir:
+        return list(_events)
+    merged = []
+    for name in sorted(os.listdir(trace_dir)):
+        if name.endswith('.jsonl'):
+            with open(os.path.join(trace_dir, name), encoding='utf-8') as f:
+                merged.extend(json.loads(line) for line in f if line.strip())
+    return merged
+
+
+def write_chrome_trace(path, records=None):
+    """Chrome trace-event 格式（完整事件 ph='X'，時間單位 µs）"""
+    records = events() if records is None else records
+    trace = []
+    for e in records:
+        args = {k: e[k] for k in ('cpu_ms', 'peak_mb', 'peak_scope', 'rss_mb', 'rows') if e.get(k) is not None}
+        trace.append({'name': e['name'], 'cat': 'stage', 'ph': 'X', 'ts': e['ts'], 'dur': e['dur'],
+                      'pid': e['pid'], 'tid': e['tid'], 'args': args})
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+    return path
+
+
+def summary(records=None):
+    """依階段彙總：次數、總耗時、最長 / 平均耗時（看出落後的 worker）、CPU、記憶體峰值、列數
+
+    峰值範圍為「行程整體」的階段曾與其他 thread 的階段重疊，記憶體峰值含同時執行的階段
+    """
+    records = events() if records is None else records
+    if not records:
+        return pd.DataFrame()
+    df = pd.DataFrame(records)
+    df['wall_ms'] = df['dur'] / 1000
+    for col in ('peak_mb', 'rows'):
+        df[col] = pd.to_numeric(df[col])
+    if 'peak_scope' not in df:
+        df['peak_scope'] = 'stage'
+    df['shared'] = df['peak_scope'] == 'process'
+    grouped = df.groupby('name', sort=False)
+    counts = grouped.size()
+    return pd.DataFrame({
+        '階段': counts.index,
+        '次數': counts.to_numpy(),
+        '行程數': grouped['pid'].nunique().to_numpy(),
+        '總耗時(ms)': grouped['wall_ms'].sum().round(1).to_numpy(),
+        '最長(ms)': grouped['wall_ms'].max().round(1).to_numpy(),
+        '平均(ms)': grouped['wall_ms'].mean().round(1).to_numpy(),
+        'CPU(ms)': grouped['cpu_ms'].sum().round(1).to_numpy(),
+        '記憶體峰值(MB)': grouped['peak_mb'].max().round(1).to_numpy(),
+        '峰值範圍': np.where(grouped['shared'].any().to_numpy(), '行程整體', '階段'),
+        'RSS峰值(MB)': grouped['rss_mb'].max().round(1).to_numpy(),
+        '列數': grouped['rows'].sum(min_count=1).to_numpy(),
+    })
+
+
+def trace_path(name):
+    """--profile 預設的 trace 輸出位置：.cache/profile/<name>.trace.json"""
+    return os.path.join(TRACE_DIR, f'{name}.trace.json')
+
+
+def report(path):
+    """寫出 Chrome trace、印出摘要表，回傳摘要 DataFrame"""
+    records = events()
+    write_chrome_trace(path, records)
+    table = summary(records)
+    print()
+    print("效能紀錄")
+    print(table.to_string(index=False))
+    print(f"Chrome trace 已儲存至: {path}")
+    return table
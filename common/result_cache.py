@@ -0,0 +1,146 @@
+"""
+分析結果快取（content-addressed，磁碟 LRU）
+
+input_cache 只快取輸入檔的解析結果；這裡快取之後的中間結果（週期標籤、偵測到的熊市、
+策略掃描 / 搜尋結果等），輸入與參數都沒變時重跑腳本只需讀回結果：
+
+    episodes = memoize('bear_episodes', lambda: detect_bear_markets(...),
+                       inputs=[csv_path], params={'decline': 0.2, 'rebound': 0.2})
+
+快取鍵 = 名稱 + 版本 + 各輸入檔內容 SHA-1（沿用 input_cache.file_digest，大小與修改時間
+沒變時不重算雜湊）+ 參數 + 程式碼雜湊。只看內容不看路徑，檔案搬移或複製後仍會命中；
+任一輸入檔內容、參數或版本改變就是新的鍵，其他結果不受影響。
+
+程式碼雜湊涵蓋 compute 定義所在的檔案與 common/ 底下的所有模組，修改計算邏輯後
+自動失效；計算實際寫在其他腳本時，呼叫端把該腳本一併放進 inputs。
+
+結果以 pickle 存到 repo 根目錄的 .cache/results/（一個鍵一檔）。命中時更新檔案修改時間，
+寫入新結果後若總大小超過上限，從最久沒用到的開始刪除（LRU），上限預設 512 MB，
+可用環境變數 STOCK_BACKTEST_RESULT_CACHE_MB 調整。disable() 之後一律重新計算、不讀不寫。
+"""
+
+import glob
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import tempfile
+
+import numpy as np
+
+from common.input_cache import REPO_ROOT, file_digest
+
+CACHE_DIR = os.path.join(REPO_ROOT, '.cache', 'results')
+COMMON_DIR = os.path.join(REPO_ROOT, 'common')
+MAX_BYTES = int(float(os.environ.get('STOCK_BACKTEST_RESULT_CACHE_MB', 512)) * (1 << 20))
+
+_SUFFIX = '.pkl'
+_enabled = True
+
+
+def disable():
+    """之後的 memoize 一律重新計算（--no-cache）"""
+    global _enabled
+    _enabled = False
+
+
+def _encode(value):
+    # 參數中的 ndarray 以內容雜湊表示，其他 numpy 純量轉為 Python 數值
+    if isinstance(value, np.ndarray) and not value.dtype.hasobject:
+        arr = np.ascontiguousarray(value)
+        return {'ndarray': hashlib.sha1(arr.view(np.uint8)).hexdigest(),
+                'dtype': arr.dtype.str, 'shape': arr.shape}
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"無法做為快取參數：{type(value).__name__}")
+
+
+def code_files(func=None):
+    """func 定義所在的原始檔（有的話）+ common/*.py，做為快取鍵的程式碼依賴"""
+    files = sorted(glob.glob(os.path.join(COMMON_DIR, '*.py')))
+    try:
+        source = inspect.getsourcefile(func) if func is not None else None
+    except TypeError:
+        source = None
+    if source and os.path.abspath(source) not in files:
+        files.insert(0, os.path.abspath(source))
+    return files
+
+
+def cache_key(name, inputs=(), params=None, version=1):
+    """名稱 + 版本 + 輸入檔內容雜湊 + 參數 → 40 字元的鍵"""
+    payload = {
+        'name': name,
+        'version': version,
+        'inputs': [file_digest(path) for path in inputs],
+        'params': params or {},
+    }
+    text = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=_encode)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def memoize(name, compute, inputs=(), params=None, version=1, cache_dir=CACHE_DIR, max_bytes=MAX_BYTES):
+    """有快取時讀回結果，否則呼叫 compute() 並存起來
+
+    inputs 為結果所依賴的輸入檔路徑（資料或其他腳本）；params 為 JSON 可序列化的參數
+    （可含 ndarray），只影響效能的參數（例如 worker 數）不要放進來。
+    """
+    if not _enabled:
+        return compute()
+
+    key = cache_key(name, [*inputs, *code_files(compute)], params, version)
+    entry = os.path.join(cache_dir, f"{name}-{key}{_SUFFIX}")
+    try:
+        with open(entry, 'rb') as f:
+            value = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        # 沒有快取，或寫壞 / pickle 格式不相容：重新計算並覆寫
+        pass
+    else:
+        _touch(entry)
+        return value
+
+    value = compute()
+    os.makedirs(cache_dir, exist_ok=True)
+    # 先寫到暫存檔再改名，避免其他程序讀到寫一半的結果；暫存檔名每次不同，
+    # 同一行程的多個 thread 同時算同一個鍵時各寫各的，最後改名的覆蓋（內容相同）
+    fd, tmp = tempfile.mkstemp(prefix=f"{os.path.basename(entry)}.tmp-", dir=cache_dir)
+    with os.fdopen(fd, 'wb') as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, entry)
+    evict(cache_dir, max_bytes)
+    return value
+
+
+def evict(cache_dir=CACHE_DIR, max_bytes=MAX_BYTES):
+    """總大小超過 max_bytes 時，依最後使用時間由舊到新刪除；回傳刪除的檔數"""
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith(_SUFFIX):
+            continue
+        try:
+            stat = os.stat(os.path.join(cache_dir, name))
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime_ns, stat.st_size, name))
+
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(cache_dir, name))
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    return removed
+
+
+def _touch(entry):
+    try:
+        os.utime(entry)
+    except OSError:
+        pass
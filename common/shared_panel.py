@@ -0,0 +1,62 @@
+"""
+多序列價格面板與共用記憶體
+
+align_panel 把多條日期不同的序列（各檔股票、各國指數）對齊成一個
+(日期 × 序列) 的 float64 矩陣，日期取聯集、缺的格子為 NaN。
+
+shared_arrays / attach_arrays 把面板等陣列放進 multiprocessing.shared_memory：
+主程序建立一次，process pool 的 worker 在 initializer 依名稱 attach，
+任務只需傳欄位索引，陣列本身不經過 pickle，也不會在每個 worker 各複製一份。
+"""
+
+import contextlib
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+def align_panel(series):
+    """{名稱: 以日期為索引的 Series} → (日期陣列, (日期 × 序列) float64 矩陣)"""
+    indexes = [s.index.to_numpy(dtype='datetime64[ns]') for s in series.values()]
+    dates = np.unique(np.concatenate(indexes)) if indexes else np.array([], dtype='datetime64[ns]')
+    values = np.full((len(dates), len(series)), np.nan)
+    for j, (index, s) in enumerate(zip(indexes, series.values())):
+        values[np.searchsorted(dates, index), j] = s.to_numpy(dtype=np.float64)
+    return dates, values
+
+
+@contextlib.contextmanager
+def shared_arrays(arrays):
+    """把 {名稱: ndarray} 複製到共用記憶體，yield 可傳給 attach_arrays 的規格；離開時釋放"""
+    handles = []
+    specs = {}
+    try:
+        for name, arr in arrays.items():
+            arr = np.ascontiguousarray(arr)
+            shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+            handles.append(shm)
+            view = np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)
+            view[...] = arr
+            del view  # 還有陣列指向 buf 時 close() 會失敗
+            specs[name] = {'shm': shm.name, 'shape': arr.shape, 'dtype': arr.dtype.str}
+        yield specs
+    finally:
+        for shm in handles:
+            shm.close()
+            shm.unlink()
+
+
+def attach_arrays(specs):
+    """依規格 attach 共用記憶體，回傳 (handles, {名稱: 唯讀 ndarray})
+
+    handles 必須與陣列一起保留（通常放在 worker 的模組層級變數），被回收時陣列就失效
+    """
+    handles = []
+    arrays = {}
+    for name, spec in specs.items():
+        shm = shared_memory.SharedMemory(name=spec['shm'])
+        handles.append(shm)
+        arr = np.ndarray(spec['shape'], dtype=np.dtype(spec['dtype']), buffer=shm.buf)
+        arr.flags.writeable = False
+        arrays[name] = arr
+    return handles, arrays
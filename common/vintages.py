@@ -0,0 +1,122 @@
+"""
+NBER 景氣循環的時點資料（point-in-time vintage）
+
+NBER 的高峰 / 谷底都是事後才公告的（報告中衰退開始平均晚 8.4 個月才宣告），
+但 cycles.py 的標記用的是事後確定的日期。這裡記錄每個轉折點「何時成為已知」，
+回答「在 t 日當時知道哪些轉折點」，讓回測只用當時拿得到的資訊：
+
+    vintage = build_vintages(load_nber_cycles(path), peak_lag=8, trough_lag=15)
+    known_at(vintage, '2008-06-30')      # 當時已知的高峰 / 谷底（月序數）
+    known_phase(vintage, prices.index)   # 每天「當時認定」的擴張 / 衰退
+
+公告日：轉折月份 + lag 個月的第一天（lag = 0 時等於事後標記）；official=True 時，
+1980 年之後有正式公告日的轉折點改用 NBER_ANNOUNCEMENTS，其餘仍用 lag 推算。
+
+轉折點依公告日排序成一個遞增陣列（vintage index）：
+- 單一時點查詢用 bisect 找出已公告的事件數，再切出已知的高峰 / 谷底，每秒可查數萬次
+- 整段日期用 searchsorted 一次查完；「當時認定的階段」取已公告事件中轉折月份最晚的那一個
+  （高峰 → 衰退、谷底 → 擴張），高峰與谷底的延遲不同、公告順序與發生順序不一致時也成立
+"""
+
+import bisect
+
+import numpy as np
+import pandas as pd
+
+from common.cycles import EXPANSION, RECESSION
+
+PEAK = 0
+TROUGH = 1
+
+# NBER 景氣循環認定委員會的正式公告日（1978 年成立後；更早的轉折點沒有正式公告）
+NBER_ANNOUNCEMENTS = {
+    (PEAK, '1980-01'): '1980-06-03',
+    (TROUGH, '1980-07'): '1981-07-08',
+    (PEAK, '1981-07'): '1982-01-06',
+    (TROUGH, '1982-11'): '1983-07-08',
+    (PEAK, '1990-07'): '1991-04-25',
+    (TROUGH, '1991-03'): '1992-12-22',
+    (PEAK, '2001-03'): '2001-11-26',
+    (TROUGH, '2001-11'): '2003-07-17',
+    (PEAK, '2007-12'): '2008-12-01',
+    (TROUGH, '2009-06'): '2010-09-20',
+    (PEAK, '2020-02'): '2020-06-08',
+    (TROUGH, '2020-04'): '2021-07-19',
+}
+
+
+def _days(values):
+    """日期 → 自 1970-01-01 起的日序數（int64）"""
+    return pd.DatetimeIndex(np.atleast_1d(values)).to_numpy().astype('datetime64[D]').astype(np.int64)
+
+
+def _month_start_days(month_ordinals):
+    return _days(pd.PeriodIndex.from_ordinals(month_ordinals, freq='M').to_timestamp())
+
+
+def official_lags():
+    """正式公告的平均延遲月數 (高峰, 谷底)；公告日所在月份 - 轉折月份"""
+    lags = {PEAK: [], TROUGH: []}
+    for (kind, month), announced in NBER_ANNOUNCEMENTS.items():
+        lags[kind].append(pd.Period(announced, freq='M').ordinal - pd.Period(month, freq='M').ordinal)
+    return float(np.mean(lags[PEAK])), float(np.mean(lags[TROUGH]))
+
+
+def build_vintages(cycles, peak_lag=0, trough_lag=0, official=False):
+    """load_nber_cycles 的表 → vintage index（dict）
+
+    known（公告日序數，遞增）、turn（轉折月序數）、kind（PEAK / TROUGH），皆依公告日排序；
+    latest_turn / latest_kind 為前 i+1 個已公告事件中轉折月份最晚的一個；
+    known_list 為 known 的 list（bisect 用）
+    """
+    peaks = pd.PeriodIndex(cycles['peak']).asi8
+    troughs = pd.PeriodIndex(cycles['trough']).asi8
+    turn = np.concatenate([peaks, troughs])
+    kind = np.concatenate([np.full(len(peaks), PEAK), np.full(len(troughs), TROUGH)]).astype(np.int8)
+    lag = np.where(kind == PEAK, peak_lag, trough_lag).astype(np.int64)
+    known = _month_start_days(turn + lag)
+
+    if official:
+        months = pd.PeriodIndex.from_ordinals(turn, freq='M').astype(str)
+        for i, (k, month) in enumerate(zip(kind, months)):
+            announced = NBER_ANNOUNCEMENTS.get((int(k), month))
+            if announced is not None:
+                known[i] = _days(announced)[0]
+
+    order = np.lexsort((turn, known))
+    known, turn, kind = known[order], turn[order], kind[order]
+    latest = np.maximum.accumulate(turn)
+    # 轉折月份不重複，依月份找回前綴最大值對應的事件類型
+    by_turn = np.argsort(turn)
+    latest_kind = kind[by_turn[np.searchsorted(turn[by_turn], latest)]]
+    return {
+        'known': known,
+        'turn': turn,
+        'kind': kind,
+        'latest_turn': latest,
+        'latest_kind': latest_kind,
+        'known_list': known.tolist(),
+    }
+
+
+def known_count(vintage, date):
+    """date 當天（含）已公告的事件數；date 為日序數或可轉成 Timestamp 的值"""
+    day = date if isinstance(date, (int, np.integer)) else _days(date)[0]
+    return bisect.bisect_right(vintage['known_list'], day)
+
+
+def known_at(vintage, date):
+    """date 當時已知的高峰與谷底（月序數，遞增）"""
+    n = known_count(vintage, date)
+    turn, kind = vintage['turn'][:n], vintage['kind'][:n]
+    return {'peaks': np.sort(turn[kind == PEAK]), 'troughs': np.sort(turn[kind == TROUGH])}
+
+
+def known_phase(vintage, dates):
+    """每個日期當時認定的階段（EXPANSION / RECESSION，int8）與依據的轉折月序數（尚無已知事件為 -1）"""
+    n = np.searchsorted(vintage['known'], _days(dates), side='right')
+    has = n > 0
+    i = np.maximum(n - 1, 0)
+    phase = np.where(has & (vintage['latest_kind'][i] == PEAK), RECESSION, EXPANSION).astype(np.int8)
+    turn = np.where(has, vintage['latest_turn'][i], -1)
+    return phase, turn
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+持股水位策略蒙地卡羅模擬（區塊 bootstrap）
+
+歷史上只有十多個擴張期，分析 2 的平均數雜訊很大。這裡把 Shiller 月實質總報酬
+切成連續區塊重抽，組成大量合成歷史（路徑 × 月份矩陣），再套用策略 A/B/C：
+- A: 100% 持股
+- B: 衰退前 12 個月到谷底為止降到 50%
+- C: 衰退前 12 個月到谷底為止清倉 0%
+
+區塊保留原本的「是否處於減碼區間」標記，策略在合成路徑上依標記每月調整曝險
+（現金報酬 = 0）。輸出期末財富、最大回撤分布與各策略勝率。
+
+路徑分塊計算，記憶體上限約為 chunk × months × 4 bytes（float32）；每塊使用
+SeedSequence 衍生的獨立種子，結果只取決於 seed，與平行處理程序數無關。
+
+輸出:
+    - output_蒙地卡羅策略分布.xlsx: 各策略期末財富 / 最大回撤的分位數與勝率
+"""
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from position_strategy_backtest import (
+    SCRIPT_DIR, expansion_periods, recession_ends, month_offset, tr_by_month,
+)
+# position_strategy_backtest 已將 repo 根目錄加入 sys.path
+from common import profiling
+from common.exporters import export_frames
+
+# 策略名稱 → 減碼區間內的曝險比例
+STRATEGIES = {'A': 1.0, 'B': 0.5, 'C': 0.0}
+QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+OUTPUT_BASE = os.path.join(SCRIPT_DIR, 'output_蒙地卡羅策略分布')
+
+
+def monthly_returns_and_flags(lead=12):
+    """Shiller 月實質總報酬（float32）與「減碼區間」標記
+
+    第 t 筆報酬為 t-1 月 → t 月；衰退開始前 lead 個月到谷底之間的報酬標記為 True
+    """
+    returns = tr_by_month[1:] / tr_by_month[:-1] - 1
+    flags = np.zeros(len(tr_by_month), dtype=bool)
+    for name, _, rec_start in expansion_periods:
+        if name not in recession_ends:
+            continue
+        start = month_offset(*rec_start) - lead + 1
+        end = month_offset(*recession_ends[name]) + 1
+        flags[start:end] = True
+    flags = flags[1:]
+
+    valid = ~np.isnan(returns)
+    return returns[valid].astype(np.float32), flags[valid]
+
+
+def _simulate_chunk(args):
+    """模擬一塊路徑，回傳各策略的期末財富與最大回撤，形狀 (路徑, 策略)"""
+    returns, flags, exposures, n_paths, months, block, seed = args
+    with profiling.stage('mc_chunk', rows=n_paths):
+        return _simulate_paths(returns, flags, exposures, n_paths, months, block, seed)
+
+
+def _simulate_paths(returns, flags, exposures, n_paths, months, block, seed):
+    rng = np.random.default_rng(seed)
+
+    n_blocks = -(-months // block)
+    starts = rng.integers(0, len(returns) - block + 1, size=(n_paths, n_blocks))
+    idx = (starts[:, :, None] + np.arange(block)).reshape(n_paths, -1)[:, :months]
+    r = returns[idx]
+    f = flags[idx]
+
+    terminal = np.empty((n_paths, len(exposures)), dtype=np.float32)
+    drawdown = np.empty((n_paths, len(exposures)), dtype=np.float32)
+    for k, exposure in enumerate(exposures):
+        growth = 1 + np.where(f, np.float32(exposure), np.float32(1)) * r
+        wealth = np.cumprod(growth, axis=1)
+        peak = np.maximum(np.maximum.accumulate(wealth, axis=1), 1)
+        terminal[:, k] = wealth[:, -1]
+        drawdown[:, k] = np.minimum((wealth / peak).min(axis=1) - 1, 0)
+    return terminal, drawdown
+
+
+def simulate(n_paths=100_000, months=120, block=36, seed=42, lead=12,
+             chunk=50_000, workers=None, strategies=STRATEGIES):
+    """執行蒙地卡羅模擬，回傳 {'terminal', 'drawdown'}，形狀皆為 (路徑, 策略)"""
+    returns, flags = monthly_returns_and_flags(lead)
+    exposures = list(strategies.values())
+
+    sizes = [min(chunk, n_paths - i) for i in range(0, n_paths, chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(returns, flags, exposures, size, months, block, s) for size, s in zip(sizes, seeds)]
+
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    if workers == 1:
+        parts = [_simulate_chunk(t) for t in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_simulate_chunk, tasks))
+
+    return {
+        'strategies': list(strategies),
+        'terminal': np.concatenate([p[0] for p in parts]),
+        'drawdown': np.concatenate([p[1] for p in parts]),
+    }
+
+
+def summarize(result):
+    """分位數表與勝率表（勝率 = 期末財富較高的路徑比例）"""
+    names = result['strategies']
+    rows = []
+    for metric, values in [('期末財富', result['terminal']), ('最大回撤(%)', result['drawdown'] * 100)]:
+        q = np.quantile(values, QUANTILES, axis=0)
+        mean = values.mean(axis=0, dtype=np.float64)
+        for k, name in enumerate(names):
+            row = {'指標': metric, '策略': name, '平均': round(float(mean[k]), 4)}
+            row.update({f'P{int(p * 100)}': round(float(q[i, k]), 4) for i, p in enumerate(QUANTILES)})
+            rows.append(row)
+    distribution = pd.DataFrame(rows)
+
+    terminal = result['terminal']
+    wins = []
+    for i, a in enumerate(names):
+        for j, b in enumerate(names[i + 1:], i + 1):
+            a_wins = float((terminal[:, i] > terminal[:, j]).mean() * 100)
+            b_wins = float((terminal[:, j] > terminal[:, i]).mean() * 100)
+            wins.append({'對戰': f'{a} vs {b}', '勝率(%)': round(a_wins, 2),
+                         '對手勝率(%)': round(b_wins, 2)})
+    return distribution, pd.DataFrame(wins)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="持股水位策略蒙地卡羅模擬（區塊 bootstrap）")
+    parser.add_argument('--paths', type=int, default=100_000, help="合成路徑數")
+    parser.add_argument('--months', type=int, default=120, help="每條路徑的月數")
+    parser.add_argument('--block', type=int, default=36, help="bootstrap 區塊長度（月）")
+    parser.add_argument('--lead', type=int, default=12, help="衰退前幾個月開始減碼")
+    parser.add_argument('--seed', type=int, default=42, help="亂數種子")
+    parser.add_argument('--chunk', type=int, default=50_000, help="每塊路徑數（控制記憶體）")
+    parser.add_argument('--workers', type=int, default=None, help="平行處理程序數（預設為 CPU 核心數）")
+    parser.add_argument('--formats', nargs='+', choices=['xlsx', 'csv', 'parquet'], default=['xlsx'],
+                        help="輸出格式")
+    parser.add_argument('--profile', action='store_true',
+                        help="記錄各階段耗時與記憶體（含 worker），輸出 Chrome trace 到 .cache/profile/")
+    args = parser.parse_args()
+    if args.profile:
+        profiling.enable()
+
+    with profiling.stage('mc_simulate', rows=args.paths):
+        result = simulate(args.paths, args.months, args.block, args.seed, args.lead,
+                          args.chunk, args.workers)
+    with profiling.stage('mc_summarize', rows=args.paths):
+        distribution, wins = summarize(result)
+
+    print(f"路徑數：{args.paths:,}　每條 {args.months} 個月　區塊 {args.block} 個月　seed={args.seed}")
+    print()
+    print(distribution.to_string(index=False))
+    print()
+    print(wins.to_string(index=False))
+
+    paths = export_frames(OUTPUT_BASE, {'分布': distribution, '勝率': wins}, args.formats)
+    print()
+    for path in paths:
+        print(f"已儲存至: {path}")
+
+    if args.profile:
+        profiling.report(profiling.trace_path('monte_carlo'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+滾動區間報酬矩陣
+
+先算一次累積對數總報酬 log(TR)，任何「從 t 月起持有 h 個月」的報酬都是
+exp(log TR[t+h] - log TR[t]) - 1。一次建好所有起始月 × 持有 1~360 個月的矩陣
+（O(n·H)），之後的查詢只是索引，不需要逐筆計算。
+
+矩陣以 common.input_cache 快取（鍵含 Shiller 原始檔雜湊與最大持有月數），
+其他分析可直接 mmap 共用。
+
+執行本檔會列出各擴張期「衰退前 1/2/3 年」報酬在所有同長度區間中的百分位。
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from position_strategy_backtest import SCRIPT_DIR, market_data
+# position_strategy_backtest 已將 repo 根目錄加入 sys.path
+from common.input_cache import load_columns
+from common.loaders import load_shiller_columns
+
+SHILLER_PATH = os.path.join(SCRIPT_DIR, 'input_SP指數(Shiller數據）.csv')
+MAX_HORIZON = 360
+
+
+def build_rolling_returns(total_return, max_horizon=MAX_HORIZON):
+    """(n,) 總報酬指數 → (n, max_horizon) 矩陣，[t, h-1] = 從 t 起持有 h 個月的報酬；超出資料為 NaN"""
+    log_tr = np.log(np.asarray(total_return, dtype=np.float64))
+    padded = np.concatenate([log_tr, np.full(max_horizon, np.nan)])
+    windows = sliding_window_view(padded, max_horizon + 1)[:len(log_tr)]
+    return np.expm1(windows[:, 1:] - windows[:, :1])
+
+
+def parse_rolling_returns(path, max_horizon=MAX_HORIZON):
+    shiller = load_shiller_columns(path)
+    return {
+        'period': np.asarray(shiller['period']),
+        'returns': build_rolling_returns(shiller['real_total_return'], max_horizon),
+    }
+
+
+def load_rolling_returns(path=SHILLER_PATH, max_horizon=MAX_HORIZON):
+    """回傳 {'period': 起始月序數, 'returns': (n, max_horizon) 唯讀 mmap 矩陣}"""
+    return load_columns(path, parse_rolling_returns, params={'max_horizon': max_horizon})
+
+
+def annualize(returns, horizons):
+    """區間報酬 → 年化報酬；horizons 為對應欄的持有月數"""
+    horizons = np.asarray(horizons, dtype=np.float64)
+    return (1 + np.asarray(returns)) ** (12 / horizons) - 1
+
+
+def start_rows(rolling, periods):
+    """月份（Period / 'YYYY-MM' / 月序數）→ 矩陣列號，不在資料範圍內為 -1"""
+    ordinals = np.array([p if isinstance(p, (int, np.integer)) else pd.Period(p, freq='M').ordinal
+                         for p in np.atleast_1d(periods)])
+    first = rolling['period'][0]
+    rows = ordinals - first
+    rows[(rows < 0) | (rows >= len(rolling['period']))] = -1
+    return rows
+
+
+def lookup(rolling, periods, horizon):
+    """從 periods 起持有 horizon 個月的報酬（陣列）"""
+    rows = start_rows(rolling, periods)
+    values = np.asarray(rolling['returns'][np.clip(rows, 0, None), horizon - 1], dtype=np.float64)
+    values[rows < 0] = np.nan
+    return values
+
+
+def percentile_rank(rolling, horizon, values):
+    """values 在所有 horizon 個月區間報酬中的百分位（0~100，≤ 該值的比例）"""
+    column = np.asarray(rolling['returns'][:, horizon - 1])
+    ordered = np.sort(column[~np.isnan(column)])
+    values = np.asarray(values, dtype=np.float64)
+    rank = np.searchsorted(ordered, values, side='right') / len(ordered) * 100
+    return np.where(np.isnan(values), np.nan, rank)
+
+
+def pre_recession_percentiles(rolling, expansions=None):
+    """各擴張期「衰退前第 1/2/3 年」報酬（%）與其在所有 12 個月區間中的百分位
+
+    expansions 省略時用 position_strategy_backtest.market_data() 的擴張期
+    """
+    expansions = market_data()['expansion_periods'] if expansions is None else expansions
+    names = [name for name, _, _ in expansions]
+    rec_starts = np.array([pd.Period(year=y, month=m, freq='M').ordinal for _, _, (y, m) in expansions])
+
+    table = {'週期': names}
+    for years in (1, 2, 3):
+        # 衰退前第 N 年 = 衰退開始往前 12N 個月起算、持有 12 個月
+        ret = lookup(rolling, rec_starts - 12 * years, 12)
+        table[f'衰退前第{years}年(%)'] = np.round(ret * 100, 2)
+        table[f'衰退前第{years}年百分位'] = np.round(percentile_rank(rolling, 12, ret), 1)
+    return pd.DataFrame(table)
+
+
+def main():
+    df = pre_recession_percentiles(load_rolling_returns())
+
+    print("衰退前各年報酬，在 1871 年以來所有 12 個月區間中的百分位")
+    print(df.to_string(index=False))
+    print()
+    print(df.drop(columns='週期').mean().round(2).to_string())
+
+
+if __name__ == '__main__':
+    main()
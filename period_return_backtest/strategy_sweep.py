@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+持股水位策略參數掃描
+
+把「分析 2」的 A/B/C 三種策略推廣為參數網格：
+- 曝險比例 exposure：0% ~ 100%（每 5%）
+- 提前減碼月數 lead：衰退開始前 1 ~ 48 個月降到 exposure
+- 回補延遲月數 lag：NBER 谷底後 0 ~ 24 個月才回到 100%
+
+每個擴張期的財富倍數（現金報酬 = 0，與分析 2 相同在衰退開始時再平衡一次）：
+    P[減碼日]/P[擴張開始]
+    × (1 + exposure × (P[衰退開始]/P[減碼日] - 1))
+    × (1 + exposure × (P[回補日]/P[衰退開始] - 1))
+    × P[評估終點]/P[回補日]
+
+評估終點統一為「谷底 + 最大回補延遲」，讓所有參數組合在同一區間比較。
+lag = 0 時與分析 2 的勝負結果一致（A/B/C 即 exposure = 100%/50%/0%、lead = 12）。
+
+輸出:
+    - output_持股策略參數掃描.npz: 完整結果立方體（週期 × 曝險 × 提前月數 × 回補延遲）
+    - output_持股策略參數掃描_勝率.xlsx: 各參數組合的平均報酬與勝率（對比策略 A），
+      另可輸出 CSV / Parquet
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from position_strategy_backtest import (
+    EXPANSION_NAMES, NBER_PATH, SCRIPT_DIR, SHILLER_PATH, build_expansion_periods, build_tr_by_month, market_data,
+    month_offset,
+)
+# position_strategy_backtest 已將 repo 根目錄加入 sys.path
+from common import result_cache
+from common.exporters import export_frames
+from common.profiling import stage
+
+EXPOSURES = np.round(np.arange(0, 101, 5) / 100, 2)
+LEADS = np.arange(1, 49)
+LAGS = np.arange(0, 25)
+
+# 結果格數（週期 × 曝險 × 提前月數 × 回補延遲）低於此值時不開 process pool：預設網格約 33 萬格，
+# 單一行程幾毫秒就算完，啟動 worker 與傳回結果的成本（數十毫秒）反而高出一個數量級
+POOL_MIN_CELLS = 20_000_000
+
+CUBE_PATH = os.path.join(SCRIPT_DIR, 'output_持股策略參數掃描.npz')
+SUMMARY_BASE = os.path.join(SCRIPT_DIR, 'output_持股策略參數掃描_勝率')
+
+
+def _price_at(prices, offsets):
+    """月份索引 → 指數值（超出範圍為 NaN），支援任意形狀"""
+    offsets = np.asarray(offsets)
+    valid = (offsets >= 0) & (offsets < len(prices))
+    out = np.full(offsets.shape, np.nan)
+    out[valid] = prices[offsets[valid]]
+    return out
+
+
+def sweep_periods(expansion_periods=None, recession_ends=None):
+    """有衰退結束日期的擴張期，回傳 (名稱, 擴張開始, 衰退開始, 衰退結束) 月份索引
+
+    省略時用 position_strategy_backtest.market_data() 的擴張期
+    """
+    if expansion_periods is None:
+        data = market_data()
+        expansion_periods, recession_ends = data['expansion_periods'], data['recession_ends']
+    names, starts, rec_starts, rec_ends = [], [], [], []
+    for name, exp_start, rec_start in expansion_periods:
+        if name not in recession_ends:
+            continue
+        names.append(name)
+        starts.append(month_offset(*exp_start))
+        rec_starts.append(month_offset(*rec_start))
+        rec_ends.append(month_offset(*recession_ends[name]))
+    return names, np.array(starts), np.array(rec_starts), np.array(rec_ends)
+
+
+def evaluate_grid(prices, starts, rec_starts, rec_ends, exposures, leads, lags, horizon_lag):
+    """以陣列廣播計算整個參數網格的總報酬（%）
+
+    回傳形狀為 (週期, 曝險, 提前月數, 回補延遲) 的陣列，缺資料為 NaN
+    """
+    # 週期軸 × 提前月數軸 × 回補延遲軸，曝險軸最後再廣播
+    s = starts[:, None, None]
+    r = rec_starts[:, None, None]
+    derisk = np.maximum(r - leads[None, :, None], s)
+    reentry = rec_ends[:, None, None] + lags[None, None, :]
+    horizon = rec_ends[:, None, None] + horizon_lag
+
+    p_start = _price_at(prices, s)
+    p_derisk = _price_at(prices, derisk)
+    p_rec = _price_at(prices, r)
+    p_reentry = _price_at(prices, reentry)
+    p_horizon = _price_at(prices, horizon)
+
+    early = (p_derisk / p_start)[:, None]
+    before_rec = (p_rec / p_derisk - 1)[:, None]
+    recession = (p_reentry / p_rec - 1)[:, None]
+    late = (p_horizon / p_reentry)[:, None]
+
+    e = exposures[None, :, None, None]
+    wealth = early * (1 + e * before_rec) * (1 + e * recession) * late
+    return (wealth - 1) * 100
+
+
+def _evaluate_shard(args):
+    # 每個 worker 各自記錄一段，--profile 時可看出哪個分片落後
+    with stage('sweep_shard', rows=len(args[5])):
+        return evaluate_grid(*args)
+
+
+def run_sweep(exposures=EXPOSURES, leads=LEADS, lags=LAGS, workers=None, tr_by_month=None, periods=None):
+    """執行參數掃描；網格大時依提前月數分片後交給 process pool 平行計算
+
+    workers 省略時，結果格數未達 POOL_MIN_CELLS 就在本行程計算，否則用 CPU 核心數；
+    指定 workers > 1 時一律分片平行
+    tr_by_month / periods（sweep_periods 的回傳值）省略時用 position_strategy_backtest 讀入的資料
+    """
+    if tr_by_month is None:
+        tr_by_month = market_data()['tr_by_month']
+    names, starts, rec_starts, rec_ends = periods if periods is not None else sweep_periods()
+    exposures = np.asarray(exposures, dtype=float)
+    leads = np.asarray(leads)
+    lags = np.asarray(lags)
+    horizon_lag = int(lags.max())
+
+    if workers is None:
+        cells = len(starts) * len(exposures) * len(leads) * len(lags)
+        workers = 1 if cells < POOL_MIN_CELLS else os.cpu_count() or 1
+    shards = [chunk for chunk in np.array_split(leads, workers) if len(chunk)]
+    tasks = [(tr_by_month, starts, rec_starts, rec_ends, exposures, chunk, lags, horizon_lag)
+             for chunk in shards]
+
+    if len(tasks) == 1:
+        parts = [_evaluate_shard(tasks[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=len(tasks)) as pool:
+            parts = list(pool.map(_evaluate_shard, tasks))
+    returns = np.concatenate(parts, axis=2)
+
+    # 策略 A（全程 100%）在同一評估區間的報酬
+    baseline = (_price_at(tr_by_month, rec_ends + horizon_lag) / _price_at(tr_by_month, starts) - 1) * 100
+
+    return {
+        'names': names,
+        'exposures': exposures,
+        'leads': leads,
+        'lags': lags,
+        'returns': returns,
+        'baseline': baseline,
+    }
+
+
+def summarize(result):
+    """每個參數組合一列：平均/中位數報酬、勝過策略 A 的次數與勝率（類似分析 3）"""
+    returns = result['returns']
+    baseline = result['baseline'][:, None, None, None]
+    valid = ~np.isnan(returns) & ~np.isnan(baseline)
+
+    n_valid = valid.sum(axis=0)
+    # 容許浮點誤差：曝險 100% 的組合與策略 A 相同，不算勝
+    wins = ((returns > baseline + 1e-9) & valid).sum(axis=0)
+    with np.errstate(invalid='ignore'):
+        win_rate = wins / n_valid * 100
+        mean_ret = np.nanmean(np.where(valid, returns, np.nan), axis=0)
+        median_ret = np.nanmedian(np.where(valid, returns, np.nan), axis=0)
+
+    e, l, g = np.meshgrid(result['exposures'], result['leads'], result['lags'], indexing='ij')
+    return pd.DataFrame({
+        '曝險比例(%)': (e.ravel() * 100).round().astype(int),
+        '提前減碼(月)': l.ravel(),
+        '回補延遲(月)': g.ravel(),
+        '平均報酬(%)': mean_ret.ravel().round(2),
+        '中位數報酬(%)': median_ret.ravel().round(2),
+        '勝過A次數': wins.ravel(),
+        '有效週期數': n_valid.ravel(),
+        '勝率(%)': win_rate.ravel().round(1),
+    })
+
+
+def cached_sweep(workers=None, sp_data=None, nber_cycles=None):
+    """run_sweep，結果快取於 .cache/results
+
+    sp_data / nber_cycles 為已讀入的 Shiller 月數據與 NBER 年表（須來自 SHILLER_PATH / NBER_PATH），
+    省略時由 position_strategy_backtest 讀檔；快取命中時完全不需要資料
+    """
+    def compute():
+        tr_by_month = None if sp_data is None else build_tr_by_month(sp_data)
+        periods = None if nber_cycles is None else sweep_periods(*build_expansion_periods(nber_cycles))
+        return run_sweep(workers=workers, tr_by_month=tr_by_month, periods=periods)
+
+    # worker 數只影響速度，不放進快取鍵；週期與報酬查表來自 position_strategy_backtest
+    return result_cache.memoize(
+        'strategy_sweep', compute,
+        inputs=[SHILLER_PATH, NBER_PATH, os.path.join(SCRIPT_DIR, 'position_strategy_backtest.py')],
+        params={'exposures': EXPOSURES, 'leads': LEADS, 'lags': LAGS,
+                'expansion_names': list(EXPANSION_NAMES.items())})
+
+
+def save_sweep(result, formats=('xlsx',)):
+    """寫出結果立方體（npz）與勝率摘要，回傳 (摘要表, 輸出路徑)"""
+    np.savez_compressed(
+        CUBE_PATH,
+        names=np.array(result['names']),
+        exposures=result['exposures'],
+        leads=result['leads'],
+        lags=result['lags'],
+        returns=result['returns'],
+        baseline=result['baseline'],
+    )
+
+    with stage('sweep_summarize', rows=result['returns'][0].size):
+        summary = summarize(result)
+    # 回補延遲 = 0 時的勝率矩陣（曝險 × 提前月數）
+    pivot = summary[summary['回補延遲(月)'] == 0].pivot(
+        index='曝險比例(%)', columns='提前減碼(月)', values='勝率(%)').reset_index()
+    paths = export_frames(SUMMARY_BASE, {'參數組合': summary, '勝率_回補延遲0': pivot}, formats)
+    return summary, [CUBE_PATH, *paths]
+
+
+def run_sweep_and_save(workers=None, formats=('xlsx',)):
+    with stage('sweep_run'):
+        result = cached_sweep(workers)
+    summary, paths = save_sweep(result, formats)
+
+    n_scenarios = result['returns'][0].size
+    print(f"掃描 {n_scenarios} 組參數 × {len(result['names'])} 個週期")
+    print()
+    print("勝率最高的參數組合（對比策略 A）：")
+    top = summary.sort_values(['勝率(%)', '平均報酬(%)'], ascending=False).head(10)
+    print(top.to_string(index=False))
+    print()
+    print(f"結果立方體已儲存至: {CUBE_PATH}")
+    for path in paths[1:]:
+        print(f"勝率摘要已儲存至: {path}")
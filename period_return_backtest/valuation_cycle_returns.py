@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+CAPE 分位 × 週期階段的未來報酬分布
+
+「衰退前減碼」在估值高的時候是否比較值得？把每個月依 CAPE 分位與週期階段分組：
+- CAPE 分位：全期分位（預設），或 --expanding 只用到當月為止的歷史排名（沒有前視偏誤）
+- 週期階段：衰退、衰退前 N 個月（事後的 NBER 高峰，同分析 2）、其他擴張
+計算各組「從該月起持有 1/3/5/10 年」的年化實質總報酬分布（平均、標準差、分位數、
+負報酬機率），並比較同一估值分位內「衰退前」與「其他擴張」的差距。
+
+分組不用 groupby：分位以 digitize 切、組別編碼成整數鍵（持有期 × 分位 × 階段），
+樣本數 / 平均 / 標準差 / 負報酬比例各一次 bincount，分位數則依 (鍵, 報酬) 排序後
+直接按各組起點插值。未來報酬取自 rolling_returns 的滾動矩陣（只是索引），換分組數或
+持有期重算只要幾毫秒，--sweep-buckets 一次掃描多種分組數。
+
+注意：相鄰月份的持有區間重疊，樣本月數不是獨立樣本數。
+
+輸出:
+    - output_CAPE分位與週期報酬.xlsx: 報酬分布、減碼價值、分位區間、分組數掃描
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from position_strategy_backtest import NBER_PATH, SCRIPT_DIR, SHILLER_PATH
+# position_strategy_backtest 已將 repo 根目錄加入 sys.path
+from common.cycles import RECESSION, label_months
+from common.exporters import export_frames
+from common.loaders import load_nber_cycles, load_shiller
+from rolling_returns import MAX_HORIZON, annualize, load_rolling_returns
+
+OUTPUT_BASE = os.path.join(SCRIPT_DIR, 'output_CAPE分位與週期報酬')
+
+PHASES = ['衰退', '衰退前', '其他擴張']
+IN_RECESSION = PHASES.index('衰退')
+PRE_RECESSION = PHASES.index('衰退前')
+OTHER_EXPANSION = PHASES.index('其他擴張')
+HORIZONS = [1, 3, 5, 10]
+QUANTILES = [0.10, 0.25, 0.50, 0.75, 0.90]
+METRICS = {'cape': 'CAPE', 'tr_cape': 'TR CAPE'}
+
+
+def phase_codes(periods, cycles, lead=12):
+    """月份 → 階段編號（PHASES 的索引）：衰退 / 高峰前 lead 個月內 / 其他擴張"""
+    labels = label_months(periods, cycles)
+    pre = (labels['to_peak'] >= 1) & (labels['to_peak'] <= lead)
+    return np.where(labels['phase'] == RECESSION, IN_RECESSION, np.where(pre, PRE_RECESSION, OTHER_EXPANSION))
+
+
+def percentile_rank(values, expanding=False, min_history=120):
+    """CAPE → 排名（0, 1]：≤ 自身的比例；expanding 時只和當月為止的歷史比較
+
+    缺值、或 expanding 時歷史不足 min_history 個月為 NaN
+    """
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    rank = np.full(len(values), np.nan)
+    if not expanding:
+        ordered = np.sort(values[valid])
+        rank[valid] = np.searchsorted(ordered, values[valid], side='right') / len(ordered)
+        return rank
+    # 下三角比較矩陣：[i, j] = 第 j 月（j ≤ i）的值 ≤ 第 i 月的值；約 1,700 × 1,700
+    v = values[valid]
+    seen = np.arange(1, len(v) + 1)
+    le = np.tril(v[None, :] <= v[:, None]).sum(axis=1)
+    rank[valid] = np.where(seen >= min_history, le / seen, np.nan)
+    return rank
+
+
+def quantile_buckets(rank, n_buckets):
+    """排名 → 分位編號 0 ~ n_buckets-1（等分），NaN 為 -1"""
+    edges = np.arange(1, n_buckets) / n_buckets
+    bucket = np.digitize(rank, edges, right=True)
+    return np.where(np.isnan(rank), -1, bucket)
+
+
+def forward_returns(rolling, horizons=HORIZONS):
+    """(月份, 持有期) 年化未來報酬（%），超出資料為 NaN"""
+    months = np.asarray(horizons) * 12
+    returns = np.asarray(rolling['returns'][:, months - 1], dtype=np.float64)
+    return annualize(returns, months) * 100
+
+
+def bucket_stats(keys, n_keys, values, quantiles=QUANTILES):
+    """keys（月份，-1 為不分組）× values（月份, 持有期）→ 各統計量 (持有期, n_keys) 陣列
+
+    持有期也編進鍵裡，所有持有期一起算：每個統計量一次 bincount，分位數一次排序
+    """
+    n_horizons = values.shape[1]
+    flat_keys = (np.arange(n_horizons)[None, :] * n_keys + keys[:, None]).ravel()
+    flat_values = values.ravel()
+    ok = (np.repeat(keys, n_horizons) >= 0) & ~np.isnan(flat_values)
+    flat_keys, flat_values = flat_keys[ok], flat_values[ok]
+
+    size = n_horizons * n_keys
+    count = np.bincount(flat_keys, minlength=size)
+    total = np.bincount(flat_keys, weights=flat_values, minlength=size)
+    squares = np.bincount(flat_keys, weights=flat_values ** 2, minlength=size)
+    negative = np.bincount(flat_keys, weights=flat_values < 0, minlength=size)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        std = np.sqrt(np.maximum(squares - count * mean ** 2, 0) / (count - 1))
+        stats = {'count': count, 'mean': mean, 'std': std, 'negative': negative / count}
+
+    # 依 (鍵, 報酬) 排序後，各組是連續的一段；分位數同 np.quantile 的線性插值。
+    # 末端補一格 NaN，空組的索引落在範圍內
+    ordered = np.append(flat_values[np.lexsort((flat_values, flat_keys))], np.nan)
+    start = np.cumsum(count) - count
+    for q in quantiles:
+        pos = start + q * np.maximum(count - 1, 0)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.minimum(lo + 1, start + count - 1)
+        value = ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+        stats[q] = np.where(count > 0, value, np.nan)
+    return {k: v.reshape(n_horizons, n_keys) for k, v in stats.items()}
+
+
+def grouped_stats(bucket, phase, fwd, n_buckets, quantiles=QUANTILES):
+    """分位 × 階段的統計量，形狀 (持有期, 分位, 階段)"""
+    keys = np.where(bucket >= 0, bucket * len(PHASES) + phase, -1)
+    stats = bucket_stats(keys, n_buckets * len(PHASES), fwd, quantiles)
+    return {k: v.reshape(len(v), n_buckets, len(PHASES)) for k, v in stats.items()}
+
+
+def distribution_table(stats, horizons, quantiles=QUANTILES):
+    """長表：持有期 × 分位 × 階段 各一列"""
+    n_horizons, n_buckets, n_phases = stats['count'].shape
+    h, b, p = (a.ravel() for a in np.indices((n_horizons, n_buckets, n_phases)))
+    df = pd.DataFrame({
+        '持有(年)': np.asarray(horizons)[h],
+        'CAPE分位': [f'Q{i + 1}/{n_buckets}' for i in b],
+        '週期階段': np.asarray(PHASES)[p],
+        '樣本月數': stats['count'].ravel(),
+        '平均年化(%)': stats['mean'].ravel().round(2),
+        '標準差(%)': stats['std'].ravel().round(2),
+    })
+    for q in quantiles:
+        df[f'P{round(q * 100)}(%)'] = stats[q].ravel().round(2)
+    df['負報酬機率(%)'] = (stats['negative'].ravel() * 100).round(1)
+    return df[df['樣本月數'] > 0].reset_index(drop=True)
+
+
+def derisk_table(stats, horizons):
+    """同一估值分位內，「衰退前」相對「其他擴張」的未來報酬差（負值 = 衰退前減碼較有價值）"""
+    n_horizons, n_buckets, _ = stats['count'].shape
+    h, b = (a.ravel() for a in np.indices((n_horizons, n_buckets)))
+    pre, other = stats['mean'][..., PRE_RECESSION], stats['mean'][..., OTHER_EXPANSION]
+    pre_med, other_med = stats[0.5][..., PRE_RECESSION], stats[0.5][..., OTHER_EXPANSION]
+    return pd.DataFrame({
+        '持有(年)': np.asarray(horizons)[h],
+        'CAPE分位': [f'Q{i + 1}/{n_buckets}' for i in b],
+        '衰退前月數': stats['count'][..., PRE_RECESSION].ravel(),
+        '衰退前平均(%)': pre.ravel().round(2),
+        '其他擴張平均(%)': other.ravel().round(2),
+        '平均差(百分點)': (pre - other).ravel().round(2),
+        '中位數差(百分點)': (pre_med - other_med).ravel().round(2),
+        '衰退前負報酬機率(%)': (stats['negative'][..., PRE_RECESSION].ravel() * 100).round(1),
+    })
+
+
+def bucket_ranges(values, bucket, n_buckets):
+    """各分位的 CAPE 範圍與月數"""
+    ok = bucket >= 0
+    b, v = bucket[ok], values[ok]
+    count = np.bincount(b, minlength=n_buckets)
+    low = np.full(n_buckets, np.inf)
+    high = np.full(n_buckets, -np.inf)
+    np.minimum.at(low, b, v)
+    np.maximum.at(high, b, v)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.bincount(b, weights=v, minlength=n_buckets) / count
+    return pd.DataFrame({
+        'CAPE分位': [f'Q{i + 1}/{n_buckets}' for i in range(n_buckets)],
+        '月數': count,
+        '最低': np.where(count > 0, low, np.nan).round(2),
+        '平均': mean.round(2),
+        '最高': np.where(count > 0, high, np.nan).round(2),
+    })
+
+
+def sweep(rank, phase, fwd, horizons, bucket_counts):
+    """各種分組數：最高 / 最低估值分位的「衰退前 − 其他擴張」平均差，以及每次分組計算的耗時"""
+    rows = []
+    for n in bucket_counts:
+        t0 = time.perf_counter()
+        stats = grouped_stats(quantile_buckets(rank, n), phase, fwd, n)
+        elapsed = (time.perf_counter() - t0) * 1000
+        gap = stats['mean'][..., PRE_RECESSION] - stats['mean'][..., OTHER_EXPANSION]
+        for i, years in enumerate(horizons):
+            rows.append({
+                '分組數': n,
+                '持有(年)': years,
+                '最低分位差(百分點)': round(gap[i, 0], 2),
+                '最高分位差(百分點)': round(gap[i, -1], 2),
+                '高估值多出的減碼價值(百分點)': round(gap[i, 0] - gap[i, -1], 2),
+                '耗時(ms)': round(elapsed, 3),
+            })
+    return pd.DataFrame(rows)
+
+
+def valuation_frames(shiller, cycles, rolling, buckets=5, horizons=HORIZONS, lead=12, metric='cape',
+                     expanding=False, min_history=120, sweep_buckets=range(2, 11)):
+    """輸出的各表（dict）與單次分組計算的耗時（ms）"""
+    values = shiller[metric].to_numpy(dtype=np.float64)
+    phase = phase_codes(shiller.index, cycles, lead)
+    rank = percentile_rank(values, expanding, min_history)
+    fwd = forward_returns(rolling, horizons)
+
+    t0 = time.perf_counter()
+    bucket = quantile_buckets(rank, buckets)
+    stats = grouped_stats(bucket, phase, fwd, buckets)
+    elapsed = (time.perf_counter() - t0) * 1000
+
+    frames = {
+        '報酬分布': distribution_table(stats, horizons),
+        '減碼價值': derisk_table(stats, horizons),
+        '分位區間': bucket_ranges(values, bucket, buckets),
+        '分組數掃描': sweep(rank, phase, fwd, horizons, sweep_buckets),
+    }
+    return frames, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CAPE 分位 × 週期階段的未來報酬分布")
+    parser.add_argument('--buckets', type=int, default=5, help="CAPE 分位數（等分）")
+    parser.add_argument('--horizons', type=int, nargs='+', default=HORIZONS, help="持有年數")
+    parser.add_argument('--lead', type=int, default=12, help="「衰退前」= NBER 高峰前幾個月內")
+    parser.add_argument('--metric', choices=sorted(METRICS), default='cape', help="估值指標")
+    parser.add_argument('--expanding', action='store_true', help="分位只用當月為止的歷史排名（無前視）")
+    parser.add_argument('--min-history', type=int, default=120, help="--expanding 時至少需要的歷史月數")
+    parser.add_argument('--sweep-buckets', type=int, nargs='+', default=list(range(2, 11)),
+                        help="分組數掃描")
+    parser.add_argument('--formats', nargs='+', choices=['xlsx', 'csv', 'parquet'], default=['xlsx'],
+                        help="輸出格式")
+    args = parser.parse_args()
+    if max(args.horizons) * 12 > MAX_HORIZON or min(args.horizons) < 1:
+        parser.error(f"持有年數需介於 1 ~ {MAX_HORIZON // 12}")
+
+    frames, elapsed = valuation_frames(
+        load_shiller(SHILLER_PATH), load_nber_cycles(NBER_PATH), load_rolling_returns(SHILLER_PATH),
+        args.buckets, args.horizons, args.lead, args.metric, args.expanding, args.min_history, args.sweep_buckets)
+    derisk, sweep_table = frames['減碼價值'], frames['分組數掃描']
+
+    mode = '擴張視窗排名' if args.expanding else '全期分位'
+    print(f"{METRICS[args.metric]} {args.buckets} 分位（{mode}）× 週期階段（衰退前 = 高峰前 {args.lead} 個月）"
+          f"，分組計算 {elapsed:.2f} ms")
+    print(derisk.to_string(index=False))
+    print()
+    print(f"分組數掃描：{len(args.sweep_buckets)} 種 × {len(args.horizons)} 個持有期，"
+          f"合計 {sweep_table.drop_duplicates('分組數')['耗時(ms)'].sum():.1f} ms")
+    print(sweep_table.to_string(index=False))
+
+    paths = export_frames(OUTPUT_BASE, frames, args.formats)
+    print()
+    for path in paths:
+        print(f"已儲存至: {path}")
+
+
+if __name__ == '__main__':
+    main()
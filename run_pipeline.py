@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+分析管線：一次產出兩個專案的主要輸出
+
+各腳本原本獨立執行、各自讀檔；這裡把它們的步驟宣告成 DAG（common/pipeline.py），
+讀檔只做一次、結果在記憶體中共用（各模組 import 時不讀檔，資料由讀檔階段傳入），
+互不相依的階段同時執行：
+
+    load_shiller ─┬─ label_cycles ─────────── export_cycles
+    load_nber ────┼─ valuation_returns ────── export_valuation
+    load_rolling ─┼─ rolling_stats ────────── export_rolling
+                  ├─ strategy_sweep ───────── export_sweep
+    load_prices ──┼─ bear_detection ───────── export_bear
+                  ├─ daily_strategies ─────── export_daily
+                  └─ ladder_search ────────── export_ladder
+
+（label_cycles、strategy_sweep、daily_strategies 用 Shiller 與 NBER；valuation_returns 另用滾動報酬矩陣，
+rolling_stats 用 NBER 與滾動報酬矩陣；ladder_search 用 Shiller 的 GS10 當現金利率、D / P 當股息）
+
+輸出階段的指紋涵蓋輸入檔、相關程式檔（含 common/*.py）與參數（含 --formats），都沒變且輸出檔還在時略過，
+只有需要重跑的輸出階段會帶動它的上游。策略掃描、熊市偵測、階梯搜尋等沿用各腳本的
+.cache/results 快取，與單獨執行腳本共用。
+
+用法:
+    python run_pipeline.py                          # 全部輸出（已是最新的略過）
+    python run_pipeline.py --stages export_bear export_ladder
+    python run_pipeline.py --force --workers 4 --formats xlsx csv
+    python run_pipeline.py --list
+"""
+
+import argparse
+import os
+import sys
+
+import pandas as pd
+
+# 取得腳本所在目錄；分析腳本以同層 import 互相引用，兩個資料夾都加入 sys.path
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+PERIOD_DIR = os.path.join(REPO_ROOT, 'period_return_backtest')
+BEAR_DIR = os.path.join(REPO_ROOT, 'bear_market_analysis')
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, PERIOD_DIR)
+sys.path.insert(0, BEAR_DIR)
+
+import bear_market_detector
+import daily_simulator
+import drawdown_ladder
+import economic_cycle_to_excel
+from common import profiling, result_cache
+from common.exporters import export_frames
+from common.loaders import load_nber_cycles, load_shiller
+from common.pipeline import RAN, load_state, pipeline_stage, plan, run, topological_order
+
+# period_return_backtest 的其他模組到階段內才 import，--list 不必載入
+ROLLING_OUTPUT = os.path.join(PERIOD_DIR, 'output_衰退前報酬百分位')
+PRICE_SOURCE = 'yahoo'
+PRICE_PATH = os.path.join(BEAR_DIR, bear_market_detector.SOURCES[PRICE_SOURCE])
+SHILLER_PATH = economic_cycle_to_excel.SHILLER_PATH
+NBER_PATH = economic_cycle_to_excel.NBER_PATH
+
+
+def _code(folder, *names):
+    return [os.path.join(folder, f'{name}.py') for name in names]
+
+
+def _load_rolling():
+    from rolling_returns import load_rolling_returns
+    return load_rolling_returns(SHILLER_PATH)
+
+
+def _rolling_stats(nber_cycles, rolling):
+    from position_strategy_backtest import build_expansion_periods
+    from rolling_returns import pre_recession_percentiles
+    return pre_recession_percentiles(rolling, build_expansion_periods(nber_cycles)[0])
+
+
+def _strategy_sweep(sp_data, nber_cycles):
+    from strategy_sweep import cached_sweep
+    # 已在管線的 thread pool 裡，掃描改在本執行緒計算，不再從 thread 內 fork 出 process pool
+    return cached_sweep(workers=1, sp_data=sp_data, nber_cycles=nber_cycles)
+
+
+def _valuation_returns(sp_data, nber_cycles, rolling):
+    from valuation_cycle_returns import valuation_frames
+    return valuation_frames(sp_data, nber_cycles, rolling)[0]
+
+
+def _export_valuation(frames, formats):
+    from valuation_cycle_returns import OUTPUT_BASE
+    return export_frames(OUTPUT_BASE, frames, formats)
+
+
+def _label_cycles(sp_data, nber_cycles):
+    yearly = economic_cycle_to_excel.yearly_returns(sp_data)
+    cycles = economic_cycle_to_excel.cached_cycles(nber_cycles, int(yearly.index[-1]))
+    return economic_cycle_to_excel.cached_rows(cycles, yearly)
+
+
+def _export_cycles(rows):
+    economic_cycle_to_excel.write_output(rows)
+    return [economic_cycle_to_excel.OUTPUT_PATH]
+
+
+def _ladder_search(prices, sp_data):
+    cash_rate = daily_simulator.daily_cash_rate(prices.index, sp_data)
+    dividend_yield = daily_simulator.daily_dividend_yield(prices.index, sp_data)
+    market = drawdown_ladder.prepare_market(prices.to_numpy(), prices.index, cash_rate, dividend_yield)
+    years = (prices.index[-1] - prices.index[0]).days / 365.25
+    _, stage_log, front, _ = drawdown_ladder.cached_search(market, drawdown_ladder.grid_configs(), years,
+                                                        PRICE_SOURCE)
+    return {'報告建議': drawdown_ladder.report_frame(market, years), drawdown_ladder.FRONT_SHEET: front,
+            '搜尋紀錄': stage_log}
+
+
+def _export_sweep(result, formats):
+    from strategy_sweep import save_sweep
+    return save_sweep(result, formats)[1]
+
+
+def build_stages(formats=('xlsx',)):
+    """階段定義；formats 放進輸出階段的參數，換格式時會重新輸出
+
+    每個階段的 inputs 另外加上本檔與 common/*.py（共用的讀檔、週期標記、輸出函式），
+    改到共用模組時所有階段都會重新執行。
+    """
+    out = {'formats': list(formats)}
+    stages = {
+        # 讀檔
+        'load_shiller': pipeline_stage(lambda: load_shiller(SHILLER_PATH), inputs=[SHILLER_PATH]),
+        'load_nber': pipeline_stage(lambda: load_nber_cycles(NBER_PATH), inputs=[NBER_PATH]),
+        'load_prices': pipeline_stage(lambda: bear_market_detector.load_daily_prices(PRICE_SOURCE),
+                                      inputs=[PRICE_PATH]),
+        'load_rolling': pipeline_stage(_load_rolling, inputs=[SHILLER_PATH, *_code(PERIOD_DIR, 'rolling_returns')]),
+        # 分析
+        'label_cycles': pipeline_stage(_label_cycles, deps=['load_shiller', 'load_nber'],
+                                       inputs=_code(PERIOD_DIR, 'economic_cycle_to_excel')),
+        'valuation_returns': pipeline_stage(_valuation_returns, deps=['load_shiller', 'load_nber', 'load_rolling'],
+                                            inputs=_code(PERIOD_DIR, 'valuation_cycle_returns', 'rolling_returns',
+                                                         'position_strategy_backtest')),
+        'rolling_stats': pipeline_stage(_rolling_stats, deps=['load_nber', 'load_rolling'], inputs=_code(
+            PERIOD_DIR, 'rolling_returns', 'position_strategy_backtest')),
+        'bear_detection': pipeline_stage(
+            lambda prices: bear_market_detector.episodes_to_frame(
+                prices, bear_market_detector.cached_episodes(prices, PRICE_SOURCE)),
+            deps=['load_prices'], inputs=_code(BEAR_DIR, 'bear_market_detector')),
+        'daily_strategies': pipeline_stage(
+            lambda prices, sp_data, nber_cycles: daily_simulator.strategy_table(
+                prices, shiller=sp_data, cycles=nber_cycles),
+            deps=['load_prices', 'load_shiller', 'load_nber'],
+            inputs=_code(BEAR_DIR, 'daily_simulator', 'bear_market_detector')),
+        'ladder_search': pipeline_stage(_ladder_search, deps=['load_prices', 'load_shiller'],
+                                        inputs=_code(BEAR_DIR, 'drawdown_ladder', 'bear_market_detector',
+                                                     'daily_simulator')),
+        'strategy_sweep': pipeline_stage(_strategy_sweep, deps=['load_shiller', 'load_nber'], inputs=_code(
+            PERIOD_DIR, 'strategy_sweep', 'position_strategy_backtest')),
+        # 輸出
+        'export_cycles': pipeline_stage(_export_cycles, deps=['label_cycles'], outputs=True),
+        'export_valuation': pipeline_stage(lambda frames: _export_valuation(frames, formats),
+                                           deps=['valuation_returns'], params=out, outputs=True),
+        'export_rolling': pipeline_stage(
+            lambda table: export_frames(ROLLING_OUTPUT, {'衰退前報酬百分位': table}, formats),
+            deps=['rolling_stats'], params=out, outputs=True),
+        'export_bear': pipeline_stage(
+            lambda table: export_frames(bear_market_detector.OUTPUT_BASE, {'Sheet1': table}, formats),
+            deps=['bear_detection'], params=out, outputs=True),
+        'export_daily': pipeline_stage(
+            lambda table: export_frames(daily_simulator.OUTPUT_BASE, {'策略比較': table}, formats),
+            deps=['daily_strategies'], params=out, outputs=True),
+        'export_ladder': pipeline_stage(
+            lambda frames: export_frames(drawdown_ladder.OUTPUT_BASE, frames, formats),
+            deps=['ladder_search'], params=out, outputs=True),
+        'export_sweep': pipeline_stage(lambda result: _export_sweep(result, formats), deps=['strategy_sweep'],
+                                       params=out, outputs=True),
+    }
+    shared = result_cache.code_files(build_stages)
+    for spec in stages.values():
+        spec['inputs'] += tuple(p for p in shared if p not in spec['inputs'])
+    return stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分析管線：以 DAG 平行執行各分析並輸出")
+    parser.add_argument('--stages', nargs='+', metavar='STAGE',
+                        help="要產出的階段（連同上游；預設為所有輸出階段），--list 可列出全部")
+    parser.add_argument('--workers', type=int, default=None, help="同時執行的階段數（預設為 CPU 核心數）")
+    parser.add_argument('--force', action='store_true', help="不略過已是最新的輸出階段")
+    parser.add_argument('--list', action='store_true', help="列出各階段、上游與目前狀態後結束")
+    parser.add_argument('--no-cache', action='store_true', help="不使用 .cache/results 的分析結果快取")
+    parser.add_argument('--profile', action='store_true',
+                        help="記錄各階段耗時與記憶體，輸出 Chrome trace 到 .cache/profile/（每個 thread 一條泳道）")
+    parser.add_argument('--formats', nargs='+', choices=['xlsx', 'csv', 'parquet'], default=['xlsx'],
+                        help="輸出格式（經濟週期報酬率固定為 xlsx）")
+    args = parser.parse_args()
+
+    stages = build_stages(args.formats)
+    unknown = [name for name in args.stages or [] if name not in stages]
+    if unknown:
+        parser.error(f"沒有這個階段：{', '.join(unknown)}（可用：{', '.join(stages)}）")
+
+    if args.list:
+        order, skipped, _ = plan(stages, args.stages, load_state(), args.force)
+        names = topological_order(stages)
+        print(pd.DataFrame({
+            '階段': names,
+            '上游': [', '.join(stages[n]['deps']) for n in names],
+            '狀態': [skipped.get(n, RAN if n in order else '未選取') for n in names],
+        }).to_string(index=False))
+        return
+
+    if args.profile:
+        profiling.enable()
+    if args.no_cache:
+        result_cache.disable()
+
+    def on_done(record):
+        print(f"完成 {record['階段']}（{record['耗時(秒)']:.2f} 秒）", flush=True)
+
+    records = run(stages, args.stages, args.workers, args.force, on_done=on_done)
+    print()
+    print(pd.DataFrame(records).drop(columns='輸出').fillna('').to_string(index=False))
+    print()
+    for record in records:
+        for path in record['輸出']:
+            print(f"已儲存至: {path}")
+
+    if args.profile:
+        profiling.report(profiling.trace_path('run_pipeline'))
+
+
+if __name__ == '__main__':
+    main()